@@ -6,44 +6,110 @@ using configurations from the central `config.py` file.
 """
 
 import os
+import pickle
+from typing import Optional
+
 from dotenv import load_dotenv
 from langchain_huggingface import (
-    HuggingFaceEmbeddings,
     HuggingFaceEndpoint,
     ChatHuggingFace,
 )
 from langchain.embeddings.base import Embeddings
 from langchain.llms.base import LLM
+from langchain_community.vectorstores import FAISS
 
 import config
+from embedding_cache import CachedEmbeddings
+from embedding_engine import EmbeddingEngine
+from llm_client import ManagedChatModel
+from onnx_embeddings import OnnxEmbeddingEngine
+from sqlite_docstore import SERVING_DOCSTORE_FILE, RowMapping, SQLiteDocstore
+from vector_index import read_serving_index
+from vector_shards import read_sharded_index
 
 # Load environment variables from .env file
 load_dotenv(override=True)
 
-def load_embedding_model() -> Embeddings:
+def load_embedding_model(use_cache: bool = config.EMBEDDING_CACHE_ENABLED) -> Embeddings:
     """
     Loads the sentence-transformer model for creating text embeddings.
 
-    The model configuration is sourced from the `config.py` file.
+    The model configuration is sourced from the `config.py` file. Texts are encoded
+    in length-sorted batches, across `config.EMBEDDING_WORKERS` processes for large
+    calls (see `embedding_engine`), or with the int8 ONNX export when
+    `config.EMBEDDING_BACKEND` is "onnx" (see `onnx_embeddings`).
+
+    Args:
+        use_cache (bool): Whether to wrap the model in the on-disk embedding cache.
 
     Returns:
-        Embeddings: An instance of the HuggingFaceEmbeddings class.
+        Embeddings: An instance of the EmbeddingEngine class (or OnnxEmbeddingEngine),
+        wrapped in CachedEmbeddings when caching is enabled.
     """
-    return HuggingFaceEmbeddings(
-        model_name=config.EMBEDDING_MODEL_NAME,
-        model_kwargs=config.EMBEDDING_MODEL_KWARGS,
-        encode_kwargs=config.EMBEDDING_ENCODE_KWARGS,
-    )
+    if config.EMBEDDING_BACKEND == "onnx":
+        embedding_model = OnnxEmbeddingEngine(
+            model_dir=config.ONNX_EMBEDDING_DIR,
+            encode_kwargs=config.EMBEDDING_ENCODE_KWARGS,
+        )
+    else:
+        embedding_model = EmbeddingEngine(
+            model_name=config.EMBEDDING_MODEL_NAME,
+            model_kwargs=config.EMBEDDING_MODEL_KWARGS,
+            encode_kwargs=config.EMBEDDING_ENCODE_KWARGS,
+        )
+    if not use_cache:
+        return embedding_model
+
+    normalize = config.EMBEDDING_ENCODE_KWARGS.get("normalize_embeddings", False)
+    namespace = f"{config.EMBEDDING_MODEL_NAME}|normalize={normalize}"
+    if config.EMBEDDING_BACKEND == "onnx":
+        # The quantized model's vectors differ slightly; keep them apart.
+        namespace += f"|onnx={config.ONNX_EMBEDDING_FILE}"
+    return CachedEmbeddings(embedding_model, namespace=namespace)
+
+def load_vector_store(embedding_model: Optional[Embeddings] = None) -> FAISS:
+    """
+    Loads the FAISS vector store built by `Setting_Up_Vector_Store.py`.
+
+    Queries are answered by the index type configured in `config.FAISS_INDEX_FACTORY`
+    when one has been built, searched as one shard per source with
+    `config.VECTOR_SHARDS`, and by the exact flat index otherwise. The index is
+    memory-mapped and, with the default "sqlite" `config.DOCSTORE_FORMAT`, chunk text
+    is read from `chunks.sqlite` only for the hits of each query.
+
+    Args:
+        embedding_model (Optional[Embeddings]): The model used to embed queries.
+            Loaded with `load_embedding_model()` if not given.
+
+    Returns:
+        FAISS: The vector store.
+    """
+    if embedding_model is None:
+        embedding_model = load_embedding_model()
+
+    index = read_sharded_index(config.DB_FAISS_PATH) if config.VECTOR_SHARDS else None
+    if index is None:
+        index = read_serving_index(config.DB_FAISS_PATH)
+    if config.DOCSTORE_FORMAT == "sqlite":
+        docstore = SQLiteDocstore(os.path.join(config.DB_FAISS_PATH, SERVING_DOCSTORE_FILE))
+        return FAISS(embedding_model, index, docstore, RowMapping(index.ntotal))
+
+    # The docstore pickle is written by our own setup script.
+    with open(os.path.join(config.DB_FAISS_PATH, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(embedding_model, index, docstore, index_to_docstore_id)
 
 def load_llm() -> LLM:
     """
     Loads the large language model (LLM) from the Hugging Face Hub.
 
     The model repository ID and endpoint parameters are sourced from `config.py`.
-    Requires an HF_TOKEN environment variable for authentication.
+    Requires an HF_TOKEN environment variable for authentication. Requests time out
+    after `config.LLM_TIMEOUT_SECONDS` and go through the process-wide concurrency
+    limit and retry policy of `llm_client.ManagedChatModel`.
 
     Returns:
-        LLM: An instance of the ChatHuggingFace class.
+        LLM: A ChatHuggingFace model wrapped in a ManagedChatModel.
     """
     # Ensure the Hugging Face token is available
     if "HF_TOKEN" not in os.environ:
@@ -51,8 +117,10 @@ def load_llm() -> LLM:
 
     # Set up the LLM endpoint
     llm_endpoint = HuggingFaceEndpoint(
-        repo_id=config.LLM_REPO_ID, **config.LLM_ENDPOINT_PARAMS
+        repo_id=config.LLM_REPO_ID,
+        timeout=config.LLM_TIMEOUT_SECONDS,
+        **config.LLM_ENDPOINT_PARAMS,
     )
 
-    # Wrap the endpoint in a chat model interface
-    return ChatHuggingFace(llm=llm_endpoint)
+    # Wrap the endpoint in a chat model interface, with the shared request limits
+    return ManagedChatModel(model=ChatHuggingFace(llm=llm_endpoint))
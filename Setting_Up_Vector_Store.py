@@ -2,63 +2,116 @@
 This script builds and saves a FAISS vector store from documents in the data directory.
 
 It performs the following steps:
-1. Loads documents from the specified data directory.
-2. Splits the documents into optimized text chunks.
-3. Creates vector embeddings for the chunks using a sentence-transformer model.
-4. Saves the resulting FAISS vector store to the local filesystem.
+1. Compares the files in the data directory with the manifest of the existing store.
+2. Loads only the documents that were added or changed since the last build,
+   parsing PDFs in parallel across a process pool and stripping repeated page
+   headers and footers.
+3. Splits the documents into optimized text chunks as the pages stream in, and
+   drops chunks that are near-duplicates of chunks already in the store.
+4. Creates vector embeddings for the new chunks in fixed-size batches using a
+   sentence-transformer model, and removes the vectors of changed or deleted files.
+5. Saves the resulting FAISS vector store and its manifest to the local filesystem.
+6. Builds the index type configured in `config.FAISS_INDEX_FACTORY` from the exact
+   index and reports its recall, latency and size against exact search.
+7. Writes chunk text and metadata to `chunks.sqlite`, which the chat applications
+   read lazily next to a memory-mapped index instead of unpickling the docstore.
+8. Builds a BM25 keyword index over the same chunks for hybrid retrieval.
+
+Progress is checkpointed periodically, so an interrupted build resumes where it
+stopped the next time the script runs.
 
 The script is designed to be run as a standalone process to set up the knowledge base
-for the FinanceGPT application.
+for the FinanceGPT application. Pass `--full` to ignore the manifest and rebuild the
+whole store from scratch.
 """
 
-from typing import List
+import argparse
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
 
 from langchain.docstore.document import Document
-from langchain_community.document_loaders import (
-    PyPDFLoader,
-    TextLoader,
-    DirectoryLoader,
-)
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.document_loaders import TextLoader
 from langchain_community.vectorstores import FAISS
+from langchain.embeddings.base import Embeddings
 
 import config
+import knowledge_base_manifest as kb_manifest
+from embedding_cache import CachedEmbeddings
+from embedding_engine import EmbeddingEngine
+from ingestion_pipeline import (
+    clear_checkpoint,
+    ingest_sources,
+    iter_chunks,
+    load_checkpoint,
+)
+from metadata_index import METADATA_INDEX_DIR, build_metadata_index
+from near_duplicates import (
+    NEAR_DUPLICATE_INDEX_FILE,
+    NearDuplicateIndex,
+    apply_provenance,
+    load_near_duplicate_index,
+)
+from page_cleaning import clean_pages
+from pdf_loading import load_pdf_files
 from Resources import load_embedding_model
+from sparse_index import SPARSE_INDEX_DIR, build_sparse_index
+from sqlite_docstore import SERVING_DOCSTORE_FILE, iter_faiss_documents, write_sqlite_docstore
+from vector_index import (
+    build_and_save_serving_index,
+    compare_indexes,
+    print_index_report,
+    read_vectors,
+    serving_index_is_current,
+)
+from vector_shards import build_shards, shards_are_current
 
-def load_documents(data_path: str) -> List[Document]:
+def load_documents(
+    data_path: str,
+    sources: Optional[Iterable[str]] = None,
+    max_workers: Optional[int] = config.PDF_LOADER_WORKERS,
+) -> List[Document]:
     """
     Loads all supported documents (PDF and TXT) from the specified directory.
 
+    PDFs are parsed in parallel across a process pool (see `pdf_loading`), and their
+    repeated headers and footers are stripped (see `page_cleaning`).
+
     Args:
         data_path (str): The path to the directory containing the documents.
+        sources (Optional[Iterable[str]]): If given, only these files are loaded.
+        max_workers (Optional[int]): Processes used to parse PDFs; None uses every
+            CPU core and 1 parses sequentially.
 
     Returns:
         List[Document]: A list of loaded documents.
     """
-    print(f"Loading documents from: {data_path}")
+    if sources is None:
+        print(f"Loading documents from: {data_path}")
+        sources = kb_manifest.list_sources(data_path)
+    sources = list(sources)
     documents = []
 
     # Load PDF files
-    try:
-        pdf_loader = DirectoryLoader(
-            data_path, glob="*.pdf", loader_cls=PyPDFLoader, show_progress=True
-        )
-        pdf_docs = pdf_loader.load()
-        documents.extend(pdf_docs)
-        print(f"Successfully loaded {len(pdf_docs)} PDF pages.")
-    except Exception as e:
-        print(f"Could not load PDFs: {e}")
+    pdf_sources = [source for source in sources if source.lower().endswith(".pdf")]
+    if pdf_sources:
+        try:
+            pdf_docs = load_pdf_files(pdf_sources, max_workers=max_workers)
+            if config.PAGE_CLEANING:
+                pdf_docs = list(clean_pages(pdf_docs))
+            documents.extend(pdf_docs)
+            print(f"Successfully loaded {len(pdf_docs)} PDF pages.")
+        except Exception as e:
+            print(f"Could not load PDFs: {e}")
 
     # Load text files
-    try:
-        txt_loader = DirectoryLoader(
-            data_path, glob="*.txt", loader_cls=TextLoader, show_progress=True
-        )
-        txt_docs = txt_loader.load()
-        documents.extend(txt_docs)
-        print(f"Successfully loaded {len(txt_docs)} text documents.")
-    except Exception as e:
-        print(f"Could not load text files: {e}")
+    txt_sources = [source for source in sources if source.lower().endswith(".txt")]
+    if txt_sources:
+        try:
+            txt_docs = [doc for source in txt_sources for doc in TextLoader(source).load()]
+            documents.extend(txt_docs)
+            print(f"Successfully loaded {len(txt_docs)} text documents.")
+        except Exception as e:
+            print(f"Could not load text files: {e}")
 
     print(f"Total documents loaded: {len(documents)}")
     return documents
@@ -75,55 +128,236 @@ def create_text_chunks(docs: List[Document]) -> List[Document]:
         List[Document]: A list of text chunks.
     """
     print("Splitting documents into text chunks...")
-    text_splitter = RecursiveCharacterTextSplitter(
-        **config.TEXT_SPLITTER_PARAMS,
-        length_function=len,
-        separators=["\n\n", "\n", " ", ""],
-    )
-    chunks = text_splitter.split_documents(docs)
+    chunks = list(iter_chunks(docs))
     print(f"Created {len(chunks)} text chunks.")
     return chunks
 
 
-def build_and_save_vector_store(chunks: List[Document]):
+def build_and_save_vector_store(
+    sources: Dict[str, str],
+    plan: kb_manifest.UpdatePlan,
+    manifest: Dict,
+    embedding_model: Embeddings,
+    db: Optional[FAISS] = None,
+    max_workers: Optional[int] = config.PDF_LOADER_WORKERS,
+    dedup: Optional[NearDuplicateIndex] = None,
+) -> Tuple[Optional[FAISS], int]:
     """
-    Builds a FAISS vector store from the text chunks and saves it locally.
+    Streams the planned files into the FAISS vector store and saves it locally.
+
+    Chunks are embedded and added in batches of `config.EMBEDDING_BATCH_SIZE`, and the
+    partial store is checkpointed every `config.CHECKPOINT_EVERY_BATCHES` batches.
 
     Args:
-        chunks (List[Document]): The list of text chunks to embed.
-    """
-    print("Loading embedding model...")
-    embedding_model = load_embedding_model()
+        sources (Dict[str, str]): Source paths mapped to content hashes.
+        plan (kb_manifest.UpdatePlan): The files to embed.
+        manifest (Dict): The manifest describing `db`; updated in place.
+        embedding_model (Embeddings): The embedding model to use.
+        db (Optional[FAISS]): An existing store to add the chunks to.
+        max_workers (Optional[int]): Processes used to parse PDFs.
+        dedup (Optional[NearDuplicateIndex]): The signatures of the chunks in `db`,
+            used to drop near-duplicates; saved next to the store.
 
-    print("Creating embeddings and building FAISS vector store...")
-    db = FAISS.from_documents(chunks, embedding_model)
+    Returns:
+        Tuple[Optional[FAISS], int]: The saved vector store (None if nothing was
+        embedded into an empty store) and the number of chunks added.
+    """
+    print(f"Embedding {len(plan.to_embed)} files in batches of {config.EMBEDDING_BATCH_SIZE}...")
+    db, added = ingest_sources(
+        sources, plan.to_embed, manifest, embedding_model, db, max_workers=max_workers, dedup=dedup
+    )
+    if db is None:
+        return None, 0
 
     print(f"Saving vector store to: {config.DB_FAISS_PATH}")
+    if dedup is not None:
+        apply_provenance(db, manifest)
     db.save_local(config.DB_FAISS_PATH)
+    if dedup is not None:
+        dedup.save(os.path.join(config.DB_FAISS_PATH, NEAR_DUPLICATE_INDEX_FILE))
+    manifest["settings"] = kb_manifest.current_build_settings()
+    kb_manifest.save_manifest(manifest)
+    clear_checkpoint()
     print("Vector store saved successfully.")
 
-def main():
+    if isinstance(embedding_model, CachedEmbeddings):
+        embedding_model.flush()
+        stats = embedding_model.stats()
+        print(
+            f"Embedding cache: {stats['hits']} hits, {stats['misses']} misses "
+            f"({stats['hit_rate']:.0%} hit rate), {stats['entries']} entries, "
+            f"{stats['size_mb']:.1f} MB."
+        )
+    engine = embedding_model.embeddings if isinstance(embedding_model, CachedEmbeddings) else embedding_model
+    if isinstance(engine, EmbeddingEngine):
+        engine.report()
+    return db, added
+
+
+def load_existing_vector_store(embedding_model: Embeddings) -> Optional[FAISS]:
+    """
+    Loads the previously built vector store, if there is one.
+
+    Args:
+        embedding_model (Embeddings): The embedding model used by the store.
+
+    Returns:
+        Optional[FAISS]: The stored vector store, or None if it cannot be loaded.
+    """
+    index_files = [os.path.join(config.DB_FAISS_PATH, name) for name in ("index.faiss", "index.pkl")]
+    if not all(os.path.exists(path) for path in index_files):
+        return None
+    try:
+        return FAISS.load_local(
+            config.DB_FAISS_PATH,
+            embedding_model,
+            allow_dangerous_deserialization=True,
+        )
+    except Exception as e:
+        print(f"Could not load existing vector store: {e}")
+        return None
+
+
+def update_serving_files(db: FAISS, rebuilt: bool, compare: bool = False):
+    """
+    Writes the files the chat applications load: the configured serving index, or
+    one shard of it per source with `config.VECTOR_SHARDS`, the SQLite docstore, the
+    BM25 keyword index and the metadata index used to filter searches.
+
+    Args:
+        db (FAISS): The exact vector store maintained by this script.
+        rebuilt (bool): Whether the store changed in this run.
+        compare (bool): Whether to report every candidate index type.
+    """
+    if config.VECTOR_SHARDS:
+        if rebuilt or not shards_are_current(db.index.ntotal):
+            build_shards(db)
+    elif rebuilt or not serving_index_is_current(db.index.ntotal):
+        build_and_save_serving_index(db.index)
+
+    docstore_path = os.path.join(config.DB_FAISS_PATH, SERVING_DOCSTORE_FILE)
+    if rebuilt or not os.path.exists(docstore_path):
+        print(f"Writing serving docstore to: {docstore_path}")
+        write_sqlite_docstore(iter_faiss_documents(db), docstore_path)
+
+    sparse_path = os.path.join(config.DB_FAISS_PATH, SPARSE_INDEX_DIR)
+    if rebuilt or not os.path.exists(sparse_path):
+        print(f"Building BM25 keyword index at: {sparse_path}")
+        build_sparse_index(iter_faiss_documents(db), sparse_path)
+
+    metadata_path = os.path.join(config.DB_FAISS_PATH, METADATA_INDEX_DIR)
+    if rebuilt or not os.path.exists(metadata_path):
+        print(f"Building metadata index at: {metadata_path}")
+        build_metadata_index(iter_faiss_documents(db), metadata_path)
+
+    if compare:
+        print_index_report(compare_indexes(read_vectors(db.index), config.FAISS_INDEX_CANDIDATES, db.index))
+
+
+def main(argv: Optional[List[str]] = None):
     """
     Main function to run the vector store setup process.
+
+    Args:
+        argv (Optional[List[str]]): Command line arguments, defaults to `sys.argv`.
     """
+    parser = argparse.ArgumentParser(description="Build the FinanceGPT knowledge base.")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Ignore the manifest and rebuild the vector store from scratch.",
+    )
+    parser.add_argument(
+        "--compare-indexes",
+        action="store_true",
+        help="Print recall, latency and size of every index type in config.FAISS_INDEX_CANDIDATES.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=config.PDF_LOADER_WORKERS,
+        help="Number of processes used to parse PDFs (default: one per CPU core).",
+    )
+    args = parser.parse_args(argv)
+
     print("--- Starting Knowledge Base Setup ---")
 
-    # Step 1: Load documents
-    documents = load_documents(config.DATA_PATH)
+    # Step 1: Work out which files changed since the last build
+    sources = kb_manifest.scan_sources(config.DATA_PATH)
 
-    if not documents:
-        print("No documents were loaded. Aborting setup.")
+    print("Loading embedding model...")
+    embedding_model = load_embedding_model()
+
+    db = None
+    checkpoint = None if args.full else load_checkpoint(embedding_model)
+    if checkpoint is not None:
+        print("Resuming interrupted build from checkpoint.")
+        db, manifest = checkpoint
+    elif args.full:
+        print("Full rebuild requested.")
+        clear_checkpoint()
+    else:
+        manifest = kb_manifest.load_manifest()
+        if not kb_manifest.is_compatible(manifest):
+            print("Embedding or splitting settings changed since the last build; rebuilding everything.")
+        else:
+            db = load_existing_vector_store(embedding_model)
+            if db is None and manifest["files"]:
+                print("Existing vector store not found; rebuilding everything.")
+
+    if db is None:
+        manifest = kb_manifest.empty_manifest()
+
+    dedup = None
+    if config.NEAR_DUPLICATE_FILTER and db is None:
+        # Rebuilding from scratch; the signatures on disk describe the old store.
+        dedup = NearDuplicateIndex()
+    elif config.NEAR_DUPLICATE_FILTER:
+        dedup_dir = config.CHECKPOINT_PATH if checkpoint is not None else config.DB_FAISS_PATH
+        dedup = load_near_duplicate_index(os.path.join(dedup_dir, NEAR_DUPLICATE_INDEX_FILE), db)
+
+    plan = kb_manifest.plan_update(manifest, sources)
+    print(
+        f"Added: {len(plan.added)}, changed: {len(plan.changed)}, "
+        f"resumed: {len(plan.resumed)}, removed: {len(plan.removed)}, "
+        f"unchanged: {len(plan.unchanged)}"
+    )
+
+    if db is not None and plan.is_empty() and checkpoint is None:
+        update_serving_files(db, rebuilt=False, compare=args.compare_indexes)
+        print("--- Knowledge base is already up to date ---")
         return
 
-    # Step 2: Create text chunks
-    text_chunks = create_text_chunks(documents)
+    # Step 2: Remove the vectors of changed or deleted files
+    if db is not None:
+        stale_ids = [
+            chunk_id
+            for source in plan.to_delete
+            for chunk_id in manifest["files"][source]["chunk_ids"]
+        ]
+        if stale_ids:
+            print(f"Removing {len(stale_ids)} stale chunks...")
+            db.delete(stale_ids)
+            if dedup is not None:
+                dedup.remove(stale_ids)
+        for source in plan.to_delete:
+            del manifest["files"][source]
+
+    # Step 3: Load, split, embed and add the new or changed documents in batches
+    db, chunks_added = build_and_save_vector_store(
+        sources, plan, manifest, embedding_model, db, max_workers=args.workers, dedup=dedup
+    )
+
+    if db is None:
+        print("No documents were loaded. Aborting setup.")
+        return
 
-    # Step 3: Build and save the vector store
-    build_and_save_vector_store(text_chunks)
+    # Step 4: Build the serving index and docstore used by the chat applications
+    update_serving_files(db, rebuilt=True, compare=args.compare_indexes)
 
     print("--- Knowledge Base Setup Complete ---")
     print("\n🎉 Comprehensive finance knowledge base created successfully!")
-    print(f"Total chunks embedded: {len(text_chunks)}")
+    print(f"Total chunks embedded: {chunks_added}")
     print(f"Vector store saved at: {config.DB_FAISS_PATH}")
 
 
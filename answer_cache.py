@@ -0,0 +1,286 @@
+"""
+This module caches LLM answers so near-duplicate questions skip the LLM call.
+
+The remote LLM call is by far the slowest and most expensive step of answering a
+question. `AnswerCache` remembers each answer together with the embedding of its
+question and the IDs of the chunks it was based on. A new question reuses a stored
+answer when its embedding is within `config.ANSWER_CACHE_SIMILARITY_THRESHOLD`
+(cosine similarity) of a cached question and it retrieves the same chunks, so the
+answer was generated from exactly the same context.
+
+Cached answers are bounded by count and age, persisted to a JSON file across
+restarts, and discarded when the vector store is rebuilt. Processes sharing the file,
+such as both chat apps, merge their answers into it instead of overwriting each other's.
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from filelock import FileLock
+from langchain.chains import RetrievalQA
+
+import config
+from context_packing import prepare_context
+from metadata_index import MetadataFilter
+from retrieval_cache import normalize_query, store_signature
+
+ANSWER_CACHE_VERSION = 1
+
+
+class AnswerCache:
+    """
+    A persistent cache of answers, looked up by question embedding and retrieved chunks.
+    """
+
+    def __init__(
+        self,
+        path: str = config.ANSWER_CACHE_PATH,
+        db_path: str = config.DB_FAISS_PATH,
+        max_entries: int = config.ANSWER_CACHE_MAX_ENTRIES,
+        max_age_seconds: float = config.ANSWER_CACHE_MAX_AGE_SECONDS,
+        threshold: float = config.ANSWER_CACHE_SIMILARITY_THRESHOLD,
+    ):
+        """
+        Args:
+            path (str): The JSON file the cache is persisted to.
+            db_path (str): The vector store directory the answers were retrieved from.
+            max_entries (int): The maximum number of answers kept.
+            max_age_seconds (float): How long an answer stays valid after it is stored.
+            threshold (float): The minimum cosine similarity between two questions
+                for them to share an answer.
+        """
+        self.path = path
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._signature = self._store_key()
+        self._entries: List[Dict] = []
+        self._embeddings = np.empty((0, 0), dtype=np.float32)
+        self._load()
+
+    # --- Lookup ---
+
+    def lookup(self, embedding: np.ndarray, chunk_ids: List[str]) -> Optional[str]:
+        """
+        Returns the cached answer of a similar question that retrieved the same chunks.
+
+        Args:
+            embedding (np.ndarray): The embedding of the new question.
+            chunk_ids (List[str]): The IDs of the chunks retrieved for it.
+
+        Returns:
+            Optional[str]: The cached answer, or None if there is no match.
+        """
+        with self._lock:
+            self._check_store()
+            self._expire()
+            match = self._best_match(embedding, chunk_ids)
+            if match is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry = self._entries[match]
+            entry["last_used"] = time.time()
+            return entry["answer"]
+
+    def store(self, question: str, embedding: np.ndarray, chunk_ids: List[str], answer: str):
+        """
+        Adds an answer to the cache and writes the cache to disk.
+
+        Args:
+            question (str): The question that was answered.
+            embedding (np.ndarray): The embedding of the question.
+            chunk_ids (List[str]): The IDs of the chunks the answer was based on.
+            answer (str): The LLM's answer.
+        """
+        now = time.time()
+        with self._lock:
+            self._check_store()
+            self._expire()
+            self._entries.append({
+                "question": question,
+                "embedding": _unit(embedding).tolist(),
+                "chunk_ids": list(chunk_ids),
+                "answer": answer,
+                "created": now,
+                "last_used": now,
+            })
+            self._save()
+
+    def clear(self):
+        """Removes every answer, in memory and on disk."""
+        with self._lock:
+            self._entries = []
+            self._rebuild_matrix()
+            self._save(merge=False)
+
+    def stats(self) -> Dict:
+        """Returns the hit/miss counters and the number of cached answers."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+    # --- Internals ---
+
+    def _store_key(self) -> List:
+        # JSON turns tuples into lists, so compare the signature in list form.
+        return json.loads(json.dumps(store_signature(self.db_path)))
+
+    def _best_match(self, embedding: np.ndarray, chunk_ids: List[str]) -> Optional[int]:
+        if not self._entries:
+            return None
+        similarities = self._embeddings @ _unit(embedding)
+        for i in np.argsort(-similarities):
+            if similarities[i] < self.threshold:
+                break
+            if self._entries[i]["chunk_ids"] == list(chunk_ids):
+                return int(i)
+        return None
+
+    def _check_store(self):
+        """Drops every answer if the vector store was rebuilt."""
+        signature = self._store_key()
+        if signature != self._signature:
+            self._signature = signature
+            self._entries = []
+            self._rebuild_matrix()
+            self._save()
+
+    def _expire(self):
+        cutoff = time.time() - self.max_age_seconds
+        if any(entry["created"] < cutoff for entry in self._entries):
+            self._entries = [entry for entry in self._entries if entry["created"] >= cutoff]
+            self._rebuild_matrix()
+
+    def _rebuild_matrix(self):
+        if self._entries:
+            self._embeddings = np.array([entry["embedding"] for entry in self._entries], dtype=np.float32)
+        else:
+            self._embeddings = np.empty((0, 0), dtype=np.float32)
+
+    def _read_entries(self) -> List[Dict]:
+        """Returns the answers in the cache file that belong to the current vector store."""
+        if not os.path.exists(self.path):
+            return []
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            print(f"Ignoring unreadable answer cache: {self.path}")
+            return []
+        if data.get("version") != ANSWER_CACHE_VERSION or data.get("store") != self._signature:
+            # Written for a different vector store; its answers may be stale.
+            return []
+        return data.get("entries", [])
+
+    def _load(self):
+        self._entries = self._read_entries()
+        self._expire()
+        self._rebuild_matrix()
+
+    def _merge(self, entries: List[Dict]):
+        """Adds answers stored by other processes, keeping the most recently used copy."""
+        merged = {(entry["question"], tuple(entry["chunk_ids"])): entry for entry in entries}
+        for entry in self._entries:
+            key = (entry["question"], tuple(entry["chunk_ids"]))
+            if key not in merged or entry["last_used"] >= merged[key]["last_used"]:
+                merged[key] = entry
+        self._entries = list(merged.values())
+
+    def _save(self, merge: bool = True):
+        """
+        Atomically writes the cache, so other processes never read a partial file.
+
+        Args:
+            merge (bool): Re-read the file under the lock and keep the answers other
+                processes stored since it was loaded; False overwrites them.
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with FileLock(f"{self.path}.lock"):
+            if merge:
+                self._merge(self._read_entries())
+                self._expire()
+            if len(self._entries) > self.max_entries:
+                # Keep the most recently used answers.
+                self._entries.sort(key=lambda entry: entry["last_used"])
+                del self._entries[: len(self._entries) - self.max_entries]
+            self._rebuild_matrix()
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(
+                    {"version": ANSWER_CACHE_VERSION, "store": self._signature, "entries": self._entries},
+                    f,
+                )
+            os.replace(tmp_path, self.path)
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+_answer_cache: Optional[AnswerCache] = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> AnswerCache:
+    """Returns the answer cache shared by every session in this process."""
+    global _answer_cache
+    with _answer_cache_lock:
+        if _answer_cache is None:
+            _answer_cache = AnswerCache()
+        return _answer_cache
+
+
+def answer_question(
+    qa_chain: RetrievalQA, question: str, search_filter: Optional[MetadataFilter] = None
+) -> Dict:
+    """
+    Answers a question with a RetrievalQA chain, reusing a cached answer when possible.
+
+    Retrieval always runs, so a cached answer is only reused when the question still
+    retrieves the same chunks; the LLM is called only on a cache miss.
+
+    Args:
+        qa_chain (RetrievalQA): A chain whose retriever is a `CachedRetriever`.
+        question (str): The user's question.
+        search_filter (Optional[MetadataFilter]): Restricts retrieval to the chunks
+            of some sources, pages or topics.
+
+    Returns:
+        Dict: The chain's "query", "result" and "source_documents", plus "cached",
+        which is True if the answer came from the cache.
+    """
+    retriever = qa_chain.retriever
+    documents = retriever.invoke(question, search_filter=search_filter)
+    if not config.ANSWER_CACHE_ENABLED:
+        cache = None
+    else:
+        cache = get_answer_cache()
+        embedding = retriever.embed_query(normalize_query(question))
+        chunk_ids = [document.id for document in documents]
+        answer = cache.lookup(embedding, chunk_ids)
+        if answer is not None:
+            return {"query": question, "result": answer, "source_documents": documents, "cached": True}
+
+    combine_chain = qa_chain.combine_documents_chain
+    answer = combine_chain.invoke({"input_documents": prepare_context(documents), "question": question})[combine_chain.output_key]
+    if cache is not None:
+        cache.store(question, embedding, chunk_ids, answer)
+    return {"query": question, "result": answer, "source_documents": documents, "cached": False}
@@ -0,0 +1,114 @@
+"""
+This module streams answers from the LLM token by token.
+
+`RetrievalQA.invoke` only returns once the whole answer has been generated, so the
+user stares at a spinner for the full generation time. `StreamingAnswer` runs the
+same steps as the chain, retrieval first and then the "stuff" prompt, but streams
+the LLM's tokens as they arrive. It records the time to the first token separately
+from the total latency, and stores finished answers in the answer cache.
+"""
+
+import time
+from dataclasses import dataclass
+from typing import Iterator, List, Optional
+
+from langchain.chains import RetrievalQA
+from langchain.docstore.document import Document
+from langchain_core.prompts import format_document
+
+import config
+from answer_cache import get_answer_cache
+from context_packing import prepare_context
+from metadata_index import MetadataFilter
+from retrieval_cache import normalize_query
+
+
+@dataclass
+class AnswerTimings:
+    """Latency of one answer, in seconds since the question was asked."""
+
+    retrieval: float = 0.0
+    first_token: Optional[float] = None
+    total: Optional[float] = None
+
+    def summary(self) -> str:
+        """Returns a one-line description of the timings."""
+        parts = [f"retrieval {self.retrieval:.2f}s"]
+        if self.first_token is not None:
+            parts.append(f"first token {self.first_token:.2f}s")
+        if self.total is not None:
+            parts.append(f"total {self.total:.2f}s")
+        return " · ".join(parts)
+
+
+class StreamingAnswer:
+    """
+    An answer to one question whose text is produced by iterating over it.
+
+    Creating the object runs retrieval and looks the question up in the answer cache.
+    Iterating yields the answer text piece by piece; afterwards `result` holds the
+    full answer and `timings` the latency breakdown.
+    """
+
+    def __init__(self, qa_chain: RetrievalQA, question: str, search_filter: Optional[MetadataFilter] = None):
+        """
+        Args:
+            qa_chain (RetrievalQA): A "stuff" chain whose retriever is a `CachedRetriever`.
+            question (str): The user's question.
+            search_filter (Optional[MetadataFilter]): Restricts retrieval to the chunks
+                of some sources, pages or topics.
+        """
+        self.qa_chain = qa_chain
+        self.question = question
+        self.result = ""
+        self.cached = False
+
+        self._start = time.perf_counter()
+        retriever = qa_chain.retriever
+        self.source_documents: List[Document] = retriever.invoke(question, search_filter=search_filter)
+
+        self._cache = get_answer_cache() if config.ANSWER_CACHE_ENABLED else None
+        if self._cache is not None:
+            self._embedding = retriever.embed_query(normalize_query(question))
+            self._chunk_ids = [document.id for document in self.source_documents]
+            answer = self._cache.lookup(self._embedding, self._chunk_ids)
+            if answer is not None:
+                self.result = answer
+                self.cached = True
+        self.timings = AnswerTimings(retrieval=self._elapsed())
+
+    def __iter__(self) -> Iterator[str]:
+        if self.cached:
+            self.timings.first_token = self.timings.total = self._elapsed()
+            yield self.result
+            return
+
+        pieces = []
+        for chunk in self.qa_chain.combine_documents_chain.llm_chain.llm.stream(self._prompt()):
+            # Chat models stream message chunks, plain LLMs stream strings.
+            text = getattr(chunk, "content", chunk)
+            if not text:
+                continue
+            if self.timings.first_token is None:
+                self.timings.first_token = self._elapsed()
+            pieces.append(text)
+            yield text
+
+        self.result = "".join(pieces)
+        self.timings.total = self._elapsed()
+        if self._cache is not None:
+            self._cache.store(self.question, self._embedding, self._chunk_ids, self.result)
+
+    def _prompt(self):
+        """Builds the "stuff" prompt from the packed context, as `answer_question` does."""
+        combine_chain = self.qa_chain.combine_documents_chain
+        context = combine_chain.document_separator.join(
+            format_document(document, combine_chain.document_prompt)
+            for document in prepare_context(self.source_documents)
+        )
+        return combine_chain.llm_chain.prompt.format_prompt(
+            **{combine_chain.document_variable_name: context, "question": self.question}
+        )
+
+    def _elapsed(self) -> float:
+        return time.perf_counter() - self._start
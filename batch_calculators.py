@@ -0,0 +1,450 @@
+"""
+This module runs the financial calculators over files of client profiles, without Streamlit.
+
+Advisors project retirement, debt payoff and compound interest for thousands of
+clients at a time. `run_batch` reads a CSV or Parquet file of inputs, one client per
+row, and streams it through the vectorized functions of `finance_engine` a batch of
+`config.BATCH_CALCULATOR_ROWS` rows at a time. Each evaluated batch is written out as
+one row group (or CSV block) holding the input columns followed by the results, so
+memory stays flat however large the file is. With more than one worker, batches are
+evaluated across a process pool and written in input order.
+
+Rates are fractions (0.07 for 7%), as in `finance_engine`. The input columns of each
+calculator are listed in `CALCULATORS`; optional columns fall back to their default
+when missing or empty. Debts are given as numbered columns `balance_1`, `rate_1`,
+`min_payment_1`, `balance_2`, ... with empty cells for clients with fewer debts. Clients
+whose minimum payments never pay their debts off get `paid_off` false and infinite
+months, interest and total paid.
+
+    python batch_calculators.py retirement clients.parquet retirement.parquet
+    python batch_calculators.py debt_payoff debts.csv payoffs.csv --workers 4
+"""
+
+import argparse
+import csv
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+
+import config
+from finance_engine import (
+    DEFAULT_WITHDRAWAL_RATE,
+    MONTHS_PER_YEAR,
+    debt_payoff_totals,
+    future_value,
+    payoff_order,
+    retirement_plan,
+)
+
+DEBT_COLUMN_PATTERN = re.compile(r"^balance_(\d+)$")
+
+# Every numbered debt column, typed as a number when reading CSV files.
+DEBT_FIELD_PATTERN = re.compile(r"^(?:balance|rate|min_payment)_\d+$")
+
+
+@dataclass(frozen=True)
+class BatchCalculator:
+    """A calculator that evaluates a batch of input rows with array operations."""
+
+    # Columns every input file must have.
+    required: Tuple[str, ...]
+    # Optional columns and their defaults.
+    optional: Dict[str, object]
+    evaluate: Callable[[pa.RecordBatch], Dict[str, np.ndarray]]
+
+
+@dataclass
+class BatchReport:
+    """The throughput of a batch run."""
+
+    rows: int
+    batches: int
+    seconds: float
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+def column(batch: pa.RecordBatch, name: str, default: Optional[float] = None) -> np.ndarray:
+    """
+    Returns a numeric column of a batch as float64, with empty cells set to a default.
+
+    Args:
+        batch (pa.RecordBatch): The input rows.
+        name (str): The column name.
+        default (Optional[float]): The value of missing columns and empty cells; None
+            makes the column required.
+
+    Returns:
+        np.ndarray: The column values.
+
+    Raises:
+        ValueError: If a required column is missing.
+    """
+    index = batch.schema.get_field_index(name)
+    if index == -1:
+        if default is None:
+            raise ValueError(f"Input is missing the required column {name!r}.")
+        return np.full(batch.num_rows, default, dtype=np.float64)
+    values = batch.column(index).cast(pa.float64())
+    if default is not None:
+        values = values.fill_null(default)
+    return values.to_numpy(zero_copy_only=False)
+
+
+def _compound_interest(batch: pa.RecordBatch) -> Dict[str, np.ndarray]:
+    principal = column(batch, "principal")
+    monthly_contribution = column(batch, "monthly_contribution", 0.0)
+    months = column(batch, "years") * MONTHS_PER_YEAR
+    final_value = np.asarray(future_value(principal, monthly_contribution, column(batch, "annual_rate"), months))
+    total_contributions = principal + monthly_contribution * months
+    return {
+        "final_value": final_value,
+        "total_contributions": total_contributions,
+        "total_interest": final_value - total_contributions,
+    }
+
+
+def _retirement(batch: pa.RecordBatch) -> Dict[str, np.ndarray]:
+    plan = retirement_plan(
+        column(batch, "current_age"),
+        column(batch, "retirement_age"),
+        column(batch, "life_expectancy"),
+        column(batch, "current_income"),
+        column(batch, "income_replacement"),
+        column(batch, "current_savings"),
+        column(batch, "expected_return"),
+        column(batch, "inflation_rate"),
+        column(batch, "withdrawal_rate", DEFAULT_WITHDRAWAL_RATE),
+    )
+    return {name: np.asarray(values, dtype=np.float64) for name, values in vars(plan).items()}
+
+
+def debt_numbers(schema: pa.Schema) -> List[str]:
+    """Returns the numbers of the `balance_<n>` columns of a schema, in numeric order."""
+    numbers = [match.group(1) for match in map(DEBT_COLUMN_PATTERN.match, schema.names) if match]
+    return sorted(numbers, key=int)
+
+
+def _debt_payoff(batch: pa.RecordBatch) -> Dict[str, np.ndarray]:
+    numbers = debt_numbers(batch.schema)
+    balances = np.column_stack([column(batch, f"balance_{n}", 0.0) for n in numbers])
+    rates = np.column_stack([column(batch, f"rate_{n}", 0.0) for n in numbers])
+    min_payments = np.column_stack([column(batch, f"min_payment_{n}", 0.0) for n in numbers])
+
+    strategies = np.full(batch.num_rows, "avalanche", dtype=object)
+    index = batch.schema.get_field_index("strategy")
+    if index != -1:
+        values = batch.column(index).cast(pa.string()).fill_null("avalanche")
+        strategies = pc.utf8_lower(pc.utf8_trim_whitespace(values)).to_numpy(zero_copy_only=False)
+    orders = payoff_order(balances, rates, "avalanche")
+    snowball = strategies == "snowball"
+    orders[snowball] = payoff_order(balances[snowball], rates[snowball], "snowball")
+    unknown = set(strategies[(strategies != "avalanche") & ~snowball])
+    if unknown:
+        raise ValueError(f"Unknown payoff strategies: {sorted(unknown)}")
+
+    totals = debt_payoff_totals(balances, rates, min_payments, orders, column(batch, "extra_payment", 0.0))
+    return {
+        "paid_off": np.isfinite(totals.months),
+        "months_to_payoff": totals.months,
+        "total_interest": totals.total_interest,
+        "total_paid": totals.total_paid,
+    }
+
+
+CALCULATORS: Dict[str, BatchCalculator] = {
+    "compound_interest": BatchCalculator(
+        required=("principal", "annual_rate", "years"),
+        optional={"monthly_contribution": 0.0},
+        evaluate=_compound_interest,
+    ),
+    "retirement": BatchCalculator(
+        required=(
+            "current_age", "retirement_age", "life_expectancy", "current_income", "income_replacement",
+            "current_savings", "expected_return", "inflation_rate",
+        ),
+        optional={"withdrawal_rate": DEFAULT_WITHDRAWAL_RATE},
+        evaluate=_retirement,
+    ),
+    "debt_payoff": BatchCalculator(
+        required=("balance_1", "rate_1", "min_payment_1"),
+        optional={"extra_payment": 0.0, "strategy": "avalanche"},
+        evaluate=_debt_payoff,
+    ),
+}
+
+
+def evaluate_batch(calculator: str, batch: pa.RecordBatch) -> pa.RecordBatch:
+    """
+    Evaluates a calculator on a batch of input rows.
+
+    Args:
+        calculator (str): A key of `CALCULATORS`.
+        batch (pa.RecordBatch): The input rows.
+
+    Returns:
+        pa.RecordBatch: The input columns followed by the result columns; input
+        columns named like a result are replaced.
+
+    Raises:
+        ValueError: If the calculator is unknown or the input misses a column.
+    """
+    if calculator not in CALCULATORS:
+        raise ValueError(f"Unknown calculator: {calculator!r}; expected one of {sorted(CALCULATORS)}.")
+    missing = [name for name in CALCULATORS[calculator].required if name not in batch.schema.names]
+    if missing:
+        raise ValueError(f"Input is missing the required columns {missing} of the {calculator!r} calculator.")
+    results = CALCULATORS[calculator].evaluate(batch)
+    names = [name for name in batch.schema.names if name not in results]
+    arrays = [batch.column(name) for name in names] + [pa.array(values) for values in results.values()]
+    return pa.RecordBatch.from_arrays(arrays, names=names + list(results))
+
+
+def _file_format(path: str) -> str:
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".parquet", ".pq"):
+        return "parquet"
+    if extension == ".csv":
+        return "csv"
+    raise ValueError(f"Unsupported file type {extension!r}: use .csv or .parquet.")
+
+
+def _rebatch(batches: Iterable[pa.RecordBatch], batch_rows: int) -> Iterator[pa.RecordBatch]:
+    """Regroups record batches into batches of exactly `batch_rows` rows, except the last."""
+    pending, count = [], 0
+    for batch in batches:
+        while batch.num_rows:
+            take = min(batch_rows - count, batch.num_rows)
+            pending.append(batch.slice(0, take))
+            batch, count = batch.slice(take), count + take
+            if count == batch_rows:
+                yield pa.Table.from_batches(pending).combine_chunks().to_batches()[0]
+                pending, count = [], 0
+    if count:
+        yield pa.Table.from_batches(pending).combine_chunks().to_batches()[0]
+
+
+def csv_convert_options(path: str, calculator: Optional[str] = None) -> pacsv.ConvertOptions:
+    """
+    Returns CSV conversion options that fix the types of a calculator's input columns.
+
+    pyarrow infers CSV column types from the first block of the file only, so an
+    optional column that is empty there, such as `balance_2`, would be typed null and
+    fail on the first later row that fills it in.
+
+    Args:
+        path (str): The CSV file, whose header is read.
+        calculator (Optional[str]): A key of `CALCULATORS`; None infers every type.
+
+    Returns:
+        pacsv.ConvertOptions: float64 for the calculator's numeric columns and numbered
+        debt columns, string for its text columns; empty text cells are read as missing.
+    """
+    if calculator is None:
+        return pacsv.ConvertOptions()
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        header = next(csv.reader(f), [])
+    spec = CALCULATORS[calculator]
+    defaults = {name: 0.0 for name in spec.required} | spec.optional
+    column_types = {}
+    for name in header:
+        if name in defaults:
+            column_types[name] = pa.string() if isinstance(defaults[name], str) else pa.float64()
+        elif DEBT_FIELD_PATTERN.match(name):
+            column_types[name] = pa.float64()
+    return pacsv.ConvertOptions(column_types=column_types, strings_can_be_null=True)
+
+
+def read_batches(
+    path: str, batch_rows: int = config.BATCH_CALCULATOR_ROWS, calculator: Optional[str] = None
+) -> Iterator[pa.RecordBatch]:
+    """
+    Streams the rows of a CSV or Parquet file in batches.
+
+    Args:
+        path (str): The input file.
+        batch_rows (int): The number of rows per batch.
+        calculator (Optional[str]): The calculator the rows are for, whose input
+            columns are read from CSV with fixed types (see `csv_convert_options`).
+
+    Yields:
+        pa.RecordBatch: The next batch of rows, in file order.
+    """
+    if _file_format(path) == "parquet":
+        batches = pq.ParquetFile(path).iter_batches(batch_size=batch_rows)
+    else:
+        batches = pacsv.open_csv(path, convert_options=csv_convert_options(path, calculator))
+    yield from _rebatch(batches, batch_rows)
+
+
+def read_schema(path: str, calculator: Optional[str] = None) -> pa.Schema:
+    """
+    Returns the columns of a CSV or Parquet file, with CSV types inferred from its start.
+
+    Args:
+        path (str): The input file.
+        calculator (Optional[str]): The calculator the rows are for, whose input
+            columns have fixed types (see `csv_convert_options`).
+
+    Returns:
+        pa.Schema: The schema of the file's rows.
+    """
+    if _file_format(path) == "parquet":
+        return pq.ParquetFile(path).schema_arrow
+    return pacsv.open_csv(path, convert_options=csv_convert_options(path, calculator)).schema
+
+
+class _BatchWriter:
+    """Writes record batches to a CSV or Parquet file, one row group per batch."""
+
+    def __init__(self, path: str, schema: pa.Schema, file_format: str):
+        if file_format == "parquet":
+            self._writer = pq.ParquetWriter(path, schema)
+        else:
+            self._writer = pacsv.CSVWriter(path, schema)
+
+    def write(self, batch: pa.RecordBatch):
+        self._writer.write_batch(batch)
+
+    def close(self):
+        self._writer.close()
+
+
+def _evaluated_batches(
+    calculator: str, batches: Iterator[pa.RecordBatch], workers: int
+) -> Iterator[pa.RecordBatch]:
+    """Yields the evaluated batches in input order, across a process pool if `workers` > 1."""
+    if workers == 1:
+        for batch in batches:
+            yield evaluate_batch(calculator, batch)
+        return
+
+    # Only keep a few batches in flight per worker, so neither inputs nor results
+    # pile up in memory faster than they are written.
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for batch in batches:
+            pending.append(pool.submit(evaluate_batch, calculator, batch))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def run_batch(
+    calculator: str,
+    input_path: str,
+    output_path: str,
+    batch_rows: int = config.BATCH_CALCULATOR_ROWS,
+    max_workers: Optional[int] = config.BATCH_CALCULATOR_WORKERS,
+    report_every: float = config.BATCH_CALCULATOR_REPORT_EVERY_SECONDS,
+) -> BatchReport:
+    """
+    Evaluates a calculator on every row of a file and writes the results to another.
+
+    The output is written next to its final location and then moved into place, so
+    a failed run never leaves a half-written file behind.
+
+    Args:
+        calculator (str): A key of `CALCULATORS`.
+        input_path (str): The CSV or Parquet file of inputs.
+        output_path (str): The CSV or Parquet file to write.
+        batch_rows (int): The number of rows evaluated at a time.
+        max_workers (Optional[int]): Worker processes to use; None uses every core and
+            1 evaluates in this process.
+        report_every (float): Seconds between the throughput reports printed.
+
+    Returns:
+        BatchReport: The number of rows and batches and the time taken.
+
+    Raises:
+        ValueError: If the calculator, a file type or an input column is invalid.
+    """
+    if calculator not in CALCULATORS:
+        raise ValueError(f"Unknown calculator: {calculator!r}; expected one of {sorted(CALCULATORS)}.")
+    output_format = _file_format(output_path)
+    workers = max(max_workers or os.cpu_count() or 1, 1)
+
+    start = last_report = time.perf_counter()
+    rows = batches = 0
+    tmp_path = f"{output_path}.tmp"
+    writer = None
+    try:
+        for batch in _evaluated_batches(calculator, read_batches(input_path, batch_rows, calculator), workers):
+            if writer is None:
+                writer = _BatchWriter(tmp_path, batch.schema, output_format)
+            writer.write(batch)
+            rows += batch.num_rows
+            batches += 1
+            now = time.perf_counter()
+            if now - last_report >= report_every:
+                print(f"{calculator}: {rows:,} rows evaluated ({rows / (now - start):,.0f} rows/s)")
+                last_report = now
+    except BaseException:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    if writer is None:
+        # No input rows: still write an empty output with every result column.
+        schema = read_schema(input_path, calculator)
+        empty = pa.RecordBatch.from_arrays([pa.array([], type=field.type) for field in schema], schema=schema)
+        writer = _BatchWriter(tmp_path, evaluate_batch(calculator, empty).schema, output_format)
+    writer.close()
+    os.replace(tmp_path, output_path)
+
+    report = BatchReport(rows=rows, batches=batches, seconds=time.perf_counter() - start)
+    print(
+        f"{calculator}: {report.rows:,} rows in {report.batches} batches, {report.seconds:.2f} s "
+        f"({report.rows_per_second:,.0f} rows/s) -> {output_path}"
+    )
+    return report
+
+
+def main(argv: Optional[List[str]] = None):
+    """
+    Runs a calculator over a file of client profiles.
+
+    Args:
+        argv (Optional[List[str]]): Command line arguments, defaults to `sys.argv`.
+    """
+    columns = "\n".join(
+        f"  {name}: {', '.join(calculator.required)}"
+        + "".join(f", [{column}={default}]" for column, default in calculator.optional.items())
+        for name, calculator in CALCULATORS.items()
+    )
+    parser = argparse.ArgumentParser(
+        description="Run a financial calculator over a CSV or Parquet file.",
+        epilog=f"Input columns ([optional=default]):\n{columns}\n"
+        "Debts continue with balance_2, rate_2, min_payment_2, ... as needed.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("calculator", choices=sorted(CALCULATORS))
+    parser.add_argument("input", help="CSV or Parquet file with one client profile per row.")
+    parser.add_argument("output", help="CSV or Parquet file to write the results to.")
+    parser.add_argument(
+        "--batch-rows", type=int, default=config.BATCH_CALCULATOR_ROWS, help="Rows evaluated at a time."
+    )
+    parser.add_argument(
+        "--workers", type=int, default=config.BATCH_CALCULATOR_WORKERS,
+        help="Worker processes; 0 uses every core.",
+    )
+    args = parser.parse_args(argv)
+    run_batch(args.calculator, args.input, args.output, args.batch_rows, args.workers or None)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,9 @@
 # Test script to verify your finance book collection
 import os
 
+import config
+from vector_shards import load_catalog, shard_report
+
 def check_finance_books():
     """Check what finance books are available in the data directory"""
     data_path = "data/"
@@ -38,5 +41,20 @@ def check_finance_books():
     else:
         print("❌ Data directory not found!")
 
+def check_vector_shards():
+    """Show the vector index shard of each book in the knowledge base"""
+    catalog = load_catalog(config.DB_FAISS_PATH)
+    if catalog is None:
+        print("\n🧩 No vector shards yet - run Setting_Up_Vector_Store.py")
+        return
+
+    print(f"\n🧩 Vector Shards ({len(catalog['shards'])}, {catalog['ntotal']} chunks, {catalog['factory']}):")
+    for shard in shard_report(config.DB_FAISS_PATH):
+        print(
+            f"   📦 {os.path.basename(shard['source'])}: {shard['ntotal']} chunks, "
+            f"{shard['resolved']}, {shard['size_mb']:.1f} MB, built in {shard['build_s']:.2f} s, {shard['latency_ms']:.2f} ms/query"
+        )
+
 if __name__ == "__main__":
-    check_finance_books()
\ No newline at end of file
+    check_finance_books()
+    check_vector_shards()
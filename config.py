@@ -19,6 +19,30 @@ LLM_ENDPOINT_PARAMS = {
     "provider": "auto",
 }
 
+# Stream answers into the chat token by token as the LLM generates them,
+# instead of showing a spinner until the whole answer is ready.
+STREAM_ANSWERS = True
+
+# Seconds to wait for the LLM endpoint before a request fails.
+LLM_TIMEOUT_SECONDS = 60
+
+# Maximum number of LLM requests in flight at once, across all chat sessions
+# in a process. Further requests wait in a queue for a free slot.
+LLM_MAX_CONCURRENCY = 4
+
+# Maximum number of requests waiting for a free slot. Requests beyond this are
+# refused immediately instead of piling up.
+LLM_MAX_QUEUE = 32
+
+# Seconds a request may wait in the queue before it is refused.
+LLM_QUEUE_TIMEOUT_SECONDS = 30
+
+# Number of retries for requests that fail with HTTP 429 or 5xx, and the base and
+# maximum delay in seconds of the jittered exponential backoff between them.
+LLM_MAX_RETRIES = 3
+LLM_RETRY_BASE_DELAY = 1.0
+LLM_RETRY_MAX_DELAY = 20.0
+
 # --- Embedding Model Configuration ---
 # Model name for sentence-transformers. Used for creating vector embeddings.
 # 'all-MiniLM-l6-v2' is a good starting point for performance and quality.
@@ -32,16 +56,253 @@ EMBEDDING_MODEL_KWARGS = {'device': 'cpu'}
 # 'normalize_embeddings' is set to False by default.
 EMBEDDING_ENCODE_KWARGS = {'normalize_embeddings': False}
 
+# Maximum input length of the embedding model in word pieces, including the
+# [CLS] and [SEP] tokens. all-MiniLM-L6-v2 truncates anything longer.
+EMBEDDING_MAX_SEQ_LENGTH = 256
+
+# Number of texts the embedding model encodes per forward pass. Each call's texts
+# are sorted by token length first, so a batch pads to about the same length.
+EMBEDDING_ENCODE_BATCH_SIZE = 32
+
+# Number of processes that embed chunks during a build. 1 encodes in this process;
+# None starts one sentence-transformers worker per CPU core, and the cores' threads
+# are divided among them. Raise EMBEDDING_BATCH_SIZE along with it, so each worker
+# gets several forward batches per call.
+EMBEDDING_WORKERS = 1
+
+# Seconds between the chunks/sec and tokens/sec reports printed while embedding.
+EMBEDDING_REPORT_EVERY_SECONDS = 10
+
+# Backend that computes embeddings. "torch" runs the sentence-transformer with
+# PyTorch; "onnx" runs its int8-quantized ONNX export from ONNX_EMBEDDING_DIR with
+# onnxruntime, which is faster on CPU and does not import torch. Create the export
+# with `python onnx_embeddings.py export` and check it with `... compare`. The
+# vectors differ slightly between backends, so switching rebuilds the store.
+EMBEDDING_BACKEND = "torch"
+
+# Directory of the ONNX export and the graph in it that the "onnx" backend runs.
+ONNX_EMBEDDING_DIR = "models/onnx"
+ONNX_EMBEDDING_FILE = "model_int8.onnx"
+
+# --- Vector Index Configuration ---
+# FAISS index factory string for the index that answers queries. The setup
+# script always keeps an exact flat index for incremental updates; any other
+# choice is built from it, together with a recall/latency/size report.
+# Placeholders {nlist}, {pq_m} and {pq_nbits} are sized from the corpus.
+# Examples:
+#   "Flat"                           exact search (default)
+#   "HNSW32"                         graph index, fast and accurate, more memory
+#   "IVF{nlist},Flat"                inverted lists with full vectors
+#   "IVF{nlist},PQ{pq_m}x{pq_nbits}" inverted lists with product quantization
+#   "SQ8" / "SQfp16"                 exact search over 8-bit / float16 storage
+#   "HNSW32,SQ8"                     graph index over 8-bit storage
+FAISS_INDEX_FACTORY = "Flat"
+
+# Serve queries from one index of the FAISS_INDEX_FACTORY type per source
+# document, searched in parallel, instead of one index over the whole store.
+# Only the shards of added or changed books are rebuilt.
+VECTOR_SHARDS = True
+
+# Number of inverted lists visited per query by IVF indexes.
+FAISS_NPROBE = 16
+
+# Size of the candidate list explored per query by HNSW indexes.
+FAISS_EF_SEARCH = 64
+
+# Index types compared by `python Setting_Up_Vector_Store.py --compare-indexes`.
+FAISS_INDEX_CANDIDATES = [
+    "HNSW32",
+    "HNSW32,SQ8",
+    "IVF{nlist},Flat",
+    "IVF{nlist},PQ{pq_m}x{pq_nbits}",
+    "SQ8",
+    "SQfp16",
+]
+
+# Number of synthetic queries used to measure recall and latency.
+INDEX_REPORT_QUERIES = 200
+
+# Number of chunks retrieved for each question.
+RETRIEVAL_K = 4
+
+# Memory-map the FAISS index in the chat applications instead of reading it into
+# each process, so the OS shares and pages it in lazily.
+FAISS_MMAP = True
+
+# How the chat applications read chunk text and metadata:
+#   "sqlite": only the top-k hits are read from chunks.sqlite (default, no pickle).
+#   "pickle": LangChain's index.pkl is unpickled into memory in every process.
+DOCSTORE_FORMAT = "sqlite"
+
+# Combine keyword (BM25) search with vector search, so exact terms such as form
+# numbers are found even when their embeddings are not close to the question.
+HYBRID_RETRIEVAL = True
+
+# Number of candidates taken from each of the keyword and vector rankings
+# before they are fused into the final top RETRIEVAL_K.
+HYBRID_CANDIDATES = 20
+
+# Reciprocal rank fusion constant; larger values weigh lower ranks more evenly.
+RRF_K = 60
+
+# BM25 term frequency saturation and document length normalization.
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Topic tags assigned to each chunk at ingest, so questions can be scoped to a
+# topic. A chunk gets every topic one of whose keywords it contains (whole
+# words, case-insensitive). Changing the table rebuilds the store.
+CHUNK_TOPICS = {
+    "taxes": ["tax", "taxes", "irs", "deduction", "deductions", "taxable", "withholding", "form 1040", "refund"],
+    "retirement": ["retirement", "retire", "401(k)", "ira", "roth", "pension", "social security"],
+    "investing": ["invest", "investing", "investment", "stock", "stocks", "bond", "bonds", "mutual fund", "portfolio"],
+    "debt": ["debt", "loan", "loans", "mortgage", "credit card", "interest rate", "payoff", "snowball"],
+    "budgeting": ["budget", "budgeting", "expenses", "spending", "saving", "savings", "emergency fund"],
+    "insurance": ["insurance", "premium", "deductible", "coverage", "policy"],
+}
+
+# Merge overlapping chunks, drop repeated sentences and cap the context put
+# into each prompt, to cut prompt size and LLM latency.
+CONTEXT_PACKING = True
+
+# Maximum number of tokens of retrieved context per prompt.
+CONTEXT_TOKEN_BUDGET = 1500
+
+# Average number of characters per LLM token, used to estimate token counts when
+# the embedding model's tokenizer cannot be loaded.
+CHARS_PER_TOKEN = 4
+
+# --- Retrieval Cache Configuration ---
+# Maximum number of cached query embeddings and top-k results, shared by all
+# chat sessions in a process.
+RETRIEVAL_CACHE_MAX_ENTRIES = 1024
+
+# Seconds a cached query embedding or top-k result stays valid.
+RETRIEVAL_CACHE_TTL_SECONDS = 3600
+
+# --- Answer Cache Configuration ---
+# Reuse a stored answer, skipping the LLM call, when a new question is nearly
+# identical to a cached one and retrieves exactly the same chunks.
+ANSWER_CACHE_ENABLED = True
+
+# File holding the cached answers across restarts.
+ANSWER_CACHE_PATH = "vectorstore/answer_cache.json"
+
+# Minimum cosine similarity between two question embeddings for them to share an answer.
+ANSWER_CACHE_SIMILARITY_THRESHOLD = 0.95
+
+# Maximum number of cached answers. The least recently used answers are dropped first.
+ANSWER_CACHE_MAX_ENTRIES = 1000
+
+# Seconds a cached answer stays valid after it was generated.
+ANSWER_CACHE_MAX_AGE_SECONDS = 7 * 24 * 3600
+
+# --- Embedding Cache Configuration ---
+# Cache computed embeddings on disk, keyed by model name, normalization flag
+# and text hash, so unchanged text is never encoded twice.
+EMBEDDING_CACHE_ENABLED = True
+
+# Directory holding the embedding cache.
+EMBEDDING_CACHE_PATH = "vectorstore/embedding_cache"
+
+# Maximum size of the cached vectors in megabytes. The least recently used
+# entries are evicted when the cache grows past this size.
+EMBEDDING_CACHE_MAX_MB = 512
+
+# Number of new embeddings buffered in memory before they are written to disk.
+EMBEDDING_CACHE_FLUSH_EVERY = 1024
+
 # --- Vector Store Configuration ---
 # Path to the local FAISS vector store database.
 DB_FAISS_PATH = "vectorstore/db_faiss"
 
+# Path to the manifest that records which source files (and which chunk IDs)
+# are stored in the vector store. Used for incremental rebuilds.
+MANIFEST_PATH = "vectorstore/manifest.json"
+
 # Path to the directory containing the source documents for the knowledge base.
 DATA_PATH = "data/"
 
+# Directory where an in-progress build periodically saves its partial vector
+# store and manifest, so an interrupted build can resume where it stopped.
+CHECKPOINT_PATH = "vectorstore/db_faiss.checkpoint"
+
+# --- Ingestion Pipeline Configuration ---
+# Number of chunks embedded and added to the index at a time. Together with
+# the PDF loader settings this bounds the memory used by a build.
+EMBEDDING_BATCH_SIZE = 64
+
+# Number of embedded batches between two checkpoints.
+CHECKPOINT_EVERY_BATCHES = 50
+
+# Drop chunks that are near-duplicates of a chunk already in the store, instead
+# of embedding them. The kept chunk lists the dropped chunks' sources.
+NEAR_DUPLICATE_FILTER = True
+
+# Minimum estimated Jaccard similarity of the word shingles of two chunks for
+# them to count as near-duplicates.
+NEAR_DUPLICATE_THRESHOLD = 0.9
+
+# Length of the MinHash signatures and number of words per shingle.
+MINHASH_PERMUTATIONS = 128
+MINHASH_SHINGLE_WORDS = 5
+
+# --- Document Loading Configuration ---
+# Number of worker processes used to parse PDFs. None uses one process per CPU
+# core; 1 parses sequentially with PyPDFLoader.
+PDF_LOADER_WORKERS = None
+
+# Maximum number of pages of a single PDF handed to a worker at a time.
+# Large books are split into several ranges so they can be parsed in parallel.
+PDF_PAGES_PER_TASK = 32
+
+# Strip running headers, footers and page numbers from PDF pages, rejoin words
+# hyphenated across lines and normalize whitespace before chunking.
+PAGE_CLEANING = True
+
+# Number of lines at the top and bottom of each page searched for boilerplate.
+BOILERPLATE_EDGE_LINES = 3
+
+# Minimum number of pages of a file a line must appear on (digits ignored) to be
+# stripped as a header or footer.
+BOILERPLATE_MIN_PAGES = 4
+
 # --- Text Splitting Configuration ---
-# Parameters for splitting documents into chunks.
+# How chunk length is measured. "tokens" counts word pieces with the embedding
+# model's tokenizer (needs `transformers`), so chunks fit its input limit and none
+# of their text is truncated away; "characters" uses len().
+TEXT_SPLITTER_LENGTH = "tokens"
+
+# Parameters for splitting documents into chunks measured in characters.
 TEXT_SPLITTER_PARAMS = {
     "chunk_size": 2000,
     "chunk_overlap": 400,
-}
\ No newline at end of file
+}
+
+# Parameters for splitting documents into chunks measured in tokens. The chunk
+# size leaves room for the two special tokens within EMBEDDING_MAX_SEQ_LENGTH.
+TOKEN_SPLITTER_PARAMS = {
+    "chunk_size": EMBEDDING_MAX_SEQ_LENGTH - 2,
+    "chunk_overlap": 48,
+}
+
+# --- Financial Calculator Configuration ---
+# Number of worker processes that compute a Monte Carlo sensitivity grid. 1 computes
+# it in the calling process, so an uncached rerun of the app does not start a process
+# pool; None uses one process per CPU core.
+MONTE_CARLO_WORKERS = 1
+
+# Number of Monte Carlo results kept per input combination, so moving a slider
+# back to an earlier value shows its result without simulating again.
+MONTE_CARLO_CACHE_SIZE = 64
+
+# Number of worker processes that evaluate batch calculator files (see
+# batch_calculators.py). None uses one process per CPU core; 1 evaluates in the
+# calling process.
+BATCH_CALCULATOR_WORKERS = 1
+
+# Number of input rows evaluated at a time; each becomes one output row group.
+BATCH_CALCULATOR_ROWS = 65536
+
+# Seconds between the rows/sec reports printed while a batch file is evaluated.
+BATCH_CALCULATOR_REPORT_EVERY_SECONDS = 10
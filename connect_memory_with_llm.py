@@ -12,8 +12,9 @@ It performs the following steps:
 import os
 from langchain_core.prompts import PromptTemplate
 from langchain.chains import RetrievalQA
-from langchain_community.vectorstores import FAISS
-from Resources import load_embedding_model, load_llm
+from Resources import load_vector_store, load_llm
+from retrieval_cache import CachedRetriever
+from answer_cache import answer_question
 import config
 
 # --- Custom Prompt Template ---
@@ -58,20 +59,17 @@ def create_qa_chain():
     """
     # Load the FAISS vector store
     print("📚 Loading comprehensive finance knowledge base...")
-    embedding_model = load_embedding_model()
-    db = FAISS.load_local(
-        config.DB_FAISS_PATH,
-        embedding_model,
-        allow_dangerous_deserialization=True,
-    )
+    db = load_vector_store()
     print("✅ Knowledge base loaded successfully!")
 
     # Create the QA chain
     return RetrievalQA.from_chain_type(
         llm=load_llm(),
         chain_type="stuff",
-        retriever=db.as_retriever(
-            search_type="similarity", search_kwargs={"k": 4}
+        retriever=CachedRetriever(
+            vectorstore=db,
+            reload_vectorstore=lambda: load_vector_store(db.embedding_function),
+            k=config.RETRIEVAL_K,
         ),
         return_source_documents=True,
         chain_type_kwargs={"prompt": set_custom_prompt()},
@@ -93,7 +91,7 @@ def main():
     user_query = input("Ask your personal finance question: ")
 
     if user_query.strip():
-        response = qa_chain.invoke({"query": user_query})
+        response = answer_question(qa_chain, user_query)
         print("\nFinance Assistant Response:", response["result"].strip())
         print("-" * 60)
 
@@ -0,0 +1,256 @@
+"""
+This module assembles the retrieved chunks into a compact, token-budgeted context.
+
+Consecutive chunks overlap (see the text splitter settings in `config`), so the top-k
+hits often repeat the same text: neighbouring chunks of one page share their overlap,
+and guides restate the same sentences. Every repeated token is paid for in prompt processing time.
+`pack_documents` runs between retrieval and the "stuff" prompt and:
+1. Merges chunks of the same source and page whose text overlaps into one passage.
+2. Drops sentences that already appeared in a more relevant passage.
+3. Fills `config.CONTEXT_TOKEN_BUDGET` with passages in relevance order, cutting the
+   last passage that does not fit at a sentence boundary.
+"""
+
+import math
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, List, Optional, Tuple
+
+from langchain.docstore.document import Document
+
+import config
+from token_chunking import load_tokenizer
+
+# Overlaps shorter than this are treated as coincidence, not as a shared chunk overlap.
+MIN_MERGE_OVERLAP = 50
+
+# Sentences shorter than this are never dropped as duplicates.
+MIN_DEDUP_SENTENCE_CHARS = 30
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n{2,}")
+
+
+@dataclass
+class PackingStats:
+    """What context packing did to one prompt."""
+
+    chunks: int
+    passages: int
+    merged: int
+    sentences_dropped: int
+    tokens_before: int
+    tokens_after: int
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+    def summary(self) -> str:
+        """Returns a one-line description of the savings."""
+        saved = self.tokens_saved / self.tokens_before if self.tokens_before else 0.0
+        return (
+            f"{self.chunks} chunks -> {self.passages} passages, ~{self.tokens_before} -> "
+            f"~{self.tokens_after} tokens ({saved:.0%} saved, {self.merged} merged, "
+            f"{self.sentences_dropped} duplicate sentences dropped)"
+        )
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimates the number of LLM tokens in a text.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        int: The length in characters divided by `config.CHARS_PER_TOKEN`, rounded up.
+    """
+    return math.ceil(len(text) / config.CHARS_PER_TOKEN)
+
+
+@lru_cache(maxsize=None)
+def token_counter() -> Callable[[str], int]:
+    """
+    Returns the function that measures passages against the context budget.
+
+    Passages are counted with the embedding model's tokenizer, which is close to the
+    LLM's own count for English text. If the tokenizer cannot be loaded, because the
+    `transformers` package is not installed or the model files cannot be downloaded,
+    the count falls back to `estimate_tokens`.
+
+    Returns:
+        Callable[[str], int]: Counts the tokens of a text.
+    """
+    try:
+        tokenizer = load_tokenizer()
+    except (ImportError, OSError) as e:
+        print(f"Context packing: tokenizer unavailable ({type(e).__name__}), estimating tokens from characters.")
+        return estimate_tokens
+    return lambda text: len(tokenizer(text, add_special_tokens=False, verbose=False)["input_ids"])
+
+
+def _overlap(first: str, second: str) -> int:
+    """Returns the length of the longest suffix of `first` that starts `second`."""
+    if len(first) < MIN_MERGE_OVERLAP or len(second) < MIN_MERGE_OVERLAP:
+        return 0
+    probe = second[:MIN_MERGE_OVERLAP]
+    start = first.find(probe, max(0, len(first) - len(second)))
+    while start != -1:
+        if second.startswith(first[start:]):
+            return len(first) - start
+        start = first.find(probe, start + 1)
+    return 0
+
+
+def _merge(first: str, second: str) -> Optional[str]:
+    """Joins two chunks of the same page if one contains or overlaps the other."""
+    if second in first:
+        return first
+    if first in second:
+        return second
+    overlap = _overlap(first, second)
+    if overlap:
+        return first + second[overlap:]
+    overlap = _overlap(second, first)
+    if overlap:
+        return second + first[overlap:]
+    return None
+
+
+def _same_page(a: Document, b: Document) -> bool:
+    return a.metadata.get("source") == b.metadata.get("source") and a.metadata.get("page") == b.metadata.get("page")
+
+
+def merge_overlapping(documents: List[Document]) -> Tuple[List[Document], int]:
+    """
+    Merges chunks of the same source and page whose text overlaps.
+
+    A merged passage takes the place of its most relevant chunk.
+
+    Args:
+        documents (List[Document]): The retrieved chunks, most relevant first.
+
+    Returns:
+        Tuple[List[Document], int]: The passages, most relevant first, and the number
+        of merges made.
+    """
+    passages = [Document(page_content=d.page_content, metadata=dict(d.metadata)) for d in documents]
+    merges = 0
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(passages)):
+            for j in range(i + 1, len(passages)):
+                if not _same_page(passages[i], passages[j]):
+                    continue
+                text = _merge(passages[i].page_content, passages[j].page_content)
+                if text is not None:
+                    passages[i].page_content = text
+                    del passages[j]
+                    merges += 1
+                    merged = True
+                    break
+            if merged:
+                break
+    return passages, merges
+
+
+def split_sentences(text: str) -> List[str]:
+    """
+    Splits text into sentences, each keeping its trailing whitespace.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        List[str]: The sentences; joining them gives back `text`.
+    """
+    sentences, start = [], 0
+    for match in SENTENCE_END.finditer(text):
+        sentences.append(text[start:match.end()])
+        start = match.end()
+    if start < len(text):
+        sentences.append(text[start:])
+    return sentences
+
+
+def _sentence_key(sentence: str) -> str:
+    return re.sub(r"\s+", " ", sentence).strip().lower()
+
+
+def pack_documents(
+    documents: List[Document],
+    budget: int = config.CONTEXT_TOKEN_BUDGET,
+    count_tokens: Callable[[str], int] = estimate_tokens,
+) -> Tuple[List[Document], PackingStats]:
+    """
+    Builds a deduplicated context from retrieved chunks that fits a token budget.
+
+    Args:
+        documents (List[Document]): The retrieved chunks, most relevant first.
+        budget (int): The maximum number of context tokens.
+        count_tokens (Callable[[str], int]): Counts the tokens of a text.
+
+    Returns:
+        Tuple[List[Document], PackingStats]: The passages to put in the prompt, most
+        relevant first, and what packing saved.
+    """
+    tokens_before = sum(count_tokens(d.page_content) for d in documents)
+    passages, merges = merge_overlapping(documents)
+
+    seen = set()
+    packed = []
+    dropped = 0
+    remaining = budget
+    for passage in passages:
+        kept, keys = [], set()
+        for sentence in split_sentences(passage.page_content):
+            key = _sentence_key(sentence)
+            if len(key) >= MIN_DEDUP_SENTENCE_CHARS and (key in seen or key in keys):
+                dropped += 1
+                continue
+            keys.add(key)
+            kept.append(sentence)
+
+        # Keep whole sentences while they fit; a later, shorter passage may still fit.
+        if count_tokens("".join(kept).strip()) > remaining:
+            fitted = []
+            for sentence in kept:
+                if count_tokens("".join(fitted + [sentence]).strip()) > remaining:
+                    break
+                fitted.append(sentence)
+            kept = fitted
+        text = "".join(kept).strip()
+        if text:
+            seen.update(_sentence_key(sentence) for sentence in kept)
+            remaining -= count_tokens(text)
+            packed.append(Document(page_content=text, metadata=passage.metadata))
+
+    stats = PackingStats(
+        chunks=len(documents),
+        passages=len(packed),
+        merged=merges,
+        sentences_dropped=dropped,
+        tokens_before=tokens_before,
+        tokens_after=sum(count_tokens(d.page_content) for d in packed),
+    )
+    return packed, stats
+
+
+def prepare_context(documents: List[Document]) -> List[Document]:
+    """
+    Packs retrieved chunks for the prompt if `config.CONTEXT_PACKING` is enabled,
+    and logs the savings.
+
+    Args:
+        documents (List[Document]): The retrieved chunks, most relevant first.
+
+    Returns:
+        List[Document]: The documents to put in the prompt.
+    """
+    if not config.CONTEXT_PACKING:
+        return documents
+    packed, stats = pack_documents(documents, count_tokens=token_counter())
+    print(f"Context packing: {stats.summary()}")
+    return packed
@@ -0,0 +1,287 @@
+"""
+This module provides a persistent, content-addressed cache for text embeddings.
+
+`CachedEmbeddings` wraps any LangChain `Embeddings` object and stores every vector it
+computes on disk, keyed by the model name, the normalization flag and a hash of the
+text. Re-embedding a chunk that was already seen, for example after changing the
+chunking parameters or the index type, is then a lookup instead of a model call.
+
+On disk, each (model, normalization) namespace gets its own directory containing:
+- `vectors-<generation>.f32`: a flat float32 array of shape (entries, dim), read
+  memory-mapped.
+- `index.npz`: the 16-byte key and the last-used time of each row, the vector
+  dimension and the generation of the vector file the rows refer to.
+
+New vectors are buffered in memory and appended to disk in batches under a file
+lock, so several processes can share one cache. Replacing `index.npz` is the commit
+point of every write: appended rows only become visible once the index lists them,
+and eviction writes a new vector file generation instead of rewriting the live one.
+"""
+
+import atexit
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from filelock import FileLock
+from langchain.embeddings.base import Embeddings
+
+import config
+
+KEY_BYTES = 16
+
+# When the cache grows past its size limit, it is compacted down to this fraction
+# of the limit, so eviction does not run again on every flush.
+EVICTION_TARGET = 0.9
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    A drop-in `Embeddings` wrapper that caches vectors in a memory-mapped file.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        namespace: str,
+        cache_dir: str = config.EMBEDDING_CACHE_PATH,
+        max_size_mb: float = config.EMBEDDING_CACHE_MAX_MB,
+        flush_every: int = config.EMBEDDING_CACHE_FLUSH_EVERY,
+    ):
+        """
+        Args:
+            embeddings (Embeddings): The embedding model that computes cache misses.
+            namespace (str): Identifies the model and settings the vectors belong to.
+            cache_dir (str): The directory holding all cache namespaces.
+            max_size_mb (float): The maximum size of the vector file before eviction.
+            flush_every (int): Number of new vectors buffered before writing to disk.
+        """
+        self.embeddings = embeddings
+        self.namespace = namespace
+        self.path = os.path.join(cache_dir, hashlib.sha256(namespace.encode("utf-8")).hexdigest()[:16])
+        self.max_size_mb = max_size_mb
+        self.flush_every = flush_every
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.RLock()
+        self._pending: Dict[bytes, np.ndarray] = {}
+        self._touched: Dict[bytes, float] = {}
+        self._load()
+        atexit.register(self.flush)
+
+    # --- Embeddings interface ---
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds a list of texts, computing only the ones not in the cache.
+
+        Args:
+            texts (List[str]): The texts to embed.
+
+        Returns:
+            List[List[float]]: One embedding per text.
+        """
+        keys = [self._key(text) for text in texts]
+        results: List[Optional[np.ndarray]] = [None] * len(texts)
+        missing: Dict[bytes, List[int]] = {}
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._lookup(key)
+                if vector is None:
+                    missing.setdefault(key, []).append(i)
+                else:
+                    results[i] = vector
+            self.hits += len(texts) - sum(len(positions) for positions in missing.values())
+            self.misses += sum(len(positions) for positions in missing.values())
+
+        if missing:
+            miss_texts = [texts[positions[0]] for positions in missing.values()]
+            vectors = np.asarray(self.embeddings.embed_documents(miss_texts), dtype=np.float32)
+            with self._lock:
+                for (key, positions), vector in zip(missing.items(), vectors):
+                    self._store(key, vector)
+                    for i in positions:
+                        results[i] = vector
+                self._maybe_flush()
+
+        return [vector.tolist() for vector in results]
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Embeds a single query text, using the cache when possible.
+
+        Args:
+            text (str): The text to embed.
+
+        Returns:
+            List[float]: The embedding.
+        """
+        key = self._key(text)
+        with self._lock:
+            vector = self._lookup(key)
+            if vector is not None:
+                self.hits += 1
+                return vector.tolist()
+            self.misses += 1
+
+        vector = np.asarray(self.embeddings.embed_query(text), dtype=np.float32)
+        with self._lock:
+            self._store(key, vector)
+            self._maybe_flush()
+        return vector.tolist()
+
+    # --- Cache management ---
+
+    def stats(self) -> Dict:
+        """
+        Returns the hit/miss counters and the size of the cache.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            entries = len(self._index) + len(self._pending)
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries,
+                "size_mb": entries * (self._dim or 0) * 4 / 2**20,
+                "evictions": self.evictions,
+            }
+
+    def flush(self):
+        """
+        Writes buffered vectors and usage times to disk, evicting old entries if needed.
+        """
+        with self._lock:
+            if not self._pending and not self._touched:
+                return
+            os.makedirs(self.path, exist_ok=True)
+            with FileLock(os.path.join(self.path, ".lock")):
+                # Pick up entries written by other processes since the last load.
+                self._load()
+                keys, ticks = self._keys, self._ticks.copy()
+                for key, tick in self._touched.items():
+                    row = self._index.get(key)
+                    if row is not None:
+                        ticks[row] = max(ticks[row], tick)
+
+                new_items = [(key, vector) for key, vector in self._pending.items() if key not in self._index]
+                if new_items:
+                    dim = len(new_items[0][1])
+                    if self._dim is not None and self._dim != dim:
+                        raise ValueError(
+                            f"Embedding dimension {dim} does not match the cache ({self._dim})."
+                        )
+                    self._dim = dim
+                    self._write_rows(len(keys), np.stack([vector for _, vector in new_items]))
+                    new_keys = np.frombuffer(b"".join(key for key, _ in new_items), dtype=np.uint8)
+                    keys = np.concatenate([keys, new_keys.reshape(-1, KEY_BYTES)])
+                    ticks = np.concatenate(
+                        [ticks, np.array([self._touched.get(key, time.time()) for key, _ in new_items])]
+                    )
+
+                if self._dim is not None:
+                    capacity = max(1, int(self.max_size_mb * 2**20 // (self._dim * 4)))
+                    if len(keys) > capacity:
+                        keys, ticks = self._compact(keys, ticks, int(capacity * EVICTION_TARGET))
+
+                self._save_index(keys, ticks)
+                self._pending.clear()
+                self._touched.clear()
+                self._load()
+
+    # --- Internals ---
+
+    def _key(self, text: str) -> bytes:
+        return hashlib.sha256(f"{self.namespace}\0{text}".encode("utf-8")).digest()[:KEY_BYTES]
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _load(self):
+        """Loads the on-disk index and memory-maps the vector file."""
+        self._vectors = None
+        if os.path.exists(self._file("index.npz")):
+            with np.load(self._file("index.npz")) as index:
+                self._keys = index["keys"]
+                self._ticks = index["ticks"]
+                self._dim = int(index["dim"])
+                self._generation = int(index["generation"])
+        else:
+            self._keys = np.empty((0, KEY_BYTES), dtype=np.uint8)
+            self._ticks = np.empty(0, dtype=np.float64)
+            self._dim = None
+            self._generation = 0
+
+        self._index = {key.tobytes(): row for row, key in enumerate(self._keys)}
+        if len(self._keys):
+            self._vectors = np.memmap(
+                self._vector_file(), dtype=np.float32, mode="r", shape=(len(self._keys), self._dim)
+            )
+
+    def _vector_file(self, generation: Optional[int] = None) -> str:
+        generation = self._generation if generation is None else generation
+        return self._file(f"vectors-{generation}.f32")
+
+    def _lookup(self, key: bytes) -> Optional[np.ndarray]:
+        vector = self._pending.get(key)
+        if vector is None:
+            row = self._index.get(key)
+            if row is None:
+                return None
+            vector = np.array(self._vectors[row])
+        self._touched[key] = time.time()
+        return vector
+
+    def _store(self, key: bytes, vector: np.ndarray):
+        self._pending[key] = vector
+        self._touched[key] = time.time()
+
+    def _maybe_flush(self):
+        if len(self._pending) >= self.flush_every:
+            self.flush()
+
+    def _write_rows(self, start_row: int, vectors: np.ndarray):
+        """Writes vectors after the committed rows, dropping rows a crashed writer left behind."""
+        mode = "r+b" if os.path.exists(self._vector_file()) else "w+b"
+        with open(self._vector_file(), mode) as f:
+            f.seek(start_row * self._dim * 4)
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+            f.truncate()
+
+    def _compact(self, keys: np.ndarray, ticks: np.ndarray, keep: int):
+        """Copies the `keep` most recently used rows into a new vector file generation."""
+        rows = np.sort(np.argsort(-ticks, kind="stable")[:keep])
+        vectors = np.memmap(self._vector_file(), dtype=np.float32, mode="r", shape=(len(keys), self._dim))
+        with open(self._vector_file(self._generation + 1), "wb") as f:
+            for start in range(0, len(rows), 4096):
+                f.write(np.ascontiguousarray(vectors[rows[start:start + 4096]]).tobytes())
+        del vectors
+        self._vectors = None
+        self._generation += 1
+        self.evictions += len(keys) - len(rows)
+        return keys[rows], ticks[rows]
+
+    def _save_index(self, keys: np.ndarray, ticks: np.ndarray):
+        """Atomically replaces the index, then removes vector files it no longer uses."""
+        with open(self._file("index.npz.tmp"), "wb") as f:
+            np.savez(f, keys=keys, ticks=ticks, dim=self._dim, generation=self._generation)
+        os.replace(self._file("index.npz.tmp"), self._file("index.npz"))
+
+        with open(self._file("meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"namespace": self.namespace, "dim": self._dim}, f)
+        for name in os.listdir(self.path):
+            if name.startswith("vectors-") and name != os.path.basename(self._vector_file()):
+                try:
+                    os.remove(self._file(name))
+                except OSError:
+                    # Another process may still have the old generation mapped.
+                    pass
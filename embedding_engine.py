@@ -0,0 +1,207 @@
+"""
+This module embeds text on the CPU in length-sorted batches, optionally across processes.
+
+`HuggingFaceEmbeddings` encodes every call in the calling process, so on a many-core
+build machine embedding, the longest phase of the setup, leaves most cores idle.
+`EmbeddingEngine` encodes with the same sentence-transformer but:
+- sorts each call's texts by token length, so the texts of a forward batch of
+  `config.EMBEDDING_ENCODE_BATCH_SIZE` pad to about the same length, and
+- with `config.EMBEDDING_WORKERS` other than 1, hands large calls to a
+  sentence-transformers multi-process pool, with the CPU threads divided among
+  the workers.
+
+It counts the chunks and tokens it embeds and prints the throughput periodically.
+"""
+
+import atexit
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+
+import config
+
+
+class EmbeddingEngine(Embeddings):
+    """
+    A LangChain `Embeddings` implementation around a sentence-transformers model.
+    """
+
+    def __init__(
+        self,
+        model_name: str = config.EMBEDDING_MODEL_NAME,
+        model_kwargs: Optional[Dict] = None,
+        encode_kwargs: Optional[Dict] = None,
+        batch_size: int = config.EMBEDDING_ENCODE_BATCH_SIZE,
+        workers: Optional[int] = config.EMBEDDING_WORKERS,
+        report_every: float = config.EMBEDDING_REPORT_EVERY_SECONDS,
+    ):
+        """
+        Args:
+            model_name (str): The sentence-transformers model to load.
+            model_kwargs (Optional[Dict]): Keyword arguments for loading the model.
+            encode_kwargs (Optional[Dict]): Keyword arguments for encoding.
+            batch_size (int): Number of texts per forward pass.
+            workers (Optional[int]): Processes used for large calls; None uses one per
+                CPU core and 1 encodes in this process.
+            report_every (float): Seconds between throughput reports; 0 disables them.
+        """
+        self.model = self._load_model(
+            model_name, config.EMBEDDING_MODEL_KWARGS if model_kwargs is None else model_kwargs
+        )
+        self.encode_kwargs = dict(config.EMBEDDING_ENCODE_KWARGS if encode_kwargs is None else encode_kwargs)
+        self.batch_size = batch_size
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.report_every = report_every
+
+        self.chunks = 0
+        self.tokens = 0
+        self.seconds = 0.0
+        self._last_report = time.perf_counter()
+        self._pool = None
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    # --- Embeddings interface ---
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds a list of texts in length-sorted batches.
+
+        Args:
+            texts (List[str]): The texts to embed.
+
+        Returns:
+            List[List[float]]: One embedding per text, in input order.
+        """
+        if not texts:
+            return []
+        start = time.perf_counter()
+        texts = [self._clean(text) for text in texts]
+        lengths = self.token_lengths(texts)
+        order = np.argsort(lengths, kind="stable")[::-1]
+        sorted_texts = [texts[i] for i in order]
+
+        if self.workers > 1 and len(texts) > self.batch_size:
+            vectors = self.model.encode_multi_process(
+                sorted_texts,
+                self._get_pool(),
+                batch_size=self.batch_size,
+                chunk_size=-(-len(texts) // self.workers),
+                **self.encode_kwargs,
+            )
+        else:
+            vectors = self.model.encode(sorted_texts, batch_size=self.batch_size, **self.encode_kwargs)
+
+        embeddings = np.empty_like(vectors)
+        embeddings[order] = vectors
+        self._record(len(texts), int(lengths.sum()), time.perf_counter() - start)
+        return embeddings.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Embeds a single query text in this process.
+
+        Args:
+            text (str): The query text.
+
+        Returns:
+            List[float]: The embedding.
+        """
+        return self.model.encode([self._clean(text)], **self.encode_kwargs)[0].tolist()
+
+    # --- Batching and reporting ---
+
+    def token_lengths(self, texts: List[str]) -> np.ndarray:
+        """
+        Counts the tokens the model reads from each text, after truncation.
+
+        Args:
+            texts (List[str]): The texts.
+
+        Returns:
+            np.ndarray: The token count of each text, including special tokens.
+        """
+        encoded = self.model.tokenizer(
+            texts, truncation=True, max_length=self.model.max_seq_length, verbose=False
+        )
+        return np.fromiter((len(ids) for ids in encoded["input_ids"]), dtype=np.int64, count=len(texts))
+
+    def stats(self) -> Dict:
+        """
+        Returns the number of chunks and tokens embedded and the throughput.
+
+        Returns:
+            Dict: Chunks, tokens, seconds, chunks/sec, tokens/sec and worker count.
+        """
+        with self._lock:
+            seconds = self.seconds
+            return {
+                "chunks": self.chunks,
+                "tokens": self.tokens,
+                "seconds": seconds,
+                "chunks_per_second": self.chunks / seconds if seconds else 0.0,
+                "tokens_per_second": self.tokens / seconds if seconds else 0.0,
+                "workers": self.workers,
+            }
+
+    def report(self):
+        """Prints the throughput so far."""
+        stats = self.stats()
+        print(
+            f"Embedding: {stats['chunks']} chunks, {stats['tokens']:,} tokens in {stats['seconds']:.1f} s "
+            f"({stats['chunks_per_second']:.1f} chunks/s, {stats['tokens_per_second']:,.0f} tokens/s, "
+            f"{stats['workers']} worker{'s' if stats['workers'] != 1 else ''})."
+        )
+
+    def close(self):
+        """Stops the worker processes, if they were started."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            self.model.stop_multi_process_pool(pool)
+
+    def _load_model(self, model_name: str, model_kwargs: Dict):
+        """Loads the model; backends override this to load something else."""
+        from sentence_transformers import SentenceTransformer
+
+        return SentenceTransformer(model_name, **model_kwargs)
+
+    def _get_pool(self):
+        """Starts the worker processes on first use."""
+        with self._lock:
+            if self._pool is None:
+                # Spawned workers read the thread count when they import torch; give each
+                # an equal share of the cores instead of all of them.
+                threads = str(max(1, (os.cpu_count() or 1) // self.workers))
+                previous = os.environ.get("OMP_NUM_THREADS")
+                os.environ["OMP_NUM_THREADS"] = threads
+                try:
+                    self._pool = self.model.start_multi_process_pool(target_devices=["cpu"] * self.workers)
+                finally:
+                    if previous is None:
+                        del os.environ["OMP_NUM_THREADS"]
+                    else:
+                        os.environ["OMP_NUM_THREADS"] = previous
+            return self._pool
+
+    @staticmethod
+    def _clean(text: str) -> str:
+        # HuggingFaceEmbeddings encodes newlines as spaces; doing the same keeps the
+        # vectors, and the embedding cache entries, of existing stores valid.
+        return text.replace("\n", " ")
+
+    def _record(self, chunks: int, tokens: int, seconds: float):
+        with self._lock:
+            self.chunks += chunks
+            self.tokens += tokens
+            self.seconds += seconds
+            now = time.perf_counter()
+            due = self.report_every and now - self._last_report >= self.report_every
+            if due:
+                self._last_report = now
+        if due:
+            self.report()
@@ -5,6 +5,22 @@ import plotly.graph_objects as go
 import plotly.express as px
 from datetime import datetime, timedelta
 
+from finance_engine import (
+    MAX_PAYOFF_MONTHS,
+    emergency_fund_plan,
+    growth_schedule,
+    payoff_order,
+    retirement_plan,
+    simulate_debt_payoff,
+)
+from monte_carlo import retirement_success_grid, simulate_investment, simulate_retirement
+
+RETURN_MODEL_LABELS = {
+    "lognormal": "Lognormal",
+    "student_t": "Fat-Tailed (Student t)",
+    "normal": "Normal",
+}
+
 def compound_interest_calculator():
     """Calculate compound interest with visualization"""
     st.subheader("💰 Compound Interest Calculator")
@@ -17,23 +33,13 @@ def compound_interest_calculator():
         annual_rate = st.number_input("Annual Interest Rate (%)", min_value=0.0, value=7.0, step=0.1)
         years = st.number_input("Investment Period (Years)", min_value=1, value=30, step=1)
     
+    # Calculate compound interest, year by year
+    schedule = growth_schedule(principal, monthly_contribution, annual_rate / 100, int(years) * 12, step=12)
+    
     with col2:
-        # Calculate compound interest
-        monthly_rate = annual_rate / 100 / 12
-        months = years * 12
-        
-        # Future value of initial investment
-        fv_principal = principal * (1 + monthly_rate) ** months
-        
-        # Future value of monthly contributions (annuity)
-        if monthly_rate > 0:
-            fv_contributions = monthly_contribution * (((1 + monthly_rate) ** months - 1) / monthly_rate)
-        else:
-            fv_contributions = monthly_contribution * months
-        
-        total_future_value = fv_principal + fv_contributions
-        total_contributions = principal + (monthly_contribution * months)
-        total_interest = total_future_value - total_contributions
+        total_future_value = schedule.value[-1]
+        total_contributions = schedule.contributions[-1]
+        total_interest = schedule.interest[-1]
         
         st.metric("Future Value", f"${total_future_value:,.2f}")
         st.metric("Total Contributions", f"${total_contributions:,.2f}")
@@ -41,23 +47,12 @@ def compound_interest_calculator():
         st.metric("Return Multiple", f"{total_future_value/total_contributions:.2f}x")
     
     # Create visualization
-    year_data = []
-    current_value = principal
-    
-    for year in range(years + 1):
-        year_data.append({
-            'Year': year,
-            'Total Value': current_value,
-            'Contributions': principal + (monthly_contribution * 12 * year),
-            'Interest': current_value - (principal + (monthly_contribution * 12 * year))
-        })
-        
-        if year < years:
-            # Add monthly contributions and compound for one year
-            for month in range(12):
-                current_value = (current_value + monthly_contribution) * (1 + monthly_rate)
-    
-    df = pd.DataFrame(year_data)
+    df = pd.DataFrame({
+        'Year': schedule.years,
+        'Total Value': schedule.value,
+        'Contributions': schedule.contributions,
+        'Interest': schedule.interest
+    })
     
     fig = go.Figure()
     fig.add_trace(go.Scatter(x=df['Year'], y=df['Contributions'], 
@@ -97,32 +92,17 @@ def retirement_calculator():
         inflation_rate = st.number_input("Expected Inflation Rate (%)", min_value=0.0, value=3.0, step=0.1)
         life_expectancy = st.number_input("Life Expectancy", min_value=retirement_age, max_value=120, value=90)
     
-    # Calculations
-    years_to_retirement = retirement_age - current_age
-    years_in_retirement = life_expectancy - retirement_age
-    
-    # Calculate needed retirement income (adjusted for inflation)
-    future_income_needed = current_income * (income_replacement / 100) * ((1 + inflation_rate / 100) ** years_to_retirement)
-    
-    # Calculate total retirement needs (assuming 4% withdrawal rate)
-    total_retirement_needs = future_income_needed / 0.04
-    
-    # Future value of current savings
-    future_value_current = current_savings * ((1 + expected_return / 100) ** years_to_retirement)
-    
-    # Additional savings needed
-    additional_needed = max(0, total_retirement_needs - future_value_current)
-    
-    # Monthly savings required
-    if expected_return > 0:
-        monthly_rate = expected_return / 100 / 12
-        months = years_to_retirement * 12
-        if months > 0:
-            monthly_savings_needed = additional_needed * monthly_rate / (((1 + monthly_rate) ** months) - 1)
-        else:
-            monthly_savings_needed = 0
-    else:
-        monthly_savings_needed = additional_needed / (years_to_retirement * 12) if years_to_retirement > 0 else 0
+    # Calculations (assuming a 4% withdrawal rate)
+    plan = retirement_plan(
+        current_age, retirement_age, life_expectancy, current_income, income_replacement / 100,
+        current_savings, expected_return / 100, inflation_rate / 100
+    )
+    years_to_retirement = plan.years_to_retirement
+    future_income_needed = plan.future_income_needed
+    total_retirement_needs = plan.total_needs
+    future_value_current = plan.future_value_of_savings
+    additional_needed = plan.additional_needed
+    monthly_savings_needed = plan.monthly_savings_needed
     
     # Display results
     st.subheader("Retirement Analysis Results")
@@ -142,9 +122,93 @@ def retirement_calculator():
     
     # Progress bar
     if total_retirement_needs > 0:
-        progress = min(future_value_current / total_retirement_needs, 1.0)
+        progress = float(plan.progress)
         st.progress(progress)
         st.write(f"You're {progress:.1%} of the way to your retirement goal!")
+    
+    # Monte Carlo: random yearly returns while saving and while withdrawing, in today's dollars
+    st.subheader("🎲 Will Your Money Last?")
+    
+    method = st.radio(
+        "Projection", ["Expected Return Only", "Monte Carlo Simulation"], horizontal=True, key="retirement_method"
+    )
+    
+    if method == "Monte Carlo Simulation":
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            savings_rate = st.slider("Savings Rate (% of Income)", min_value=0, max_value=50, value=15)
+            volatility = st.number_input("Return Volatility (Standard Deviation %)", min_value=0.0, value=15.0, step=1.0)
+        
+        with col2:
+            model = st.selectbox(
+                "Return Distribution", list(RETURN_MODEL_LABELS), format_func=RETURN_MODEL_LABELS.get,
+                key="retirement_return_model"
+            )
+            n_paths = st.slider("Simulated Paths", min_value=1000, max_value=50000, value=10000, step=1000)
+            seed = st.number_input("Random Seed", min_value=0, value=42, step=1, key="retirement_seed")
+        
+        mc_inputs = dict(
+            current_age=int(current_age), life_expectancy=int(life_expectancy), current_income=float(current_income),
+            income_replacement=income_replacement / 100, current_savings=float(current_savings),
+            expected_return=expected_return / 100, volatility=volatility / 100, inflation_rate=inflation_rate / 100,
+            model=model, seed=int(seed)
+        )
+        simulation = simulate_retirement(
+            retirement_age=int(retirement_age), savings_rate=savings_rate / 100, n_paths=n_paths, **mc_inputs
+        )
+        at_retirement = min(max(int(retirement_age) - int(current_age), 0), len(simulation.ages) - 1)
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Probability Money Lasts", f"{simulation.success_probability:.1%}")
+        
+        with col2:
+            st.metric("Median Savings at Retirement", f"${simulation.band(50)[at_retirement]:,.0f}")
+        
+        with col3:
+            depletion_age = simulation.median_depletion_age
+            st.metric("Money Runs Out (Median, If It Does)", "Never" if np.isnan(depletion_age) else f"Age {depletion_age:.0f}")
+        
+        # Fan chart of savings by age
+        fig = go.Figure()
+        for low, high, color in [(5, 95, 'rgba(44, 160, 44, 0.15)'), (25, 75, 'rgba(44, 160, 44, 0.3)')]:
+            fig.add_trace(go.Scatter(
+                x=simulation.ages, y=simulation.band(high), mode='lines', line=dict(width=0),
+                showlegend=False, hoverinfo='skip'
+            ))
+            fig.add_trace(go.Scatter(
+                x=simulation.ages, y=simulation.band(low), mode='lines', line=dict(width=0), fill='tonexty',
+                fillcolor=color, name=f'{low}th-{high}th Percentile'
+            ))
+        fig.add_trace(go.Scatter(x=simulation.ages, y=simulation.band(50), mode='lines', name='Median', line=dict(color='#2ca02c')))
+        fig.add_vline(x=int(retirement_age), line_dash='dash', annotation_text='Retirement')
+        fig.update_layout(
+            title="Retirement Savings by Age (Today's Dollars)",
+            xaxis_title='Age',
+            yaxis_title='Savings ($)',
+            hovermode='x unified'
+        )
+        st.plotly_chart(fig, use_container_width=True)
+        
+        # Sensitivity of the probability of success to the savings rate and retirement age
+        savings_rates = sorted({min(max(savings_rate + step, 0), 100) for step in (-10, -5, 0, 5, 10)})
+        retirement_ages = sorted({
+            min(max(int(retirement_age) + step, int(current_age)), int(life_expectancy)) for step in (-6, -3, 0, 3, 6)
+        })
+        grid = retirement_success_grid(
+            tuple(rate / 100 for rate in savings_rates), tuple(retirement_ages), n_paths=min(n_paths, 5000), **mc_inputs
+        )
+        fig = go.Figure(go.Heatmap(
+            z=grid * 100, x=[str(age) for age in retirement_ages], y=[f"{rate}%" for rate in savings_rates],
+            colorscale='RdYlGn', zmin=0, zmax=100, texttemplate='%{z:.0f}%', colorbar=dict(title='Success (%)')
+        ))
+        fig.update_layout(
+            title='Probability Money Lasts by Savings Rate and Retirement Age',
+            xaxis_title='Retirement Age',
+            yaxis_title='Savings Rate (% of Income)'
+        )
+        st.plotly_chart(fig, use_container_width=True)
 
 def debt_payoff_calculator():
     """Calculate debt payoff strategies"""
@@ -190,57 +254,84 @@ def debt_payoff_calculator():
         # Extra payment amount
         extra_payment = st.number_input("Extra Monthly Payment ($)", min_value=0.0, value=200.0, step=50.0)
         
-        # Calculate debt avalanche (highest interest first) and snowball (smallest balance first)
-        col1, col2 = st.columns(2)
+        # Custom payoff order, as entered unless rearranged
+        debts = st.session_state.debts
+        custom_order = st.multiselect(
+            "Custom Payoff Order (first to last)", list(range(len(debts))),
+            default=list(range(len(debts))), format_func=lambda i: debts[i]['name']
+        )
+        custom_order += [i for i in range(len(debts)) if i not in custom_order]
         
-        with col1:
-            st.subheader("🏔️ Debt Avalanche (Highest Interest First)")
-            avalanche_debts = sorted(st.session_state.debts, key=lambda x: x['rate'], reverse=True)
-            avalanche_result = calculate_payoff_strategy(avalanche_debts, extra_payment)
-            
-            for debt in avalanche_result['order']:
-                st.write(f"**{debt['name']}**: ${debt['balance']:,.0f} at {debt['rate']:.1f}%")
-            
-            st.metric("Total Time to Payoff", f"{avalanche_result['months']} months")
-            st.metric("Total Interest Paid", f"${avalanche_result['total_interest']:,.0f}")
+        # Simulate avalanche (highest interest first), snowball (smallest balance first) and the
+        # custom order month by month, over a sweep of extra payments, in one batched run
+        balances = np.array([debt['balance'] for debt in debts])
+        rates = np.array([debt['rate'] for debt in debts]) / 100
+        min_payments = np.array([debt['min_payment'] for debt in debts])
+        strategies = {
+            "Avalanche": ("🏔️ Debt Avalanche (Highest Interest First)", payoff_order(balances, rates, "avalanche")),
+            "Snowball": ("⛄ Debt Snowball (Smallest Balance First)", payoff_order(balances, rates, "snowball")),
+            "Custom": ("🧭 Custom Order", np.array(custom_order)),
+        }
+        extra_payments = np.union1d(np.linspace(0, max(2 * extra_payment, 500), 41), [extra_payment])
+        chosen = int(np.searchsorted(extra_payments, extra_payment))
+        simulation = simulate_debt_payoff(
+            balances, rates, min_payments, np.stack([order for _, order in strategies.values()]), extra_payments
+        )
         
-        with col2:
-            st.subheader("⛄ Debt Snowball (Smallest Balance First)")
-            snowball_debts = sorted(st.session_state.debts, key=lambda x: x['balance'])
-            snowball_result = calculate_payoff_strategy(snowball_debts, extra_payment)
-            
-            for debt in snowball_result['order']:
-                st.write(f"**{debt['name']}**: ${debt['balance']:,.0f} at {debt['rate']:.1f}%")
-            
-            st.metric("Total Time to Payoff", f"{snowball_result['months']} months")
-            st.metric("Total Interest Paid", f"${snowball_result['total_interest']:,.0f}")
-
-def calculate_payoff_strategy(debts, extra_payment):
-    """Calculate debt payoff timeline and total interest"""
-    # This is a simplified calculation
-    total_months = 0
-    total_interest = 0
-    
-    for debt in debts:
-        balance = debt['balance']
-        monthly_rate = debt['rate'] / 100 / 12
-        payment = debt['min_payment'] + (extra_payment if debt == debts[0] else 0)
+        columns = st.columns(len(strategies))
+        for s, (column, (title, order)) in enumerate(zip(columns, strategies.values())):
+            with column:
+                st.subheader(title)
+                
+                for i in order:
+                    debt = debts[i]
+                    paid_off = format_months(simulation.payoff_month[s, chosen, i])
+                    st.write(f"**{debt['name']}**: ${debt['balance']:,.0f} at {debt['rate']:.1f}% (paid off: {paid_off})")
+                
+                st.metric("Total Time to Payoff", format_months(simulation.months[s, chosen]))
+                st.metric("Total Interest Paid", format_amount(simulation.total_interest[s, chosen]))
         
-        if monthly_rate > 0 and payment > balance * monthly_rate:
-            months = -np.log(1 - (balance * monthly_rate) / payment) / np.log(1 + monthly_rate)
-            interest = (payment * months) - balance
-        else:
-            months = balance / payment if payment > 0 else float('inf')
-            interest = 0
+        # Remaining debt over time at the chosen extra payment
+        finished = simulation.months[:, chosen]
+        horizon = int(finished[np.isfinite(finished)].max(initial=0)) or simulation.balances.shape[2] - 1
+        fig = go.Figure()
+        for s, name in enumerate(strategies):
+            remaining = simulation.balances[s, chosen, :horizon + 1].sum(axis=1)
+            fig.add_trace(go.Scatter(x=np.arange(len(remaining)), y=remaining, mode='lines', name=name))
+        fig.update_layout(
+            title='Remaining Debt Over Time',
+            xaxis_title='Months',
+            yaxis_title='Balance ($)',
+            hovermode='x unified'
+        )
+        st.plotly_chart(fig, use_container_width=True)
         
-        total_months = max(total_months, months)
-        total_interest += interest
-    
-    return {
-        'months': int(total_months),
-        'total_interest': total_interest,
-        'order': debts
-    }
+        # Extra payment vs. interest saved
+        interest_saved = simulation.interest_saved()
+        fig = go.Figure()
+        for s, name in enumerate(strategies):
+            fig.add_trace(go.Scatter(x=extra_payments, y=interest_saved[s], mode='lines', name=name))
+        fig.update_layout(
+            title='Interest Saved by Extra Monthly Payments',
+            xaxis_title='Extra Monthly Payment ($)',
+            yaxis_title='Interest Saved ($)',
+            hovermode='x unified'
+        )
+        st.plotly_chart(fig, use_container_width=True)
+        if np.isinf(simulation.total_interest[:, 0]).any():
+            st.caption("Without an extra payment the minimum payments never pay the debts off, so no savings are shown against it.")
+
+def format_months(months):
+    """Format a payoff time in months, which is infinite if the debt is never paid off"""
+    if not np.isfinite(months):
+        return f"never (over {MAX_PAYOFF_MONTHS // 12} years)"
+    return f"{int(months)} months"
+
+def format_amount(amount):
+    """Format a payoff total, which is infinite if the debt is never paid off"""
+    if not np.isfinite(amount):
+        return "never paid off"
+    return f"${amount:,.0f}"
 
 def emergency_fund_calculator():
     """Calculate emergency fund needs"""
@@ -255,9 +346,10 @@ def emergency_fund_calculator():
         monthly_savings_capacity = st.number_input("Monthly Savings Capacity ($)", min_value=0.0, value=300.0, step=50.0)
     
     with col2:
-        target_emergency_fund = monthly_expenses * months_coverage
-        shortfall = max(0, target_emergency_fund - current_emergency_fund)
-        months_to_goal = shortfall / monthly_savings_capacity if monthly_savings_capacity > 0 else float('inf')
+        plan = emergency_fund_plan(monthly_expenses, months_coverage, current_emergency_fund, monthly_savings_capacity)
+        target_emergency_fund = plan.target
+        shortfall = plan.shortfall
+        months_to_goal = plan.months_to_goal
         
         st.metric("Target Emergency Fund", f"${target_emergency_fund:,.0f}")
         st.metric("Current Emergency Fund", f"${current_emergency_fund:,.0f}")
@@ -269,7 +361,7 @@ def emergency_fund_calculator():
             st.metric("Months to Goal", "∞")
     
     # Progress visualization
-    progress = min(current_emergency_fund / target_emergency_fund, 1.0) if target_emergency_fund > 0 else 0
+    progress = float(plan.progress)
     st.progress(progress)
     st.write(f"Emergency Fund Progress: {progress:.1%}")
 
@@ -284,23 +376,64 @@ def investment_risk_calculator():
         expected_return = st.number_input("Expected Annual Return (%)", min_value=0.0, value=7.0, step=0.5)
         volatility = st.number_input("Expected Volatility (Standard Deviation %)", min_value=0.0, value=15.0, step=1.0)
         time_horizon = st.number_input("Time Horizon (Years)", min_value=1, value=10, step=1)
+        method = st.radio("Method", ["Monte Carlo Simulation", "Fixed Return Scenarios"], horizontal=True)
+        
+        if method == "Monte Carlo Simulation":
+            model = st.selectbox("Return Distribution", list(RETURN_MODEL_LABELS), format_func=RETURN_MODEL_LABELS.get)
+            n_paths = st.slider("Simulated Paths", min_value=1000, max_value=100000, value=20000, step=1000)
+            seed = st.number_input("Random Seed", min_value=0, value=42, step=1)
+    
+    if method == "Fixed Return Scenarios":
+        with col2:
+            # Compound at the expected return plus or minus one standard deviation every year
+            best_case = investment_amount * ((1 + (expected_return + volatility) / 100) ** time_horizon)
+            expected_case = investment_amount * ((1 + expected_return / 100) ** time_horizon)
+            worst_case = investment_amount * ((1 + max(expected_return - volatility, -50) / 100) ** time_horizon)
+            
+            st.metric("Best Case Scenario", f"${best_case:,.0f}")
+            st.metric("Expected Case", f"${expected_case:,.0f}")
+            st.metric("Worst Case Scenario", f"${worst_case:,.0f}")
+            
+            # Risk metrics
+            potential_gain = expected_case - investment_amount
+            potential_loss = investment_amount - worst_case
+            
+            st.metric("Potential Gain", f"${potential_gain:,.0f}")
+            st.metric("Potential Loss", f"${potential_loss:,.0f}")
+        return
+    
+    result = simulate_investment(
+        investment_amount, expected_return / 100, volatility / 100, int(time_horizon),
+        n_paths=n_paths, model=model, seed=int(seed)
+    )
     
     with col2:
-        # Calculate scenarios
-        best_case = investment_amount * ((1 + (expected_return + volatility) / 100) ** time_horizon)
-        expected_case = investment_amount * ((1 + expected_return / 100) ** time_horizon)
-        worst_case = investment_amount * ((1 + max(expected_return - volatility, -50) / 100) ** time_horizon)
-        
-        st.metric("Best Case Scenario", f"${best_case:,.0f}")
-        st.metric("Expected Case", f"${expected_case:,.0f}")
-        st.metric("Worst Case Scenario", f"${worst_case:,.0f}")
-        
-        # Risk metrics
-        potential_gain = expected_case - investment_amount
-        potential_loss = investment_amount - worst_case
-        
-        st.metric("Potential Gain", f"${potential_gain:,.0f}")
-        st.metric("Potential Loss", f"${potential_loss:,.0f}")
+        st.metric("Median Outcome", f"${result.band(50)[-1]:,.0f}")
+        st.metric("Average Outcome", f"${result.mean_final:,.0f}")
+        st.metric("Bad Outcome (5th Percentile)", f"${result.band(5)[-1]:,.0f}")
+        st.metric("Good Outcome (95th Percentile)", f"${result.band(95)[-1]:,.0f}")
+        st.metric("Probability of Loss", f"{result.probability_of_loss:.1%}")
+    
+    # Fan chart: the 5-95 and 25-75 percentile bands around the median
+    fig = go.Figure()
+    for low, high, color in [(5, 95, 'rgba(31, 119, 180, 0.15)'), (25, 75, 'rgba(31, 119, 180, 0.3)')]:
+        fig.add_trace(go.Scatter(
+            x=result.years, y=result.band(high), mode='lines', line=dict(width=0),
+            showlegend=False, hoverinfo='skip'
+        ))
+        fig.add_trace(go.Scatter(
+            x=result.years, y=result.band(low), mode='lines', line=dict(width=0), fill='tonexty',
+            fillcolor=color, name=f'{low}th-{high}th Percentile'
+        ))
+    fig.add_trace(go.Scatter(x=result.years, y=result.band(50), mode='lines', name='Median', line=dict(color='#1f77b4')))
+    fig.add_hline(y=investment_amount, line_dash='dash', annotation_text='Amount Invested')
+    fig.update_layout(
+        title=f'Range of Outcomes ({result.n_paths:,} Simulated Paths)',
+        xaxis_title='Years',
+        yaxis_title='Value ($)',
+        hovermode='x unified'
+    )
+    st.plotly_chart(fig, use_container_width=True)
 
 def render_financial_calculators():
     """Main function to render all financial calculators"""
@@ -0,0 +1,537 @@
+"""
+This module implements the math behind the financial planning calculators.
+
+The functions here know nothing about Streamlit. Each one takes scalars or NumPy
+arrays, broadcasts them against each other, and computes every projection at once
+with closed-form formulas or cumulative products instead of Python loops. A single
+projection, a 100-year monthly schedule, or thousands of client projections all cost
+a handful of array operations.
+
+Rates are fractions (0.07 for 7%) and periods are months unless a name says otherwise.
+Scalar inputs give scalar outputs.
+"""
+
+from dataclasses import dataclass
+from typing import Union
+
+import numpy as np
+
+ArrayLike = Union[float, np.ndarray]
+
+MONTHS_PER_YEAR = 12
+
+# Share of a retirement nest egg that can be withdrawn in the first year.
+DEFAULT_WITHDRAWAL_RATE = 0.04
+
+
+def _out(values: np.ndarray) -> ArrayLike:
+    """Returns 0-d results as NumPy scalars, so they format like floats."""
+    return np.asarray(values)[()]
+
+
+def growth_factor(rate: ArrayLike, periods: ArrayLike) -> np.ndarray:
+    """
+    Returns (1 + rate) ** periods.
+
+    Args:
+        rate (ArrayLike): The rate per period.
+        periods (ArrayLike): The number of periods.
+
+    Returns:
+        np.ndarray: The growth factors.
+    """
+    return np.exp(np.asarray(periods, dtype=np.float64) * np.log1p(np.asarray(rate, dtype=np.float64)))
+
+
+def annuity_factor(rate: ArrayLike, periods: ArrayLike) -> np.ndarray:
+    """
+    Returns the future value of 1 paid at the end of each period.
+
+    This is ((1 + rate) ** periods - 1) / rate, and `periods` where the rate is 0.
+
+    Args:
+        rate (ArrayLike): The rate per period.
+        periods (ArrayLike): The number of periods.
+
+    Returns:
+        np.ndarray: The annuity factors.
+    """
+    rate = np.asarray(rate, dtype=np.float64)
+    periods = np.asarray(periods, dtype=np.float64)
+    safe_rate = np.where(rate == 0, 1.0, rate)
+    return np.where(rate == 0, periods, np.expm1(periods * np.log1p(rate)) / safe_rate)
+
+
+def future_value(
+    principal: ArrayLike,
+    monthly_contribution: ArrayLike,
+    annual_rate: ArrayLike,
+    months: ArrayLike,
+) -> ArrayLike:
+    """
+    Returns the value of an investment with monthly compounding and contributions.
+
+    Contributions are made at the end of each month.
+
+    Args:
+        principal (ArrayLike): The initial investment.
+        monthly_contribution (ArrayLike): The amount added every month.
+        annual_rate (ArrayLike): The nominal annual rate, compounded monthly.
+        months (ArrayLike): The investment period in months.
+
+    Returns:
+        ArrayLike: The future values.
+    """
+    monthly_rate = np.asarray(annual_rate, dtype=np.float64) / MONTHS_PER_YEAR
+    return _out(
+        np.asarray(principal) * growth_factor(monthly_rate, months)
+        + np.asarray(monthly_contribution) * annuity_factor(monthly_rate, months)
+    )
+
+
+@dataclass
+class GrowthSchedule:
+    """The value of an investment at regular points in time."""
+
+    months: np.ndarray
+    value: np.ndarray
+    contributions: np.ndarray
+    interest: np.ndarray
+
+    @property
+    def years(self) -> np.ndarray:
+        """The schedule's points in time, in years."""
+        return self.months / MONTHS_PER_YEAR
+
+
+def growth_schedule(
+    principal: ArrayLike,
+    monthly_contribution: ArrayLike,
+    annual_rate: ArrayLike,
+    months: int,
+    step: int = 1,
+) -> GrowthSchedule:
+    """
+    Projects an investment with monthly compounding and contributions over time.
+
+    Every point is evaluated in closed form, so the schedule agrees exactly with
+    `future_value`. Array inputs add leading dimensions to the results.
+
+    Args:
+        principal (ArrayLike): The initial investment.
+        monthly_contribution (ArrayLike): The amount added at the end of every month.
+        annual_rate (ArrayLike): The nominal annual rate, compounded monthly.
+        months (int): The length of the projection in months.
+        step (int): Months between points; 12 gives a yearly schedule.
+
+    Returns:
+        GrowthSchedule: The value, contributions and interest at months 0, step,
+        2 * step, ... up to `months`, along the last axis.
+    """
+    points = np.arange(0, months + 1, step)
+    principal = np.asarray(principal, dtype=np.float64)[..., None]
+    monthly_contribution = np.asarray(monthly_contribution, dtype=np.float64)[..., None]
+    annual_rate = np.asarray(annual_rate, dtype=np.float64)[..., None]
+    value = future_value(principal, monthly_contribution, annual_rate, points)
+    contributions = principal + monthly_contribution * points
+    return GrowthSchedule(points, value, contributions, value - contributions)
+
+
+@dataclass
+class RetirementPlan:
+    """How much a retirement needs and how much must be saved for it."""
+
+    years_to_retirement: ArrayLike
+    years_in_retirement: ArrayLike
+    future_income_needed: ArrayLike
+    total_needs: ArrayLike
+    future_value_of_savings: ArrayLike
+    additional_needed: ArrayLike
+    monthly_savings_needed: ArrayLike
+    progress: ArrayLike
+
+
+def retirement_plan(
+    current_age: ArrayLike,
+    retirement_age: ArrayLike,
+    life_expectancy: ArrayLike,
+    current_income: ArrayLike,
+    income_replacement: ArrayLike,
+    current_savings: ArrayLike,
+    expected_return: ArrayLike,
+    inflation_rate: ArrayLike,
+    withdrawal_rate: ArrayLike = DEFAULT_WITHDRAWAL_RATE,
+) -> RetirementPlan:
+    """
+    Sizes a retirement nest egg and the monthly savings that reach it.
+
+    The income needed is today's income times the replacement ratio, inflated to the
+    retirement date; the nest egg is that income divided by the withdrawal rate.
+    Current savings grow at the expected return compounded yearly, and the gap is
+    closed by monthly savings compounded monthly.
+
+    Args:
+        current_age (ArrayLike): Age today, in years.
+        retirement_age (ArrayLike): Age at retirement, in years.
+        life_expectancy (ArrayLike): Age at the end of retirement, in years.
+        current_income (ArrayLike): Annual income today.
+        income_replacement (ArrayLike): Share of today's income needed in retirement.
+        current_savings (ArrayLike): Retirement savings today.
+        expected_return (ArrayLike): Annual return on savings.
+        inflation_rate (ArrayLike): Annual inflation.
+        withdrawal_rate (ArrayLike): Share of the nest egg withdrawn in the first year.
+
+    Returns:
+        RetirementPlan: The plan, with one value per broadcast input.
+    """
+    years_to_retirement = np.asarray(retirement_age) - np.asarray(current_age)
+    future_income_needed = (
+        np.asarray(current_income, dtype=np.float64)
+        * np.asarray(income_replacement)
+        * growth_factor(inflation_rate, years_to_retirement)
+    )
+    total_needs = future_income_needed / np.asarray(withdrawal_rate)
+    future_value_of_savings = np.asarray(current_savings, dtype=np.float64) * growth_factor(
+        expected_return, years_to_retirement
+    )
+    additional_needed = np.maximum(0.0, total_needs - future_value_of_savings)
+
+    months = years_to_retirement * MONTHS_PER_YEAR
+    factor = annuity_factor(np.asarray(expected_return, dtype=np.float64) / MONTHS_PER_YEAR, months)
+    monthly_savings_needed = np.where(months > 0, additional_needed / np.where(months > 0, factor, 1.0), 0.0)
+    safe_needs = np.where(total_needs > 0, total_needs, 1.0)
+    progress = np.where(total_needs > 0, np.minimum(future_value_of_savings / safe_needs, 1.0), 0.0)
+
+    return RetirementPlan(
+        years_to_retirement=_out(years_to_retirement),
+        years_in_retirement=_out(np.asarray(life_expectancy) - np.asarray(retirement_age)),
+        future_income_needed=_out(future_income_needed),
+        total_needs=_out(total_needs),
+        future_value_of_savings=_out(future_value_of_savings),
+        additional_needed=_out(additional_needed),
+        monthly_savings_needed=_out(monthly_savings_needed),
+        progress=_out(progress),
+    )
+
+
+@dataclass
+class EmergencyFundPlan:
+    """How far an emergency fund is from its target and how long it takes to get there."""
+
+    target: ArrayLike
+    shortfall: ArrayLike
+    months_to_goal: ArrayLike
+    progress: ArrayLike
+
+
+def emergency_fund_plan(
+    monthly_expenses: ArrayLike,
+    months_coverage: ArrayLike,
+    current_fund: ArrayLike,
+    monthly_savings: ArrayLike,
+    annual_rate: ArrayLike = 0.0,
+) -> EmergencyFundPlan:
+    """
+    Sizes an emergency fund and the time needed to fill it.
+
+    Args:
+        monthly_expenses (ArrayLike): Monthly living expenses.
+        months_coverage (ArrayLike): Months of expenses the fund should cover.
+        current_fund (ArrayLike): The fund's balance today.
+        monthly_savings (ArrayLike): The amount added at the end of every month.
+        annual_rate (ArrayLike): Interest earned by the fund, compounded monthly.
+
+    Returns:
+        EmergencyFundPlan: The plan; `months_to_goal` is fractional, 0 if the fund is
+        already full and infinite if it never fills.
+    """
+    current_fund = np.asarray(current_fund, dtype=np.float64)
+    monthly_savings = np.asarray(monthly_savings, dtype=np.float64)
+    monthly_rate = np.asarray(annual_rate, dtype=np.float64) / MONTHS_PER_YEAR
+    target = np.asarray(monthly_expenses, dtype=np.float64) * np.asarray(months_coverage)
+    shortfall = np.maximum(0.0, target - current_fund)
+
+    # Solve current * G + savings * (G - 1) / r = target for G = (1 + r) ** n.
+    safe_rate = np.where(monthly_rate > 0, monthly_rate, 1.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        months_without_interest = shortfall / monthly_savings
+        growth_needed = (target + monthly_savings / safe_rate) / (current_fund + monthly_savings / safe_rate)
+        months_with_interest = np.log(growth_needed) / np.log1p(safe_rate)
+    months_to_goal = np.where(monthly_rate > 0, months_with_interest, months_without_interest)
+    months_to_goal = np.where(shortfall == 0, 0.0, months_to_goal)
+    months_to_goal = np.where(
+        (shortfall > 0) & (monthly_savings <= 0) & ((monthly_rate <= 0) | (current_fund <= 0)), np.inf, months_to_goal
+    )
+    safe_target = np.where(target > 0, target, 1.0)
+    progress = np.where(target > 0, np.minimum(current_fund / safe_target, 1.0), 0.0)
+
+    return EmergencyFundPlan(
+        target=_out(target),
+        shortfall=_out(shortfall),
+        months_to_goal=_out(months_to_goal),
+        progress=_out(progress),
+    )
+
+
+def emergency_fund_schedule(
+    current_fund: ArrayLike,
+    monthly_savings: ArrayLike,
+    target: ArrayLike,
+    months: int,
+    annual_rate: ArrayLike = 0.0,
+) -> np.ndarray:
+    """
+    Projects an emergency fund's balance month by month until it reaches its target.
+
+    Saving stops once the target is reached, so the balance is capped there.
+
+    Args:
+        current_fund (ArrayLike): The fund's balance today.
+        monthly_savings (ArrayLike): The amount added at the end of every month.
+        target (ArrayLike): The balance at which saving stops.
+        months (int): The length of the projection in months.
+        annual_rate (ArrayLike): Interest earned by the fund, compounded monthly.
+
+    Returns:
+        np.ndarray: The balance at months 0..`months`, along the last axis.
+    """
+    points = np.arange(months + 1)
+    balance = future_value(
+        np.asarray(current_fund, dtype=np.float64)[..., None],
+        np.asarray(monthly_savings, dtype=np.float64)[..., None],
+        np.asarray(annual_rate, dtype=np.float64)[..., None],
+        points,
+    )
+    target = np.asarray(target, dtype=np.float64)[..., None]
+    return np.where(balance >= target, np.maximum(target, np.asarray(current_fund)[..., None]), balance)
+
+
+# Longest debt payoff simulated; plans that take longer are reported as never paid off.
+MAX_PAYOFF_MONTHS = 1200
+
+# Balances below this are treated as paid off, to absorb floating point residue.
+PAID_OFF_EPSILON = 1e-6
+
+
+def payoff_order(balances: np.ndarray, annual_rates: np.ndarray, strategy: str) -> np.ndarray:
+    """
+    Returns the order in which a strategy pays extra money toward debts.
+
+    Args:
+        balances (np.ndarray): The balance of each debt.
+        annual_rates (np.ndarray): The annual interest rate of each debt.
+        strategy (str): "avalanche" (highest rate first, then smallest balance) or
+            "snowball" (smallest balance first, then highest rate).
+
+    Returns:
+        np.ndarray: The debt indices, first target first.
+
+    Raises:
+        ValueError: If the strategy is unknown.
+    """
+    balances = np.asarray(balances, dtype=np.float64)
+    annual_rates = np.asarray(annual_rates, dtype=np.float64)
+    if strategy == "avalanche":
+        return np.lexsort((balances, -annual_rates))
+    if strategy == "snowball":
+        return np.lexsort((-annual_rates, balances))
+    raise ValueError(f"Unknown payoff strategy: {strategy!r}")
+
+
+@dataclass
+class PayoffSimulation:
+    """
+    The month-by-month payoff of a set of debts under several orders and extra payments.
+
+    Results have leading dimensions (orders, extra payments).
+    """
+
+    extra_payments: np.ndarray
+    # Months until the last debt is paid off; infinite if not within MAX_PAYOFF_MONTHS.
+    months: np.ndarray
+    # Interest and payments until the last debt is paid off; infinite if it never is.
+    total_interest: np.ndarray
+    total_paid: np.ndarray
+    # Month in which each debt is paid off; infinite if it never is.
+    payoff_month: np.ndarray
+    # Interest paid on each debt; infinite if it is never paid off.
+    interest_by_debt: np.ndarray
+    # Balance of each debt at the start and the end of every month, (..., months + 1, debts).
+    balances: np.ndarray
+
+    def interest_saved(self) -> np.ndarray:
+        """
+        Interest saved by each extra payment relative to the first, usually 0.
+
+        NaN where either payment never pays the debts off.
+        """
+        first = self.total_interest[..., :1]
+        paid_off = np.isfinite(first) & np.isfinite(self.total_interest)
+        return np.subtract(
+            first, self.total_interest, out=np.full(self.total_interest.shape, np.nan), where=paid_off
+        )
+
+
+def _pay_month(balance: np.ndarray, rates: np.ndarray, minimums: np.ndarray, budget: np.ndarray):
+    """
+    Accrues a month of interest and spends the monthly budget, for (scenarios, debts)
+    arrays in payment order. Returns the new balances and the interest accrued.
+    """
+    accrued = balance * rates
+    balance = balance + accrued
+    minimum = np.minimum(minimums, balance)
+    leftover = budget - minimum.sum(axis=1, keepdims=True)
+    remaining = balance - minimum
+    # Each debt gets what is left after the debts before it are paid in full.
+    before = np.cumsum(remaining, axis=1) - remaining
+    balance = remaining - np.clip(leftover - before, 0.0, remaining)
+    balance[balance <= PAID_OFF_EPSILON] = 0.0
+    return balance, accrued
+
+
+def simulate_debt_payoff(
+    balances: np.ndarray,
+    annual_rates: np.ndarray,
+    min_payments: np.ndarray,
+    orders: np.ndarray,
+    extra_payments: ArrayLike = 0.0,
+    max_months: int = MAX_PAYOFF_MONTHS,
+) -> PayoffSimulation:
+    """
+    Simulates paying off several debts together, month by month, with rollover.
+
+    Each month interest accrues on every balance, then the monthly budget is spent:
+    first the minimum payment of every open debt, then everything left over goes to
+    the open debts in the given order. The budget is the sum of all minimum payments
+    plus the extra payment and stays the same as debts are paid off, so a paid-off
+    debt's minimum rolls over to the next one.
+
+    All orders and extra payments are simulated at once as one array of scenarios.
+
+    Args:
+        balances (np.ndarray): The balance of each debt.
+        annual_rates (np.ndarray): The annual interest rate of each debt, compounded monthly.
+        min_payments (np.ndarray): The minimum monthly payment of each debt.
+        orders (np.ndarray): One or more orders to pay extra money in, (orders, debts),
+            each a permutation of the debt indices, first target first.
+        extra_payments (ArrayLike): The extra monthly payments to simulate.
+        max_months (int): The longest payoff simulated.
+
+    Returns:
+        PayoffSimulation: The results of every (order, extra payment) scenario.
+    """
+    balances = np.asarray(balances, dtype=np.float64)
+    monthly_rates = np.asarray(annual_rates, dtype=np.float64) / MONTHS_PER_YEAR
+    min_payments = np.asarray(min_payments, dtype=np.float64)
+    orders = np.atleast_2d(np.asarray(orders, dtype=np.int64))
+    extra_payments = np.atleast_1d(np.asarray(extra_payments, dtype=np.float64))
+    n_orders, n_extras, n_debts = len(orders), len(extra_payments), len(balances)
+
+    # Scenarios are (order, extra payment) pairs; debts are kept in payment order.
+    order = np.repeat(orders, n_extras, axis=0)
+    rates = monthly_rates[order]
+    minimums = min_payments[order]
+    budget = (min_payments.sum() + np.tile(extra_payments, n_orders))[:, None]
+    balance = balances[order]
+    interest = np.zeros_like(balance)
+    paid_off = np.where(balance <= PAID_OFF_EPSILON, 0.0, np.inf)
+    history = [balance]
+
+    for month in range(1, max_months + 1):
+        if not np.isinf(paid_off).any():
+            break
+        balance, accrued = _pay_month(balance, rates, minimums, budget)
+        interest += accrued
+        paid_off[(balance == 0.0) & np.isinf(paid_off)] = month
+        history.append(balance)
+
+    # Return per-debt results in the caller's debt order.
+    unsort = np.argsort(order, axis=1)
+    rows = np.arange(len(order))[:, None]
+    shape = (n_orders, n_extras)
+    history = np.stack(history, axis=1)[rows[:, :, None], np.arange(len(history))[None, :, None], unsort[:, None, :]]
+    paid_off = paid_off[rows, unsort]
+    # Interest on a debt that is never paid off keeps compounding without bound.
+    interest = np.where(np.isinf(paid_off), np.inf, interest[rows, unsort])
+    months = paid_off.max(axis=1) if n_debts else np.zeros(len(order))
+    total_interest = interest.sum(axis=1)
+    return PayoffSimulation(
+        extra_payments=extra_payments,
+        months=months.reshape(shape),
+        total_interest=total_interest.reshape(shape),
+        total_paid=(balances.sum() + total_interest).reshape(shape),
+        payoff_month=paid_off.reshape(shape + (n_debts,)),
+        interest_by_debt=interest.reshape(shape + (n_debts,)),
+        balances=history.reshape(shape + history.shape[1:]),
+    )
+
+
+@dataclass
+class PayoffTotals:
+    """The totals of paying off many independent sets of debts, one per row."""
+
+    # Months until the last debt is paid off; infinite if not within MAX_PAYOFF_MONTHS.
+    months: np.ndarray
+    # Interest and payments until the last debt is paid off; infinite if it never is.
+    total_interest: np.ndarray
+    total_paid: np.ndarray
+
+
+def debt_payoff_totals(
+    balances: np.ndarray,
+    annual_rates: np.ndarray,
+    min_payments: np.ndarray,
+    orders: np.ndarray,
+    extra_payments: ArrayLike = 0.0,
+    max_months: int = MAX_PAYOFF_MONTHS,
+) -> PayoffTotals:
+    """
+    Pays off a different set of debts in every row, with the rules of `simulate_debt_payoff`.
+
+    Rows whose debts are all paid off drop out of the simulation, and no balance
+    history is kept, so thousands of client profiles cost about as much as the
+    longest payoff among them. Rows with fewer debts can pad with zero balances.
+
+    Args:
+        balances (np.ndarray): The balance of each debt, (rows, debts).
+        annual_rates (np.ndarray): The annual interest rate of each debt, (rows, debts).
+        min_payments (np.ndarray): The minimum monthly payment of each debt, (rows, debts).
+        orders (np.ndarray): The order to pay extra money in for each row, (rows, debts),
+            e.g. from `payoff_order`.
+        extra_payments (ArrayLike): The extra monthly payment of each row.
+        max_months (int): The longest payoff simulated.
+
+    Returns:
+        PayoffTotals: The payoff time, interest and total paid of each row.
+    """
+    balances = np.atleast_2d(np.asarray(balances, dtype=np.float64))
+    rows = np.arange(len(balances))[:, None]
+    orders = np.asarray(orders, dtype=np.int64)
+    balance = balances[rows, orders]
+    rates = (np.asarray(annual_rates, dtype=np.float64) / MONTHS_PER_YEAR)[rows, orders]
+    minimums = np.asarray(min_payments, dtype=np.float64)[rows, orders]
+    budget = (minimums.sum(axis=1) + np.broadcast_to(extra_payments, len(balances)))[:, None]
+    balance = np.where(balance <= PAID_OFF_EPSILON, 0.0, balance)
+
+    months = np.full(len(balances), np.inf)
+    interest = np.zeros(len(balances))
+    active = np.flatnonzero(balance.any(axis=1))
+    months[np.setdiff1d(rows[:, 0], active)] = 0
+    balance, rates, minimums, budget = balance[active], rates[active], minimums[active], budget[active]
+    for month in range(1, max_months + 1):
+        if not len(active):
+            break
+        balance, accrued = _pay_month(balance, rates, minimums, budget)
+        interest[active] += accrued.sum(axis=1)
+        open_rows = balance.any(axis=1)
+        months[active[~open_rows]] = month
+        if not open_rows.all():
+            active, balance = active[open_rows], balance[open_rows]
+            rates, minimums, budget = rates[open_rows], minimums[open_rows], budget[open_rows]
+
+    interest[np.isinf(months)] = np.inf
+    return PayoffTotals(
+        months=months,
+        total_interest=interest,
+        total_paid=balances.sum(axis=1) + interest,
+    )
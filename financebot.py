@@ -11,12 +11,16 @@ import warnings
 from dotenv import load_dotenv, find_dotenv
 
 from langchain.chains import RetrievalQA
-from langchain_community.vectorstores import FAISS
 from langchain_core.prompts import PromptTemplate
 
 from auth.google_oauth import get_login_url, fetch_tokens, get_user_info
 from finance_calculators import render_financial_calculators
-from Resources import load_embedding_model, load_llm
+from Resources import load_vector_store, load_llm
+from retrieval_cache import CachedRetriever, get_retrieval_cache
+from answer_cache import answer_question
+from answer_streaming import StreamingAnswer
+from llm_client import get_llm_gate
+from metadata_index import MetadataFilter, load_metadata_index
 import config
 
 # --- Load Environment Variables ---
@@ -58,12 +62,7 @@ def create_qa_chain():
         RetrievalQA: The question-answering chain.
     """
     # Load the FAISS vector store
-    embedding_model = load_embedding_model()
-    db = FAISS.load_local(
-        config.DB_FAISS_PATH,
-        embedding_model,
-        allow_dangerous_deserialization=True,
-    )
+    db = load_vector_store()
 
     # Create a prompt template
     prompt = PromptTemplate(
@@ -74,8 +73,10 @@ def create_qa_chain():
     return RetrievalQA.from_chain_type(
         llm=load_llm(),
         chain_type="stuff",
-        retriever=db.as_retriever(
-            search_type="similarity", search_kwargs={"k": 4}
+        retriever=CachedRetriever(
+            vectorstore=db,
+            reload_vectorstore=lambda: load_vector_store(db.embedding_function),
+            k=config.RETRIEVAL_K,
         ),
         return_source_documents=True,
         chain_type_kwargs={"prompt": prompt},
@@ -127,12 +128,32 @@ def main():
         st.title("💰 Finance Assistant Settings")
         st.info("💡 Ask me about budgeting, investing, saving, debt management, and financial planning!")
 
+        search_filter = None
+        metadata_index = load_metadata_index(config.DB_FAISS_PATH)
+        if metadata_index is not None:
+            books = st.multiselect(
+                "🔎 Search in", metadata_index.sources, format_func=os.path.basename, placeholder="All books"
+            )
+            topics = st.multiselect("🏷️ Topics", metadata_index.topics, placeholder="All topics")
+            search_filter = MetadataFilter(sources=tuple(books), topics=tuple(topics))
+
         st.divider()
         if st.button("🧮 Financial Calculators", use_container_width=True):
             st.session_state.show_calculators = True
         if st.button("💬 Finance Chat", use_container_width=True):
             st.session_state.show_calculators = False
 
+        stats = get_retrieval_cache().stats()
+        st.caption(
+            f"⚡ Retrieval cache hit rate: {stats['results']['hit_rate']:.0%} "
+            f"({stats['results']['hits']}/{stats['results']['hits'] + stats['results']['misses']} questions)"
+        )
+        llm_stats = get_llm_gate().stats()
+        st.caption(
+            f"🤖 LLM requests: {llm_stats['in_flight']} running, {llm_stats['queued']} queued, "
+            f"mean wait {llm_stats['mean_wait']:.1f}s (p95 {llm_stats['p95_wait']:.1f}s)"
+        )
+
     # --- Main Content ---
     if not st.session_state.authenticated:
         st.warning("🔒 Please log in to access the finance assistant.")
@@ -153,17 +174,29 @@ def main():
                 st.markdown(prompt)
 
             with st.chat_message("assistant"):
-                with st.spinner("Thinking..."):
-                    try:
-                        qa_chain = create_qa_chain()
-                        response = qa_chain.invoke({"query": prompt})
+                try:
+                    qa_chain = create_qa_chain()
+                    if config.STREAM_ANSWERS:
+                        with st.spinner("Searching the knowledge base..."):
+                            answer = StreamingAnswer(qa_chain, prompt, search_filter)
+                        st.write_stream(answer)
+                        result = answer.result
+                        cached = answer.cached
+                        st.caption(f"⏱️ {answer.timings.summary()}")
+                        print(f"Answer latency: {answer.timings.summary()}")
+                    else:
+                        with st.spinner("Thinking..."):
+                            response = answer_question(qa_chain, prompt, search_filter)
                         result = response["result"]
+                        cached = response["cached"]
                         # source_documents = response["source_documents"]
                         # result_to_show = f"{result}\n\n**📚 Source References:**\n{str(source_documents)}"
                         st.markdown(result)
-                        st.session_state.messages.append({"role": "assistant", "content": result})
-                    except Exception as e:
-                        st.error(f"❌ Error: {str(e)}")
+                    if cached:
+                        st.caption("⚡ Answered from cache")
+                    st.session_state.messages.append({"role": "assistant", "content": result})
+                except Exception as e:
+                    st.error(f"❌ Error: {str(e)}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
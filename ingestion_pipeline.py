@@ -0,0 +1,325 @@
+"""
+This module implements the streaming ingestion pipeline used to build the vector store.
+
+Pages stream out of the document loaders, are split into chunks on the fly, and the
+chunks are embedded and added to the FAISS index in fixed-size batches. Nothing holds
+the whole corpus in memory at once, so the memory used for loading, splitting and
+embedding stays flat no matter how many books are in the data directory.
+
+Chunks that are near-duplicates of a chunk already in the store are dropped before
+embedding (see `near_duplicates`); the manifest records which chunk replaced them.
+
+The partial vector store and manifest are checkpointed to disk periodically, so a
+build that is interrupted can resume from the last checkpoint instead of starting over.
+"""
+
+import os
+import shutil
+import time
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import faiss
+from langchain.docstore.document import Document
+from langchain.embeddings.base import Embeddings
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.document_loaders import TextLoader
+from langchain_community.vectorstores import FAISS
+
+import config
+import knowledge_base_manifest as kb_manifest
+from metadata_index import tag_topics
+from near_duplicates import NEAR_DUPLICATE_INDEX_FILE, NearDuplicateIndex
+from page_cleaning import clean_pages
+from pdf_loading import iter_pdf_pages
+from span_splitter import SpanSplitter, split_pages
+from token_chunking import create_character_splitter, create_token_splitter
+
+
+def create_text_splitter() -> RecursiveCharacterTextSplitter:
+    """
+    Creates the text splitter configured in `config.py`.
+
+    Chunks are measured in tokens of the embedding model or in characters,
+    depending on `config.TEXT_SPLITTER_LENGTH` (see `token_chunking`).
+
+    Returns:
+        RecursiveCharacterTextSplitter: The text splitter.
+    """
+    if config.TEXT_SPLITTER_LENGTH == "tokens":
+        return create_token_splitter()
+    return create_character_splitter()
+
+
+def iter_pages(
+    sources: Iterable[str],
+    max_workers: Optional[int] = config.PDF_LOADER_WORKERS,
+) -> Iterator[Document]:
+    """
+    Yields the pages of the given source files one at a time.
+
+    PDF pages are cleaned of repeated headers and footers if `config.PAGE_CLEANING`
+    is on; this holds one file's pages in memory at a time.
+
+    Args:
+        sources (Iterable[str]): The PDF and TXT files to load.
+        max_workers (Optional[int]): Processes used to parse PDFs.
+
+    Yields:
+        Document: One document per PDF page or text file.
+    """
+    sources = list(sources)
+    pdf_sources = [source for source in sources if source.lower().endswith(".pdf")]
+    txt_sources = [source for source in sources if source.lower().endswith(".txt")]
+
+    if pdf_sources:
+        pages = iter_pdf_pages(pdf_sources, max_workers=max_workers)
+        yield from clean_pages(pages) if config.PAGE_CLEANING else pages
+    for source in txt_sources:
+        yield from TextLoader(source).lazy_load()
+
+
+def iter_chunks(
+    pages: Iterable[Document],
+    text_splitter: Optional[RecursiveCharacterTextSplitter] = None,
+) -> Iterator[Document]:
+    """
+    Splits pages into chunks as they arrive.
+
+    Splitting page by page gives exactly the same chunks as splitting the whole
+    list at once, because the splitter never merges text across documents. The
+    splitting runs on offsets (see `span_splitter`), with the same boundaries as
+    `text_splitter`; a chunk's text is only created when the chunk is yielded.
+    Each chunk's "topics" metadata lists the `config.CHUNK_TOPICS` it mentions.
+
+    Args:
+        pages (Iterable[Document]): The pages to split.
+        text_splitter (Optional[RecursiveCharacterTextSplitter]): The splitter to use.
+
+    Yields:
+        Document: The text chunks, in page order.
+    """
+    splitter = SpanSplitter.from_text_splitter(text_splitter or create_text_splitter())
+    for chunk in split_pages(pages, splitter):
+        chunk.metadata["topics"] = tag_topics(chunk.page_content)
+        yield chunk
+
+
+def iter_batches(items: Iterable, batch_size: int) -> Iterator[List]:
+    """
+    Groups an iterable into lists of at most `batch_size` items.
+
+    Args:
+        items (Iterable): The items to group.
+        batch_size (int): The maximum size of a batch.
+
+    Yields:
+        List: The next batch of items.
+    """
+    iterator = iter(items)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+
+def create_empty_vector_store(embedding_model: Embeddings, dimension: int) -> FAISS:
+    """
+    Creates an empty flat L2 FAISS vector store, like `FAISS.from_documents` does.
+
+    Args:
+        embedding_model (Embeddings): The embedding model used for queries.
+        dimension (int): The dimension of the embedding vectors.
+
+    Returns:
+        FAISS: The empty vector store.
+    """
+    return FAISS(embedding_model, faiss.IndexFlatL2(dimension), InMemoryDocstore(), {})
+
+
+def save_checkpoint(
+    db: FAISS,
+    manifest: Dict,
+    path: str = config.CHECKPOINT_PATH,
+    dedup: Optional[NearDuplicateIndex] = None,
+):
+    """
+    Saves the partial vector store and the manifest describing it.
+
+    Both are written to a temporary directory that then replaces the previous
+    checkpoint, so the checkpoint on disk is always consistent.
+
+    Args:
+        db (FAISS): The partially built vector store.
+        manifest (Dict): The manifest matching the vectors in `db`.
+        path (str): The checkpoint directory.
+        dedup (Optional[NearDuplicateIndex]): The signatures of the chunks in `db`.
+    """
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    db.save_local(tmp_path)
+    kb_manifest.save_manifest(manifest, os.path.join(tmp_path, "manifest.json"))
+    if dedup is not None:
+        dedup.save(os.path.join(tmp_path, NEAR_DUPLICATE_INDEX_FILE))
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(
+    embedding_model: Embeddings, path: str = config.CHECKPOINT_PATH
+) -> Optional[Tuple[FAISS, Dict]]:
+    """
+    Loads the checkpoint of an interrupted build, if there is a usable one.
+
+    Args:
+        embedding_model (Embeddings): The embedding model used by the store.
+        path (str): The checkpoint directory.
+
+    Returns:
+        Optional[Tuple[FAISS, Dict]]: The partial store and its manifest, or None.
+    """
+    manifest_path = os.path.join(path, "manifest.json")
+    if not os.path.exists(manifest_path):
+        return None
+    manifest = kb_manifest.load_manifest(manifest_path)
+    if not kb_manifest.is_compatible(manifest):
+        return None
+    try:
+        db = FAISS.load_local(path, embedding_model, allow_dangerous_deserialization=True)
+    except Exception as e:
+        print(f"Could not load checkpoint: {e}")
+        return None
+    return db, manifest
+
+
+def clear_checkpoint(path: str = config.CHECKPOINT_PATH):
+    """Removes the checkpoint directory once a build has finished."""
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def ingest_sources(
+    sources: Dict[str, str],
+    to_embed: List[str],
+    manifest: Dict,
+    embedding_model: Embeddings,
+    db: Optional[FAISS] = None,
+    max_workers: Optional[int] = config.PDF_LOADER_WORKERS,
+    batch_size: int = config.EMBEDDING_BATCH_SIZE,
+    checkpoint_every: int = config.CHECKPOINT_EVERY_BATCHES,
+    dedup: Optional[NearDuplicateIndex] = None,
+) -> Tuple[Optional[FAISS], int]:
+    """
+    Streams the given files through load, split, embed and add, in batches.
+
+    The manifest is updated in place as batches are added: each file gets its chunk
+    IDs and is marked complete once all of its chunks are in the store. Files with an
+    incomplete manifest entry (from a checkpoint) skip the chunks already processed.
+    Near-duplicates of stored chunks are listed under the file's "duplicates" instead.
+
+    Args:
+        sources (Dict[str, str]): Source paths mapped to content hashes.
+        to_embed (List[str]): The sources to embed.
+        manifest (Dict): The manifest describing the vectors already in `db`.
+        embedding_model (Embeddings): The embedding model.
+        db (Optional[FAISS]): The store to add to; created on the first batch if None.
+        max_workers (Optional[int]): Processes used to parse PDFs.
+        batch_size (int): Number of chunks embedded at a time.
+        checkpoint_every (int): Number of batches between checkpoints.
+        dedup (Optional[NearDuplicateIndex]): The signatures of the chunks in `db`;
+            updated in place. Near-duplicate filtering is off if None.
+
+    Returns:
+        Tuple[Optional[FAISS], int]: The vector store and the number of chunks added.
+    """
+    files = manifest["files"]
+    skip = {}
+    for source in to_embed:
+        entry = files.get(source)
+        if entry and entry["sha256"] == sources[source] and not entry.get("complete", True):
+            skip[source] = len(entry["chunk_ids"]) + len(entry.get("duplicates", {}))
+        else:
+            files[source] = {"sha256": sources[source], "chunk_ids": [], "duplicates": {}, "complete": False}
+
+    positions: Dict[str, int] = {}
+    finished: List[str] = []
+    duplicates = 0
+
+    def new_chunks() -> Iterator[Document]:
+        current = None
+        for chunk in iter_chunks(iter_pages(to_embed, max_workers)):
+            source = chunk.metadata.get("source")
+            if source != current:
+                if current is not None:
+                    finished.append(current)
+                current = source
+            position = positions.get(source, 0)
+            positions[source] = position + 1
+            if position < skip.get(source, 0):
+                continue
+            chunk.id = kb_manifest.make_chunk_id(source, sources[source], position)
+            if dedup is not None:
+                signature = dedup.signature(chunk.page_content)
+                kept = dedup.find(signature)
+                if kept is not None:
+                    nonlocal duplicates
+                    duplicates += 1
+                    origin = {"kept": kept, "source": source}
+                    if "page" in chunk.metadata:
+                        origin["page"] = chunk.metadata["page"]
+                    files[source].setdefault("duplicates", {})[chunk.id] = origin
+                    continue
+                dedup.add(chunk.id, signature)
+            yield chunk
+
+    added = 0
+    embedding_seconds = 0.0
+    for batch_number, batch in enumerate(iter_batches(new_chunks(), batch_size), start=1):
+        texts = [chunk.page_content for chunk in batch]
+        start = time.perf_counter()
+        embeddings = embedding_model.embed_documents(texts)
+        embedding_seconds += time.perf_counter() - start
+        if db is None:
+            db = create_empty_vector_store(embedding_model, len(embeddings[0]))
+        db.add_embeddings(
+            zip(texts, embeddings),
+            metadatas=[chunk.metadata for chunk in batch],
+            ids=[chunk.id for chunk in batch],
+        )
+
+        for chunk in batch:
+            files[chunk.metadata["source"]]["chunk_ids"].append(chunk.id)
+        # Every chunk of a finished file was in this batch or an earlier one.
+        while finished:
+            files[finished.pop()]["complete"] = True
+        added += len(batch)
+
+        if batch_number % checkpoint_every == 0:
+            print(f"Embedded {added} chunks; saving checkpoint...")
+            save_checkpoint(db, manifest, dedup=dedup)
+
+    for source in to_embed:
+        files[source]["complete"] = True
+    if dedup is not None:
+        report_duplicates(duplicates, added, embedding_seconds, db)
+    return db, added
+
+
+def report_duplicates(duplicates: int, added: int, embedding_seconds: float, db: Optional[FAISS]):
+    """
+    Prints how much near-duplicate filtering shrank the index and the embedding time.
+
+    Args:
+        duplicates (int): Number of chunks dropped as near-duplicates.
+        added (int): Number of chunks embedded and added.
+        embedding_seconds (float): Time spent embedding the added chunks.
+        db (Optional[FAISS]): The vector store, used for the vector size.
+    """
+    total = duplicates + added
+    if not total:
+        return
+    vector_bytes = db.index.d * 4 if db is not None else 0
+    seconds_per_chunk = embedding_seconds / added if added else 0.0
+    print(
+        f"Near-duplicate filter: dropped {duplicates} of {total} chunks ({duplicates / total:.1%}), "
+        f"saving ~{duplicates * vector_bytes / 2**20:.1f} MB of vectors and "
+        f"~{duplicates * seconds_per_chunk:.1f} s of embedding."
+    )
@@ -0,0 +1,245 @@
+"""
+This module tracks which source documents are embedded in the FAISS vector store.
+
+The manifest is a small JSON file saved next to the vector store. It records, for
+each source file, a content hash and the IDs of the chunks that were created from
+it, together with the embedding model and text splitting settings used for the
+build. Comparing the manifest with the files currently in the data directory tells
+the setup script which files need to be embedded and which vectors must be removed.
+
+Chunks dropped as near-duplicates are listed under their file's "duplicates", with
+the ID of the stored chunk that replaced them. A file whose duplicates point into a
+file that changes or disappears is re-embedded, so its text is not lost.
+"""
+
+import hashlib
+import json
+import os
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List
+
+import config
+from token_chunking import splitter_settings
+
+# File patterns that are ingested into the knowledge base.
+SOURCE_GLOBS = ("*.pdf", "*.txt")
+
+MANIFEST_VERSION = 1
+
+
+@dataclass
+class UpdatePlan:
+    """
+    Describes the work needed to bring the vector store in line with the data directory.
+    """
+    added: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+    # Sources whose embedding was interrupted and continues from a checkpoint.
+    resumed: List[str] = field(default_factory=list)
+
+    @property
+    def to_embed(self) -> List[str]:
+        """Sources whose chunks have to be (re-)embedded."""
+        return self.added + self.changed + self.resumed
+
+    @property
+    def to_delete(self) -> List[str]:
+        """Sources whose existing vectors have to be removed from the store."""
+        return self.changed + self.removed
+
+    def is_empty(self) -> bool:
+        return not (self.added or self.changed or self.removed or self.resumed)
+
+
+def hash_file(path: str, block_size: int = 1 << 20) -> str:
+    """
+    Computes the SHA-256 hash of a file's contents.
+
+    Args:
+        path (str): The file to hash.
+        block_size (int): Number of bytes read at a time.
+
+    Returns:
+        str: The hex digest of the file contents.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def list_sources(data_path: str) -> List[str]:
+    """
+    Lists every supported source file in the data directory.
+
+    The paths use the same format as the `source` metadata that the document
+    loaders attach to each page, so they can be matched against chunk metadata.
+
+    Args:
+        data_path (str): The directory containing the source documents.
+
+    Returns:
+        List[str]: The source paths, PDFs first, each group sorted by name.
+    """
+    return [
+        str(path)
+        for pattern in SOURCE_GLOBS
+        for path in sorted(Path(data_path).glob(pattern))
+        if path.is_file()
+    ]
+
+
+def scan_sources(data_path: str) -> Dict[str, str]:
+    """
+    Hashes every supported source file in the data directory.
+
+    Args:
+        data_path (str): The directory containing the source documents.
+
+    Returns:
+        Dict[str, str]: A mapping of source path to content hash.
+    """
+    return {source: hash_file(source) for source in list_sources(data_path)}
+
+
+def current_build_settings() -> Dict:
+    """
+    Returns the settings that, when changed, invalidate every stored vector.
+    """
+    return {
+        "embedding_model": config.EMBEDDING_MODEL_NAME,
+        "embedding_backend": config.EMBEDDING_BACKEND,
+        "encode_kwargs": config.EMBEDDING_ENCODE_KWARGS,
+        "text_splitter": splitter_settings(),
+        "topics": config.CHUNK_TOPICS,
+        "page_cleaning": {
+            "enabled": config.PAGE_CLEANING,
+            "edge_lines": config.BOILERPLATE_EDGE_LINES,
+            "min_pages": config.BOILERPLATE_MIN_PAGES,
+        },
+        "near_duplicates": {
+            "enabled": config.NEAR_DUPLICATE_FILTER,
+            "threshold": config.NEAR_DUPLICATE_THRESHOLD,
+            "num_perm": config.MINHASH_PERMUTATIONS,
+            "shingle_words": config.MINHASH_SHINGLE_WORDS,
+        },
+    }
+
+
+def empty_manifest() -> Dict:
+    """Returns a manifest describing an empty vector store."""
+    return {"version": MANIFEST_VERSION, "settings": current_build_settings(), "files": {}}
+
+
+def load_manifest(path: str = config.MANIFEST_PATH) -> Dict:
+    """
+    Loads the manifest from disk.
+
+    Args:
+        path (str): Location of the manifest file.
+
+    Returns:
+        Dict: The stored manifest, or an empty manifest if none exists yet.
+    """
+    if not os.path.exists(path):
+        return empty_manifest()
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        return empty_manifest()
+    return manifest
+
+
+def save_manifest(manifest: Dict, path: str = config.MANIFEST_PATH):
+    """
+    Writes the manifest to disk atomically.
+
+    Args:
+        manifest (Dict): The manifest to save.
+        path (str): Location of the manifest file.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def is_compatible(manifest: Dict) -> bool:
+    """
+    Checks whether the stored vectors were built with the current settings.
+
+    Args:
+        manifest (Dict): The stored manifest.
+
+    Returns:
+        bool: True if the existing vectors can be reused.
+    """
+    return manifest.get("settings") == current_build_settings()
+
+
+def plan_update(manifest: Dict, sources: Dict[str, str]) -> UpdatePlan:
+    """
+    Compares the manifest with the current source files.
+
+    Args:
+        manifest (Dict): The stored manifest.
+        sources (Dict[str, str]): Current source paths mapped to content hashes.
+
+    Returns:
+        UpdatePlan: The files to add, re-embed, resume, remove or keep.
+    """
+    plan = UpdatePlan()
+    known = manifest.get("files", {})
+    for source, file_hash in sources.items():
+        if source not in known:
+            plan.added.append(source)
+        elif known[source]["sha256"] != file_hash:
+            plan.changed.append(source)
+        elif not known[source].get("complete", True):
+            plan.resumed.append(source)
+        else:
+            plan.unchanged.append(source)
+    plan.removed = [source for source in known if source not in sources]
+
+    # Re-embed kept files whose near-duplicates were replaced by chunks of files that
+    # are about to be deleted. Repeat, since those files' chunks may in turn have
+    # replaced chunks of other files.
+    owner = {chunk_id: source for source, entry in known.items() for chunk_id in entry["chunk_ids"]}
+    deleted = set(plan.to_delete)
+    while True:
+        dependents = [
+            source
+            for source in plan.unchanged + plan.resumed
+            if any(owner.get(d["kept"]) in deleted for d in known[source].get("duplicates", {}).values())
+        ]
+        if not dependents:
+            break
+        for source in dependents:
+            if source in plan.unchanged:
+                plan.unchanged.remove(source)
+            else:
+                plan.resumed.remove(source)
+            plan.changed.append(source)
+            deleted.add(source)
+    return plan
+
+
+def make_chunk_id(source: str, file_hash: str, position: int) -> str:
+    """
+    Creates a stable ID for the n-th chunk of a source file.
+
+    Args:
+        source (str): The source path of the chunk.
+        file_hash (str): The content hash of the source file.
+        position (int): The position of the chunk within the file.
+
+    Returns:
+        str: A UUID string that is unique per source, content and position.
+    """
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{source}#{file_hash}#{position}"))
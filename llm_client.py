@@ -0,0 +1,314 @@
+"""
+This module controls how the chat applications call the remote LLM.
+
+Every chat session calls the Hugging Face endpoint directly, with no limit on the
+number of requests in flight and no retries, so a burst of users either piles up on
+the endpoint or hangs a worker on a failed request. `ManagedChatModel` wraps the chat
+model in a process-wide `LLMGate`:
+- At most `config.LLM_MAX_CONCURRENCY` requests run at once; up to
+  `config.LLM_MAX_QUEUE` more wait for a slot, and further requests are refused.
+- Requests that fail with HTTP 429 or 5xx are retried with jittered exponential
+  backoff, honouring the endpoint's Retry-After header.
+- Queue depth and wait times are recorded and reported by `LLMGate.stats()`.
+
+All sessions share one endpoint client, and therefore its pooled HTTP connections.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from pydantic import ConfigDict
+
+import config
+
+# Number of recent wait times kept for the latency statistics.
+WAIT_SAMPLES = 1000
+
+# Seconds between checks for a free slot by requests waiting in an event loop.
+ASYNC_POLL_SECONDS = 0.05
+
+
+class LLMBusyError(RuntimeError):
+    """Raised when too many LLM requests are already running or waiting."""
+
+
+class LLMGate:
+    """
+    A concurrency limit with a bounded waiting queue, shared by all LLM requests.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = config.LLM_MAX_CONCURRENCY,
+        max_queue: int = config.LLM_MAX_QUEUE,
+        queue_timeout: float = config.LLM_QUEUE_TIMEOUT_SECONDS,
+    ):
+        """
+        Args:
+            max_concurrency (int): Maximum number of requests sent at the same time.
+            max_queue (int): Maximum number of requests waiting for a free slot.
+            queue_timeout (float): Seconds a request may wait for a slot.
+        """
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._in_flight = 0
+        self._max_waiting = 0
+        self._requests = 0
+        self._rejected = 0
+        self._retries = 0
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+
+    def acquire(self):
+        """
+        Waits for a free request slot.
+
+        Raises:
+            LLMBusyError: If the queue is full or no slot frees up within the timeout.
+        """
+        start = self._enqueue()
+        acquired = self._slots.acquire(timeout=self.queue_timeout)
+        self._dequeue(start, acquired)
+
+    async def acquire_async(self):
+        """
+        Waits for a free request slot without blocking the event loop.
+
+        The slot is polled rather than waited for in a worker thread, so a request
+        cancelled while queued never ends up holding a slot that nobody releases.
+
+        Raises:
+            LLMBusyError: If the queue is full or no slot frees up within the timeout.
+        """
+        start = self._enqueue()
+        deadline = start + self.queue_timeout
+        try:
+            while not (acquired := self._slots.acquire(blocking=False)):
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                await asyncio.sleep(min(ASYNC_POLL_SECONDS, remaining))
+        except BaseException:
+            with self._lock:
+                self._waiting -= 1
+            raise
+        self._dequeue(start, acquired)
+
+    def _enqueue(self) -> float:
+        """Joins the waiting queue and returns the time the wait started."""
+        start = time.perf_counter()
+        with self._lock:
+            if self._waiting >= self.max_queue:
+                self._rejected += 1
+                raise LLMBusyError("The assistant is handling too many questions right now. Please try again shortly.")
+            self._waiting += 1
+            self._max_waiting = max(self._max_waiting, self._waiting)
+        return start
+
+    def _dequeue(self, start: float, acquired: bool):
+        """Leaves the waiting queue, raising `LLMBusyError` if no slot was acquired."""
+        with self._lock:
+            self._waiting -= 1
+            if not acquired:
+                self._rejected += 1
+            else:
+                self._in_flight += 1
+                self._requests += 1
+                self._waits.append(time.perf_counter() - start)
+        if not acquired:
+            raise LLMBusyError(
+                f"No LLM request slot became free within {self.queue_timeout:.0f} seconds. Please try again."
+            )
+
+    def release(self):
+        """Frees the slot taken by `acquire`."""
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def record_retry(self):
+        """Counts a retried request."""
+        with self._lock:
+            self._retries += 1
+
+    def stats(self) -> Dict:
+        """
+        Returns the current queue depth and statistics about past requests.
+        """
+        with self._lock:
+            waits = sorted(self._waits)
+            return {
+                "in_flight": self._in_flight,
+                "queued": self._waiting,
+                "max_queued": self._max_waiting,
+                "requests": self._requests,
+                "rejected": self._rejected,
+                "retries": self._retries,
+                "mean_wait": sum(waits) / len(waits) if waits else 0.0,
+                "p95_wait": waits[int(0.95 * (len(waits) - 1))] if waits else 0.0,
+                "max_wait": waits[-1] if waits else 0.0,
+            }
+
+
+_llm_gate: Optional[LLMGate] = None
+_llm_gate_lock = threading.Lock()
+
+
+def get_llm_gate() -> LLMGate:
+    """Returns the LLM gate shared by every session in this process."""
+    global _llm_gate
+    with _llm_gate_lock:
+        if _llm_gate is None:
+            _llm_gate = LLMGate()
+        return _llm_gate
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    """Returns the HTTP status of an error raised by the endpoint client, if any."""
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None) or getattr(error, "status", None)
+    return status if isinstance(status, int) else None
+
+
+def _is_retryable(error: BaseException) -> bool:
+    status = _status_code(error)
+    return status is not None and (status == 429 or status >= 500)
+
+
+def _retry_delay(error: BaseException, attempt: int) -> float:
+    """
+    Returns how long to wait before the next attempt.
+
+    Uses the endpoint's Retry-After header when present, otherwise "full jitter"
+    exponential backoff, so retrying sessions do not hit the endpoint in lockstep.
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return min(float(headers.get("Retry-After")), config.LLM_RETRY_MAX_DELAY)
+    except (TypeError, ValueError):
+        return random.uniform(0, min(config.LLM_RETRY_MAX_DELAY, config.LLM_RETRY_BASE_DELAY * 2 ** attempt))
+
+
+class ManagedChatModel(BaseChatModel):
+    """
+    A chat model wrapper that sends requests through the shared `LLMGate`, with retries.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    model: BaseChatModel
+    gate: Optional[LLMGate] = None
+    max_retries: int = config.LLM_MAX_RETRIES
+
+    def model_post_init(self, __context: Any):
+        if self.gate is None:
+            self.gate = get_llm_gate()
+
+    @property
+    def _llm_type(self) -> str:
+        return f"managed-{self.model._llm_type}"
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        for attempt in range(self.max_retries + 1):
+            self.gate.acquire()
+            try:
+                return self.model._generate(messages, stop=stop, **kwargs)
+            except Exception as e:
+                if attempt == self.max_retries or not _is_retryable(e):
+                    raise
+                delay = _retry_delay(e, attempt)
+            finally:
+                self.gate.release()
+            # Back off without holding a slot, so other requests can proceed.
+            self.gate.record_retry()
+            time.sleep(delay)
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        for attempt in range(self.max_retries + 1):
+            await self.gate.acquire_async()
+            try:
+                return await self.model._agenerate(messages, stop=stop, **kwargs)
+            except Exception as e:
+                if attempt == self.max_retries or not _is_retryable(e):
+                    raise
+                delay = _retry_delay(e, attempt)
+            finally:
+                self.gate.release()
+            self.gate.record_retry()
+            await asyncio.sleep(delay)
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        for attempt in range(self.max_retries + 1):
+            started = False
+            self.gate.acquire()
+            try:
+                for chunk in self.model._stream(messages, stop=stop, **kwargs):
+                    started = True
+                    if run_manager:
+                        run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                    yield chunk
+                return
+            except Exception as e:
+                # Once tokens were shown, a retry would repeat them.
+                if started or attempt == self.max_retries or not _is_retryable(e):
+                    raise
+                delay = _retry_delay(e, attempt)
+            finally:
+                self.gate.release()
+            self.gate.record_retry()
+            time.sleep(delay)
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        for attempt in range(self.max_retries + 1):
+            started = False
+            await self.gate.acquire_async()
+            try:
+                async for chunk in self.model._astream(messages, stop=stop, **kwargs):
+                    started = True
+                    if run_manager:
+                        await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                    yield chunk
+                return
+            except Exception as e:
+                if started or attempt == self.max_retries or not _is_retryable(e):
+                    raise
+                delay = _retry_delay(e, attempt)
+            finally:
+                self.gate.release()
+            self.gate.record_retry()
+            await asyncio.sleep(delay)
@@ -0,0 +1,252 @@
+"""
+This module scopes retrieval to chunks with given sources, pages or topics.
+
+A question that is clearly about taxes only needs `irs documentation.pdf`, but a
+plain FAISS search ranks every chunk, and filtering its top-k afterwards needs a much
+larger k to keep k hits. The setup script writes a small metadata index next to the
+serving vector store, as flat NumPy arrays in `vectorstore/db_faiss/metadata/` with one
+entry per vector position:
+- `source_ids.npy`: the position of the chunk's source in the `sources` of `meta.json`.
+- `pages.npy`: the chunk's `page` metadata, -1 for sources without pages.
+- `topic_bits.npy`: one bit per topic of `config.CHUNK_TOPICS` the chunk was tagged
+  with at ingest.
+
+A `MetadataFilter` is turned into the matching vector positions with a few array
+comparisons, and those into a FAISS `IDSelector`, so the search itself only scores the
+matching chunks. With the sharded store (see `vector_shards`) only the shards holding
+matching chunks are searched, each with a selector in its own positions.
+"""
+
+import json
+import os
+import re
+import shutil
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain.docstore.document import Document
+
+import config
+
+METADATA_INDEX_DIR = "metadata"
+
+# One bit per topic in a uint64.
+MAX_TOPICS = 64
+
+TOPIC_PATTERNS = {
+    topic: re.compile(r"(?<!\w)(?:" + "|".join(map(re.escape, keywords)) + r")(?!\w)", re.IGNORECASE)
+    for topic, keywords in config.CHUNK_TOPICS.items()
+}
+
+
+def tag_topics(text: str) -> List[str]:
+    """
+    Returns the topics of `config.CHUNK_TOPICS` whose keywords appear in a text.
+
+    Args:
+        text (str): The chunk text.
+
+    Returns:
+        List[str]: The matching topics, in configuration order.
+    """
+    return [topic for topic, pattern in TOPIC_PATTERNS.items() if pattern.search(text)]
+
+
+@dataclass(frozen=True)
+class MetadataFilter:
+    """
+    The chunks a question may be answered from.
+
+    Each given field must match; within a field, any of the values may match. Sources
+    are matched by path or by file name, and `pages` by the inclusive range of the
+    `page` metadata (0-based, as stored by the PDF loader).
+    """
+
+    sources: Tuple[str, ...] = ()
+    pages: Optional[Tuple[int, int]] = None
+    topics: Tuple[str, ...] = ()
+
+    def __bool__(self) -> bool:
+        return bool(self.sources or self.pages is not None or self.topics)
+
+
+def build_metadata_index(documents: Iterable[Document], path: str):
+    """
+    Builds the metadata index over chunks and writes it to a directory.
+
+    The directory is written next to its final location and then moved into place,
+    so running application processes never see a half-written index.
+
+    Args:
+        documents (Iterable[Document]): The chunks, in vector position order.
+        path (str): The directory to write.
+    """
+    topics = list(config.CHUNK_TOPICS)[:MAX_TOPICS]
+    topic_bit = {topic: np.uint64(1) << np.uint64(i) for i, topic in enumerate(topics)}
+    sources, source_ids, pages, topic_bits = {}, [], [], []
+    for document in documents:
+        metadata = document.metadata
+        source_ids.append(sources.setdefault(metadata.get("source", ""), len(sources)))
+        pages.append(metadata.get("page", -1))
+        bits = np.uint64(0)
+        for topic in metadata.get("topics", ()):
+            bits |= topic_bit.get(topic, np.uint64(0))
+        topic_bits.append(bits)
+
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    np.save(os.path.join(tmp_path, "source_ids.npy"), np.asarray(source_ids, dtype=np.int32))
+    np.save(os.path.join(tmp_path, "pages.npy"), np.asarray(pages, dtype=np.int32))
+    np.save(os.path.join(tmp_path, "topic_bits.npy"), np.asarray(topic_bits, dtype=np.uint64))
+    with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"ntotal": len(source_ids), "sources": list(sources), "topics": topics}, f)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    print(f"Metadata index: {len(source_ids)} chunks from {len(sources)} sources, {len(topics)} topics.")
+
+
+class MetadataIndex:
+    """
+    A memory-mapped metadata index written by `build_metadata_index`.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): The index directory.
+        """
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.ntotal: int = meta["ntotal"]
+        self.sources: List[str] = meta["sources"]
+        self.topics: List[str] = meta["topics"]
+        self.source_ids = np.load(os.path.join(path, "source_ids.npy"), mmap_mode="r")
+        self.pages = np.load(os.path.join(path, "pages.npy"), mmap_mode="r")
+        self.topic_bits = np.load(os.path.join(path, "topic_bits.npy"), mmap_mode="r")
+
+    def select_rows(self, search_filter: MetadataFilter) -> np.ndarray:
+        """
+        Finds the chunks that match a filter.
+
+        Args:
+            search_filter (MetadataFilter): The filter.
+
+        Returns:
+            np.ndarray: The sorted int64 vector positions of the matching chunks.
+        """
+        mask = np.ones(self.ntotal, dtype=bool)
+        if search_filter.sources:
+            wanted = set(search_filter.sources)
+            ids = [i for i, source in enumerate(self.sources) if source in wanted or os.path.basename(source) in wanted]
+            mask &= np.isin(self.source_ids, ids)
+        if search_filter.pages is not None:
+            first, last = search_filter.pages
+            mask &= (self.pages >= first) & (self.pages <= last)
+        if search_filter.topics:
+            bits = np.uint64(0)
+            for i, topic in enumerate(self.topics):
+                if topic in search_filter.topics:
+                    bits |= np.uint64(1) << np.uint64(i)
+            mask &= (self.topic_bits & bits) != 0
+        return np.flatnonzero(mask).astype(np.int64)
+
+
+def load_metadata_index(db_path: str = config.DB_FAISS_PATH) -> Optional[MetadataIndex]:
+    """
+    Loads the metadata index of a vector store, if one has been built.
+
+    Args:
+        db_path (str): The vector store directory.
+
+    Returns:
+        Optional[MetadataIndex]: The index, or None if it does not exist.
+    """
+    path = os.path.join(db_path, METADATA_INDEX_DIR)
+    if not os.path.exists(os.path.join(path, "meta.json")):
+        return None
+    return MetadataIndex(path)
+
+
+def make_selector(rows: np.ndarray) -> faiss.IDSelector:
+    """
+    Creates a FAISS selector for a sorted set of vector positions.
+
+    Args:
+        rows (np.ndarray): The sorted, non-empty int64 vector positions.
+
+    Returns:
+        faiss.IDSelector: A range selector if the positions are contiguous, as they
+        are for a single source, and a batch selector otherwise.
+    """
+    if rows[-1] - rows[0] + 1 == len(rows):
+        return faiss.IDSelectorRange(int(rows[0]), int(rows[-1]) + 1)
+    return faiss.IDSelectorBatch(rows)
+
+
+def search_parameters(index: faiss.Index, selector: faiss.IDSelector) -> faiss.SearchParameters:
+    """
+    Creates search parameters that restrict an index to a selector.
+
+    The parameters of the index's own type are used, carrying over its nprobe or
+    efSearch, since IVF and HNSW indexes reject generic parameters.
+
+    Args:
+        index (faiss.Index): The index to search.
+        selector (faiss.IDSelector): The vector positions to consider.
+
+    Returns:
+        faiss.SearchParameters: The search parameters.
+    """
+    try:
+        ivf = faiss.extract_index_ivf(index)
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+    except RuntimeError:
+        pass
+    index = faiss.downcast_index(index)
+    if hasattr(index, "hnsw"):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+
+def filtered_search(index: faiss.Index, query: np.ndarray, k: int, rows: np.ndarray) -> List[int]:
+    """
+    Searches only the given vector positions of an index.
+
+    Args:
+        index (faiss.Index): The serving index, possibly a `faiss.IndexShards`.
+        query (np.ndarray): The float32 query embedding.
+        k (int): The number of results.
+        rows (np.ndarray): The sorted int64 vector positions to search.
+
+    Returns:
+        List[int]: The vector positions of the nearest matching chunks, nearest first.
+    """
+    if not len(rows):
+        return []
+    query = query.reshape(1, -1)
+    if not isinstance(index, faiss.IndexShards):
+        selector = make_selector(rows)
+        _, indices = index.search(query, k, params=search_parameters(index, selector))
+        return [int(row) for row in indices[0] if row != -1]
+
+    # Search only the shards holding matching rows, each in its own positions.
+    distances, results = [], []
+    start = 0
+    for i in range(index.count()):
+        shard = index.at(i)
+        end = start + shard.ntotal
+        local = rows[np.searchsorted(rows, start):np.searchsorted(rows, end)] - start
+        if len(local):
+            selector = make_selector(local)
+            shard_distances, indices = shard.search(query, k, params=search_parameters(shard, selector))
+            found = indices[0] != -1
+            distances.append(shard_distances[0][found])
+            results.append(indices[0][found] + start)
+        start = end
+    if not results:
+        return []
+    distances, results = np.concatenate(distances), np.concatenate(results)
+    return [int(row) for row in results[np.argsort(distances, kind="stable")[:k]]]
@@ -0,0 +1,281 @@
+"""
+This module finds near-duplicate chunks during ingestion with MinHash and LSH.
+
+The finance books repeat material: boilerplate pages, reprinted tables, chapter
+summaries that restate the chapter. Each copy becomes its own vector, and the copies
+crowd each other into the top-k results. Before a chunk is embedded, its MinHash
+signature is looked up in an LSH index of the chunks already stored; if a stored chunk
+has an estimated Jaccard similarity of at least `config.NEAR_DUPLICATE_THRESHOLD`, the
+new chunk is not embedded. Instead its source and page are recorded on the stored
+chunk as `duplicate_sources` metadata.
+
+The signatures of the stored chunks are saved next to the vector store in
+`minhash.npz`, so incremental builds compare new files against the whole store.
+"""
+
+import os
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain.docstore.document import Document
+
+import config
+
+NEAR_DUPLICATE_INDEX_FILE = "minhash.npz"
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def lsh_bands(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """
+    Chooses how to split a signature into LSH bands for a similarity threshold.
+
+    Two chunks become candidates if all rows of at least one band match, which
+    happens with probability 1 - (1 - s^rows)^bands for Jaccard similarity s. The
+    chosen layout puts the steep part of that curve just below the threshold, so
+    near-duplicates are rarely missed; candidates are then verified exactly.
+
+    Args:
+        threshold (float): The Jaccard similarity above which chunks are duplicates.
+        num_perm (int): The signature length.
+
+    Returns:
+        Tuple[int, int]: The number of bands and the rows per band.
+    """
+    best = (num_perm, 1)
+    for bands in range(1, num_perm + 1):
+        if num_perm % bands:
+            continue
+        rows = num_perm // bands
+        knee = (1 / bands) ** (1 / rows)
+        if knee <= threshold and knee > (1 / best[0]) ** (1 / best[1]):
+            best = (bands, rows)
+    return best
+
+
+class NearDuplicateIndex:
+    """
+    MinHash signatures of the stored chunks, with an LSH index for finding near-duplicates.
+    """
+
+    def __init__(
+        self,
+        threshold: float = config.NEAR_DUPLICATE_THRESHOLD,
+        num_perm: int = config.MINHASH_PERMUTATIONS,
+        shingle_words: int = config.MINHASH_SHINGLE_WORDS,
+        seed: int = 1,
+    ):
+        """
+        Args:
+            threshold (float): Minimum estimated Jaccard similarity of near-duplicates.
+            num_perm (int): Number of hash permutations in a signature.
+            shingle_words (int): Number of consecutive words in a shingle.
+            seed (int): Seed of the hash permutations; must stay fixed for a store.
+        """
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_words = shingle_words
+        self.bands, self.rows = lsh_bands(threshold, num_perm)
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint64)
+
+        self._ids: List[str] = []
+        self._signatures: List[np.ndarray] = []
+        self._rows: Dict[str, int] = {}
+        self._buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(self.bands)]
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def signature(self, text: str) -> np.ndarray:
+        """
+        Computes the MinHash signature of a text's word shingles.
+
+        Args:
+            text (str): The chunk text.
+
+        Returns:
+            np.ndarray: The uint32 signature of length `num_perm`.
+        """
+        words = text.lower().split()
+        n = self.shingle_words
+        shingles = {" ".join(words[i:i + n]) for i in range(max(1, len(words) - n + 1))}
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode("utf-8")) for shingle in shingles), dtype=np.uint64, count=len(shingles)
+        )
+        # Universal hashing (a*h + b) mod p; a, b and h are below 2^32, so nothing overflows.
+        permuted = (np.outer(hashes, self._a) + self._b) % MERSENNE_PRIME & MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def find(self, signature: np.ndarray) -> Optional[str]:
+        """
+        Finds a stored chunk that is a near-duplicate of a signature.
+
+        Args:
+            signature (np.ndarray): The signature to look up.
+
+        Returns:
+            Optional[str]: The ID of the most similar stored chunk above the
+            threshold, or None.
+        """
+        candidates = set()
+        for band, key in enumerate(self._band_keys(signature)):
+            candidates.update(self._buckets[band].get(key, ()))
+        best, best_similarity = None, self.threshold
+        for row in candidates:
+            chunk_id = self._ids[row]
+            if self._rows.get(chunk_id) != row:
+                continue  # Removed.
+            similarity = float(np.mean(self._signatures[row] == signature))
+            if similarity >= best_similarity:
+                best, best_similarity = chunk_id, similarity
+        return best
+
+    def add(self, chunk_id: str, signature: np.ndarray):
+        """
+        Adds a stored chunk to the index.
+
+        Args:
+            chunk_id (str): The chunk ID.
+            signature (np.ndarray): The chunk's signature.
+        """
+        row = len(self._ids)
+        self._ids.append(chunk_id)
+        self._signatures.append(signature)
+        self._rows[chunk_id] = row
+        for band, key in enumerate(self._band_keys(signature)):
+            self._buckets[band].setdefault(key, []).append(row)
+
+    def remove(self, chunk_ids: Iterable[str]):
+        """
+        Removes chunks that were deleted from the vector store.
+
+        Args:
+            chunk_ids (Iterable[str]): The IDs of the deleted chunks.
+        """
+        for chunk_id in chunk_ids:
+            self._rows.pop(chunk_id, None)
+
+    def save(self, path: str):
+        """
+        Saves the signatures of the stored chunks.
+
+        Args:
+            path (str): The file to write.
+        """
+        live = sorted(self._rows.values())
+        signatures = (
+            np.stack([self._signatures[row] for row in live])
+            if live
+            else np.empty((0, self.num_perm), dtype=np.uint32)
+        )
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                ids=np.array([self._ids[row] for row in live], dtype=str),
+                signatures=signatures,
+                settings=np.array([self.threshold, self.num_perm, self.shingle_words]),
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["NearDuplicateIndex"]:
+        """
+        Loads signatures saved by `save`, if they match the current settings.
+
+        Args:
+            path (str): The file to read.
+
+        Returns:
+            Optional[NearDuplicateIndex]: The index, or None if the file is missing
+            or was written with other settings.
+        """
+        if not os.path.exists(path):
+            return None
+        index = cls()
+        with np.load(path) as data:
+            settings = [index.threshold, index.num_perm, index.shingle_words]
+            if not np.allclose(data["settings"], settings):
+                return None
+            for chunk_id, signature in zip(data["ids"], data["signatures"]):
+                index.add(str(chunk_id), signature)
+        return index
+
+    @classmethod
+    def from_documents(cls, documents: Iterable[Document]) -> "NearDuplicateIndex":
+        """
+        Builds an index over chunks that are already stored.
+
+        Args:
+            documents (Iterable[Document]): The stored chunks, with their IDs set.
+
+        Returns:
+            NearDuplicateIndex: The index.
+        """
+        index = cls()
+        for document in documents:
+            index.add(document.id, index.signature(document.page_content))
+        return index
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+
+def apply_provenance(db, manifest: Dict):
+    """
+    Records on each stored chunk the sources of the near-duplicates it replaced.
+
+    Sets `duplicate_sources` metadata (a list of {"source", "page"}) on chunks that
+    absorbed near-duplicates, and removes it from chunks that no longer have any.
+
+    Args:
+        db (FAISS): The vector store; its docstore is updated in place.
+        manifest (Dict): The manifest, whose files list their dropped duplicates.
+    """
+    provenance: Dict[str, List[Dict]] = {}
+    for entry in manifest["files"].values():
+        for duplicate in entry.get("duplicates", {}).values():
+            origin = {key: duplicate[key] for key in ("source", "page") if key in duplicate}
+            origins = provenance.setdefault(duplicate["kept"], [])
+            if origin not in origins:
+                origins.append(origin)
+
+    for chunk_id in db.index_to_docstore_id.values():
+        document = db.docstore.search(chunk_id)
+        if not isinstance(document, Document):
+            continue
+        if chunk_id in provenance:
+            document.metadata["duplicate_sources"] = sorted(
+                provenance[chunk_id], key=lambda origin: (origin.get("source", ""), origin.get("page", -1))
+            )
+        else:
+            document.metadata.pop("duplicate_sources", None)
+
+
+def load_near_duplicate_index(path: str, db=None) -> NearDuplicateIndex:
+    """
+    Loads the near-duplicate index of a vector store, rebuilding it if needed.
+
+    Args:
+        path (str): The signature file saved next to the store.
+        db (Optional[FAISS]): The store; used to rebuild the signatures if the file
+            is missing or stale.
+
+    Returns:
+        NearDuplicateIndex: The index of the chunks in `db`.
+    """
+    index = NearDuplicateIndex.load(path)
+    if index is not None and (db is None or len(index) == len(db.index_to_docstore_id)):
+        return index
+    if db is None:
+        return NearDuplicateIndex()
+    print("Computing MinHash signatures of the stored chunks...")
+    return NearDuplicateIndex.from_documents(
+        Document(id=chunk_id, page_content=db.docstore.search(chunk_id).page_content)
+        for chunk_id in db.index_to_docstore_id.values()
+    )
@@ -0,0 +1,385 @@
+"""
+This module runs the embedding model as an int8-quantized ONNX graph with onnxruntime.
+
+With the default "torch" `config.EMBEDDING_BACKEND`, every embedding, including the
+one computed for each question in the chat, runs the full-precision PyTorch model,
+and loading it imports torch. With "onnx", `load_embedding_model` uses
+`OnnxEmbeddingEngine` instead. It runs an ONNX export of the same sentence-transformer
+whose weights were quantized to int8, and needs only onnxruntime and tokenizers.
+
+The export is created once, on a machine with sentence-transformers, torch and
+onnxruntime installed (`pip install onnxruntime onnx`), and is checked against the
+torch backend on chunks from the data directory:
+
+    python onnx_embeddings.py export
+    python onnx_embeddings.py compare
+"""
+
+import argparse
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+import config
+from embedding_engine import EmbeddingEngine
+
+ONNX_FP32_FILE = "model.onnx"
+ONNX_SETTINGS_FILE = "embedding_settings.json"
+
+# Questions used by `compare` when no query file is given.
+DEFAULT_QUERIES = [
+    "How much should I keep in an emergency fund?",
+    "What is the debt snowball method?",
+    "Should I pay off my mortgage early?",
+    "How do I save for retirement with a 401(k)?",
+    "What is the standard deduction for a single filer?",
+    "Who qualifies as a dependent?",
+    "How is interest on Treasury bonds taxed?",
+    "Can I deduct IRA contributions?",
+    "How do I get out of credit card debt?",
+    "What should I know before buying a car with a loan?",
+    "How much house can I afford?",
+    "When do I have to file a tax return?",
+]
+
+
+class OnnxSentenceEncoder:
+    """
+    Encodes text with an exported sentence-transformer: tokenize, run the ONNX graph, pool.
+    """
+
+    def __init__(self, model_dir: str, model_file: str = config.ONNX_EMBEDDING_FILE, threads: int = 0):
+        """
+        Args:
+            model_dir (str): The directory written by `export_onnx_model`.
+            model_file (str): The ONNX graph in `model_dir` to run.
+            threads (int): onnxruntime intra-op threads; 0 uses every core.
+
+        Raises:
+            ImportError: If onnxruntime or tokenizers is not installed.
+            FileNotFoundError: If the model has not been exported yet.
+        """
+        try:
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError(
+                "The ONNX embedding backend needs `onnxruntime` and `tokenizers` "
+                "(pip install onnxruntime), or set EMBEDDING_BACKEND = \"torch\"."
+            ) from e
+
+        path = os.path.join(model_dir, model_file)
+        if not os.path.exists(path):
+            raise FileNotFoundError(
+                f"No ONNX embedding model at {path}; create it with `python onnx_embeddings.py export`."
+            )
+        with open(os.path.join(model_dir, ONNX_SETTINGS_FILE), "r", encoding="utf-8") as f:
+            self.settings = json.load(f)
+        self.max_seq_length = self.settings["max_seq_length"]
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.max_seq_length)
+        self.tokenizer.no_padding()
+
+    def token_lengths(self, texts: List[str]) -> np.ndarray:
+        """
+        Counts the tokens the model reads from each text, after truncation.
+
+        Args:
+            texts (List[str]): The texts.
+
+        Returns:
+            np.ndarray: The token count of each text, including special tokens.
+        """
+        return np.fromiter(
+            (len(encoding.ids) for encoding in self.tokenizer.encode_batch(texts)), dtype=np.int64, count=len(texts)
+        )
+
+    def encode(self, texts: List[str], batch_size: int = 32, normalize_embeddings: bool = False, **_) -> np.ndarray:
+        """
+        Embeds texts, padding each batch to its longest text.
+
+        Args:
+            texts (List[str]): The texts to embed.
+            batch_size (int): Number of texts per run of the graph.
+            normalize_embeddings (bool): Whether to scale the vectors to unit length.
+
+        Returns:
+            np.ndarray: The float32 embeddings, one row per text.
+        """
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            encodings = self.tokenizer.encode_batch(texts[start:start + batch_size])
+            length = max(len(encoding.ids) for encoding in encodings)
+            input_ids = np.full((len(encodings), length), self.settings["pad_token_id"], dtype=np.int64)
+            attention_mask = np.zeros((len(encodings), length), dtype=np.int64)
+            token_type_ids = np.zeros((len(encodings), length), dtype=np.int64)
+            for row, encoding in enumerate(encodings):
+                n = len(encoding.ids)
+                input_ids[row, :n] = encoding.ids
+                attention_mask[row, :n] = 1
+                token_type_ids[row, :n] = encoding.type_ids
+            inputs = {"input_ids": input_ids, "attention_mask": attention_mask, "token_type_ids": token_type_ids}
+            hidden = self.session.run(None, {name: inputs[name] for name in self.input_names})[0]
+            batches.append(self._pool(hidden, attention_mask))
+
+        vectors = np.concatenate(batches).astype(np.float32) if batches else np.empty((0, 0), np.float32)
+        if self.settings["normalize"] or normalize_embeddings:
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors
+
+    def _pool(self, hidden: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        """Applies the model's pooling to the token embeddings."""
+        if self.settings["pooling"] == "cls":
+            return hidden[:, 0]
+        mask = attention_mask[..., None].astype(hidden.dtype)
+        return (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+
+class OnnxEmbeddingEngine(EmbeddingEngine):
+    """
+    An `EmbeddingEngine` that runs the quantized ONNX export instead of PyTorch.
+
+    onnxruntime already spreads each batch over the CPU cores, so it encodes in this
+    process only.
+    """
+
+    def __init__(
+        self,
+        model_dir: str = config.ONNX_EMBEDDING_DIR,
+        encode_kwargs: Optional[Dict] = None,
+        batch_size: int = config.EMBEDDING_ENCODE_BATCH_SIZE,
+        report_every: float = config.EMBEDDING_REPORT_EVERY_SECONDS,
+    ):
+        """
+        Args:
+            model_dir (str): The directory written by `export_onnx_model`.
+            encode_kwargs (Optional[Dict]): Keyword arguments for encoding.
+            batch_size (int): Number of texts per run of the graph.
+            report_every (float): Seconds between throughput reports; 0 disables them.
+        """
+        super().__init__(
+            model_name=model_dir,
+            model_kwargs={},
+            encode_kwargs=encode_kwargs,
+            batch_size=batch_size,
+            workers=1,
+            report_every=report_every,
+        )
+
+    def token_lengths(self, texts: List[str]) -> np.ndarray:
+        return self.model.token_lengths(texts)
+
+    def _load_model(self, model_name: str, model_kwargs: Dict) -> OnnxSentenceEncoder:
+        return OnnxSentenceEncoder(model_name, **model_kwargs)
+
+
+def export_onnx_model(
+    model_name: str = config.EMBEDDING_MODEL_NAME,
+    output_dir: str = config.ONNX_EMBEDDING_DIR,
+    quantized_file: str = config.ONNX_EMBEDDING_FILE,
+):
+    """
+    Exports the sentence-transformer to ONNX and quantizes its weights to int8.
+
+    Writes the float32 graph, the dynamically quantized graph, the tokenizer and the
+    pooling settings to `output_dir`. Needs sentence-transformers, torch, onnx and
+    onnxruntime.
+
+    Args:
+        model_name (str): The sentence-transformers model to export.
+        output_dir (str): The directory to write.
+        quantized_file (str): The file name of the quantized graph.
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from sentence_transformers import SentenceTransformer
+    from sentence_transformers.models import Normalize, Pooling
+
+    model = SentenceTransformer(model_name, device="cpu")
+    pooling = next(module for module in model if isinstance(module, Pooling))
+    pooling_mode = pooling.get_pooling_mode_str()
+    if pooling_mode not in ("mean", "cls"):
+        raise ValueError(f"Pooling mode {pooling_mode!r} is not supported by the ONNX backend.")
+
+    os.makedirs(output_dir, exist_ok=True)
+    transformer = model[0].auto_model.eval()
+    tokenizer = model.tokenizer
+    sample = tokenizer(["How much should I keep in an emergency fund?"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in [*input_names, "last_hidden_state"]}
+
+    fp32_path = os.path.join(output_dir, ONNX_FP32_FILE)
+    print(f"Exporting {model_name} to {fp32_path}...")
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(sample[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=17,
+            dynamo=False,
+        )
+
+    quantized_path = os.path.join(output_dir, quantized_file)
+    print(f"Quantizing weights to int8: {quantized_path}")
+    quantize_dynamic(fp32_path, quantized_path, weight_type=QuantType.QInt8)
+
+    tokenizer.save_pretrained(output_dir)
+    settings = {
+        "model_name": model_name,
+        "pooling": pooling_mode,
+        "normalize": any(isinstance(module, Normalize) for module in model),
+        "max_seq_length": model.max_seq_length,
+        "pad_token_id": tokenizer.pad_token_id or 0,
+    }
+    with open(os.path.join(output_dir, ONNX_SETTINGS_FILE), "w", encoding="utf-8") as f:
+        json.dump(settings, f, indent=2)
+    for name in (ONNX_FP32_FILE, quantized_file):
+        print(f"  {name}: {os.path.getsize(os.path.join(output_dir, name)) / 2**20:.1f} MB")
+
+
+def _time_backend(engine: EmbeddingEngine, texts: List[str], queries: List[str]) -> Dict:
+    """Embeds the texts in bulk and the queries one at a time, timing both."""
+    engine.embed_query(queries[0])  # Warm up.
+    start = time.perf_counter()
+    documents = np.asarray(engine.embed_documents(texts), dtype=np.float32)
+    bulk_seconds = time.perf_counter() - start
+
+    latencies, query_vectors = [], []
+    for query in queries:
+        start = time.perf_counter()
+        query_vectors.append(engine.embed_query(query))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return {
+        "documents": documents,
+        "queries": np.asarray(query_vectors, dtype=np.float32),
+        "bulk_chunks_per_second": len(texts) / bulk_seconds,
+        "query_ms": float(np.median(latencies)),
+        "p95_query_ms": float(np.percentile(latencies, 95)),
+    }
+
+
+def _top_k(documents: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Returns the IDs of each query's k nearest documents by L2 distance, as the store ranks them."""
+    import faiss
+
+    index = faiss.IndexFlatL2(documents.shape[1])
+    index.add(documents)
+    return index.search(queries, k)[1]
+
+
+def _overlap(expected: np.ndarray, actual: np.ndarray) -> float:
+    """Returns the mean fraction of each row of `expected` that also appears in `actual`."""
+    return float(np.mean([len(set(e) & set(a)) / len(e) for e, a in zip(expected, actual)]))
+
+
+def compare_backends(
+    texts: List[str],
+    queries: List[str],
+    k: int = config.RETRIEVAL_K,
+    model_dir: str = config.ONNX_EMBEDDING_DIR,
+) -> Dict:
+    """
+    Compares the ONNX backend with the torch backend on the same texts.
+
+    Args:
+        texts (List[str]): Chunk texts embedded by both backends.
+        queries (List[str]): Questions whose top-k chunks are compared.
+        k (int): The number of retrieved chunks compared.
+        model_dir (str): The directory of the ONNX export.
+
+    Returns:
+        Dict: Cosine agreement of the chunk vectors, top-k overlap, and the bulk
+        and single-query speed of each backend.
+    """
+    reference = _time_backend(EmbeddingEngine(workers=1, report_every=0), texts, queries)
+    candidate = _time_backend(OnnxEmbeddingEngine(model_dir, report_every=0), texts, queries)
+
+    a, b = reference["documents"], candidate["documents"]
+    cosine = (a * b).sum(axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+    k = min(k, len(texts))
+    expected = _top_k(a, reference["queries"], k)
+    return {
+        "chunks": len(texts),
+        "queries": len(queries),
+        "k": k,
+        "cosine_mean": float(cosine.mean()),
+        "cosine_min": float(cosine.min()),
+        "cosine_p1": float(np.percentile(cosine, 1)),
+        # Both the chunks and the questions embedded with ONNX (a store rebuilt with it).
+        "overlap_rebuilt": _overlap(expected, _top_k(b, candidate["queries"], k)),
+        # Questions embedded with ONNX against chunks embedded with torch.
+        "overlap_mixed": _overlap(expected, _top_k(a, candidate["queries"], k)),
+        "torch": {key: value for key, value in reference.items() if key not in ("documents", "queries")},
+        "onnx": {key: value for key, value in candidate.items() if key not in ("documents", "queries")},
+    }
+
+
+def print_comparison(report: Dict):
+    """
+    Prints the result of `compare_backends`.
+
+    Args:
+        report (Dict): The comparison report.
+    """
+    print(f"{report['chunks']} chunks, {report['queries']} queries")
+    print(
+        f"Cosine similarity, ONNX vs torch chunk vectors: mean {report['cosine_mean']:.4f}, "
+        f"1st percentile {report['cosine_p1']:.4f}, min {report['cosine_min']:.4f}"
+    )
+    print(
+        f"Top-{report['k']} overlap with torch: {report['overlap_rebuilt']:.1%} with the store "
+        f"rebuilt with ONNX, {report['overlap_mixed']:.1%} with ONNX queries on the torch store"
+    )
+    print(f"{'Backend':<10}{'Bulk chunks/s':>15}{'Query ms':>10}{'p95 ms':>10}")
+    for name in ("torch", "onnx"):
+        row = report[name]
+        print(f"{name:<10}{row['bulk_chunks_per_second']:>15.1f}{row['query_ms']:>10.2f}{row['p95_query_ms']:>10.2f}")
+
+
+def main(argv: Optional[List[str]] = None):
+    """
+    Exports the ONNX model or compares it with the torch backend.
+
+    Args:
+        argv (Optional[List[str]]): Command line arguments, defaults to `sys.argv`.
+    """
+    parser = argparse.ArgumentParser(description="Export and check the int8 ONNX embedding backend.")
+    parser.add_argument("command", choices=["export", "compare"])
+    parser.add_argument("--output", default=config.ONNX_EMBEDDING_DIR, help="Directory of the ONNX export.")
+    parser.add_argument("--data", default=config.DATA_PATH, help="Directory of source documents to compare on.")
+    parser.add_argument("--sample", type=int, default=1000, help="Number of chunks to compare on.")
+    parser.add_argument("--queries", help="File with one question per line (default: built-in questions).")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        export_onnx_model(output_dir=args.output)
+        return
+
+    from ingestion_pipeline import iter_chunks, iter_pages
+    from knowledge_base_manifest import list_sources
+
+    texts = [chunk.page_content for chunk in iter_chunks(iter_pages(list_sources(args.data)))]
+    step = max(1, len(texts) // args.sample)
+    texts = texts[::step][:args.sample]
+    queries = DEFAULT_QUERIES
+    if args.queries:
+        with open(args.queries, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    print_comparison(compare_backends(texts, queries, model_dir=args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+This module strips repeated page boilerplate from PDF pages before they are chunked.
+
+PyPDF's text for a book includes every running header, page number and footer, so
+the same lines are embedded once per page and end up in prompts. `clean_pages` looks
+at all pages of one file together and removes lines that:
+- sit among the first or last `config.BOILERPLATE_EDGE_LINES` lines of a page, and
+- appear there on at least `config.BOILERPLATE_MIN_PAGES` pages of the file, after
+  masking digits so "Chapter 3 Dependents 29" and "Chapter 3 Dependents 31" match,
+as well as bare page numbers at the top or bottom of a page. It also normalizes
+whitespace and rejoins words hyphenated across line breaks.
+"""
+
+import re
+from collections import Counter
+from dataclasses import dataclass
+from itertools import groupby
+from typing import Iterable, Iterator, List, Set, Tuple
+
+from langchain.docstore.document import Document
+
+import config
+
+PAGE_NUMBER = re.compile(r"^(page\s*)?([0-9]+|[ivxlc]+)$", re.IGNORECASE)
+INLINE_SPACE = re.compile(r"[ \t ]+")
+BLANK_LINES = re.compile(r"\n{3,}")
+HYPHENATED = re.compile(r"(\w+)-\n([a-z]\w*)")
+WORD = re.compile(r"\w+(?:-\w+)*")
+
+# Repeated lines shorter than this (in letters) are kept: short labels such as
+# "Truth:" recur in a book's body text, while running headers name the book or chapter.
+MIN_BOILERPLATE_LETTERS = 8
+
+
+@dataclass
+class CleaningStats:
+    """What page cleaning removed from one file."""
+
+    source: str
+    pages: int = 0
+    chars_before: int = 0
+    chars_after: int = 0
+    boilerplate_patterns: int = 0
+    lines_removed: int = 0
+
+    def summary(self) -> str:
+        """Returns a one-line description of the cleaning."""
+        removed = 1 - self.chars_after / self.chars_before if self.chars_before else 0.0
+        return (
+            f"Cleaned {self.source}: {self.pages} pages, {self.chars_before:,} -> "
+            f"{self.chars_after:,} chars (-{removed:.1%}), {self.lines_removed} boilerplate lines "
+            f"removed ({self.boilerplate_patterns} repeated patterns)."
+        )
+
+
+def _line_key(line: str) -> str:
+    """Normalizes a line for comparison across pages."""
+    return re.sub(r"\d+", "#", INLINE_SPACE.sub(" ", line).strip().lower())
+
+
+def _edge_lines(lines: List[str], edge: int) -> Set[int]:
+    """
+    Returns the positions of the first and last `edge` non-empty lines.
+
+    Each zone covers at most a quarter of the page, so short pages keep their body.
+    """
+    filled = [i for i, line in enumerate(lines) if line.strip()]
+    edge = min(edge, len(filled) // 4)
+    return set(filled[:edge] + filled[len(filled) - edge:])
+
+
+def find_boilerplate(
+    pages: List[str],
+    edge: int = config.BOILERPLATE_EDGE_LINES,
+    min_pages: int = config.BOILERPLATE_MIN_PAGES,
+) -> Set[str]:
+    """
+    Learns the header and footer lines repeated across the pages of one file.
+
+    Args:
+        pages (List[str]): The text of every page of the file.
+        edge (int): Number of lines at the top and bottom of a page to consider.
+        min_pages (int): Number of pages a line must appear on to be boilerplate.
+
+    Returns:
+        Set[str]: The normalized keys of the boilerplate lines.
+    """
+    counts = Counter()
+    for text in pages:
+        lines = text.split("\n")
+        counts.update({_line_key(lines[i]) for i in _edge_lines(lines, edge)})
+    return {
+        key
+        for key, count in counts.items()
+        if count >= min_pages and sum(c.isalpha() for c in key) >= MIN_BOILERPLATE_LETTERS
+    }
+
+
+def _dehyphenate(text: str, vocabulary: Set[str]) -> str:
+    """
+    Rejoins words split across lines with a hyphen.
+
+    A word keeps its hyphen if the file also spells it hyphenated within a line
+    (e.g. "self-employed"); otherwise the hyphen was a line-break artifact.
+    """
+    def join(match: re.Match) -> str:
+        first, second = match.group(1), match.group(2)
+        if f"{first}-{second}".lower() in vocabulary:
+            return f"{first}-{second}"
+        return first + second
+
+    return HYPHENATED.sub(join, text)
+
+
+def normalize_whitespace(text: str) -> str:
+    """
+    Collapses runs of spaces, strips every line and limits blank lines to one.
+
+    Args:
+        text (str): The page text.
+
+    Returns:
+        str: The normalized text.
+    """
+    lines = [INLINE_SPACE.sub(" ", line).strip() for line in text.split("\n")]
+    return BLANK_LINES.sub("\n\n", "\n".join(lines)).strip()
+
+
+def clean_file_pages(
+    pages: List[Document],
+    edge: int = config.BOILERPLATE_EDGE_LINES,
+    min_pages: int = config.BOILERPLATE_MIN_PAGES,
+) -> Tuple[List[Document], CleaningStats]:
+    """
+    Cleans all pages of one file.
+
+    Args:
+        pages (List[Document]): The pages of the file, in order.
+        edge (int): Number of lines at the top and bottom of a page to consider.
+        min_pages (int): Number of pages a line must appear on to be boilerplate.
+
+    Returns:
+        Tuple[List[Document], CleaningStats]: The cleaned pages, with their metadata
+        unchanged, and what was removed.
+    """
+    texts = [page.page_content for page in pages]
+    stats = CleaningStats(
+        source=str(pages[0].metadata.get("source")) if pages else "",
+        pages=len(pages),
+        chars_before=sum(len(text) for text in texts),
+    )
+    boilerplate = find_boilerplate(texts, edge, min_pages) if len(pages) >= min_pages else set()
+    stats.boilerplate_patterns = len(boilerplate)
+    vocabulary = {word.lower() for text in texts for word in WORD.findall(text) if "-" in word}
+
+    cleaned = []
+    for page, text in zip(pages, texts):
+        lines = text.split("\n")
+        edges = _edge_lines(lines, edge)
+        kept = []
+        for i, line in enumerate(lines):
+            if i in edges:
+                key = _line_key(line)
+                if key in boilerplate or PAGE_NUMBER.match(key.replace("#", "0")):
+                    stats.lines_removed += 1
+                    continue
+            kept.append(line)
+        text = normalize_whitespace(_dehyphenate("\n".join(kept), vocabulary))
+        stats.chars_after += len(text)
+        cleaned.append(Document(page_content=text, metadata=page.metadata))
+    return cleaned, stats
+
+
+def clean_pages(pages: Iterable[Document]) -> Iterator[Document]:
+    """
+    Cleans a stream of pages file by file and logs the character counts.
+
+    The pages of each file must arrive together, as the PDF loaders yield them.
+    One file's pages are held in memory while its boilerplate is learned.
+
+    Args:
+        pages (Iterable[Document]): The pages to clean.
+
+    Yields:
+        Document: The cleaned pages, in the same order.
+    """
+    chars_before = chars_after = 0
+    for _, file_pages in groupby(pages, key=lambda page: page.metadata.get("source")):
+        cleaned, stats = clean_file_pages(list(file_pages))
+        print(stats.summary())
+        chars_before += stats.chars_before
+        chars_after += stats.chars_after
+        yield from cleaned
+    if chars_before:
+        print(
+            f"Page cleaning: {chars_before:,} -> {chars_after:,} chars "
+            f"(-{1 - chars_after / chars_before:.1%}) before chunking."
+        )
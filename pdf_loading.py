@@ -0,0 +1,195 @@
+"""
+This module parses PDF files in parallel across a pool of worker processes.
+
+pypdf is pure Python and CPU-bound, so a large book parsed with `PyPDFLoader` keeps a
+single core busy while the others sit idle. Here every PDF is cut into page ranges
+and the ranges of all files are spread over a process pool. The results are collected
+in submission order, with only a few ranges in flight at a time, so pages come back
+in the same order, and with the same `source`/`page` metadata, as `PyPDFLoader`
+produces.
+"""
+
+import math
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import pypdf
+from langchain.docstore.document import Document
+from langchain_community.document_loaders import PyPDFLoader
+
+import config
+
+# (source path, first page, end page, page labels) handed to a worker process.
+PageRange = Tuple[str, int, int, List[str]]
+
+# Metadata keys renamed the way PyPDFLoader names them; the original key is kept too.
+PDF_METADATA_ALIASES = {"page_count": "total_pages", "file_path": "source"}
+
+
+def resolve_worker_count(max_workers: Optional[int]) -> int:
+    """
+    Returns the number of worker processes to use.
+
+    Args:
+        max_workers (Optional[int]): The configured number of workers, None for all cores.
+
+    Returns:
+        int: The number of worker processes, at least 1.
+    """
+    return max(1, max_workers or os.cpu_count() or 1)
+
+
+def plan_page_ranges(paths: List[str], pages_per_task: int, workers: int) -> List[PageRange]:
+    """
+    Splits every PDF into page ranges that can be parsed independently.
+
+    Ranges are made smaller than `pages_per_task` when there are too few pages in
+    total to give every worker several tasks, which keeps the pool evenly loaded.
+    pypdf only computes page labels for a whole document, so they are read once per
+    file here and every range carries the labels of its own pages.
+
+    Args:
+        paths (List[str]): The PDF files to parse.
+        pages_per_task (int): The maximum number of pages per task.
+        workers (int): The number of worker processes.
+
+    Returns:
+        List[PageRange]: The page ranges in document order.
+    """
+    page_labels = {path: pypdf.PdfReader(path).page_labels for path in paths}
+    total_pages = sum(len(labels) for labels in page_labels.values())
+    step = max(1, min(pages_per_task, math.ceil(total_pages / (workers * 4))))
+
+    ranges = []
+    for path, labels in page_labels.items():
+        for start in range(0, len(labels), step):
+            end = min(start + step, len(labels))
+            ranges.append((path, start, end, labels[start:end]))
+    return ranges
+
+
+def normalize_pdf_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Normalizes PDF document metadata the way `PyPDFLoader` does.
+
+    Keys lose their leading "/" and are lowercased, values become strings or ints,
+    creation and modification dates become ISO 8601 strings, and `PDF_METADATA_ALIASES`
+    keys are also stored under their alias.
+
+    Args:
+        metadata (Dict[str, Any]): The raw metadata of the PDF.
+
+    Returns:
+        Dict[str, Any]: The normalized metadata.
+    """
+    normalized = {}
+    for key, value in metadata.items():
+        if type(value) not in (str, int):
+            value = str(value)
+        key = (key[1:] if key.startswith("/") else key).lower()
+        if key in ("creationdate", "moddate"):
+            try:
+                normalized[key] = datetime.strptime(value.replace("'", ""), "D:%Y%m%d%H%M%S%z").isoformat("T")
+            except ValueError:
+                normalized[key] = value
+        elif key in PDF_METADATA_ALIASES:
+            normalized[PDF_METADATA_ALIASES[key]] = value
+            normalized[key] = value
+        elif isinstance(value, str):
+            normalized[key] = value.strip()
+        else:
+            normalized[key] = value
+    return normalized
+
+
+def parse_page_range(page_range: PageRange) -> List[Tuple[str, Dict]]:
+    """
+    Extracts the text of a range of pages, the way `PyPDFLoader` does.
+
+    This runs inside a worker process. It returns plain tuples rather than
+    `Document` objects to keep the data sent back to the parent small.
+
+    Args:
+        page_range (PageRange): The file, the pages to extract and their labels.
+
+    Returns:
+        List[Tuple[str, Dict]]: The text and metadata of each page.
+    """
+    source, start, end, page_labels = page_range
+    reader = pypdf.PdfReader(source)
+    doc_metadata = normalize_pdf_metadata(
+        {"producer": "PyPDF", "creator": "PyPDF", "creationdate": ""}
+        | dict(reader.metadata or {})
+        | {"source": source, "total_pages": len(reader.pages)}
+    )
+
+    pages = []
+    for page_number, page_label in zip(range(start, end), page_labels):
+        text = reader.pages[page_number].extract_text(extraction_mode="plain").strip()
+        metadata = doc_metadata | {"page": page_number, "page_label": page_label}
+        pages.append((text, metadata))
+    return pages
+
+
+def iter_pdf_pages(
+    paths: List[str],
+    max_workers: Optional[int] = config.PDF_LOADER_WORKERS,
+    pages_per_task: int = config.PDF_PAGES_PER_TASK,
+) -> Iterator[Document]:
+    """
+    Yields the pages of the given PDFs, parsing them across a process pool.
+
+    Args:
+        paths (List[str]): The PDF files to parse.
+        max_workers (Optional[int]): Worker processes to use; None uses every core
+            and 1 parses in this process with `PyPDFLoader`.
+        pages_per_task (int): The maximum number of pages handed to a worker at once.
+
+    Yields:
+        Document: One document per page, in file and page order.
+    """
+    workers = resolve_worker_count(max_workers)
+    if workers == 1:
+        for path in paths:
+            yield from PyPDFLoader(path).lazy_load()
+        return
+
+    # Only keep a few ranges in flight per worker, so parsed pages never pile up
+    # in memory faster than the caller consumes them.
+    page_ranges = plan_page_ranges(paths, pages_per_task, workers)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for page_range in page_ranges:
+            pending.append(pool.submit(parse_page_range, page_range))
+            if len(pending) >= workers * 2:
+                yield from _to_documents(pending.popleft().result())
+        while pending:
+            yield from _to_documents(pending.popleft().result())
+
+
+def _to_documents(pages: List[Tuple[str, Dict]]) -> Iterator[Document]:
+    for text, metadata in pages:
+        yield Document(page_content=text, metadata=metadata)
+
+
+def load_pdf_files(
+    paths: List[str],
+    max_workers: Optional[int] = config.PDF_LOADER_WORKERS,
+    pages_per_task: int = config.PDF_PAGES_PER_TASK,
+) -> List[Document]:
+    """
+    Loads the pages of the given PDFs, parsing them across a process pool.
+
+    Args:
+        paths (List[str]): The PDF files to parse.
+        max_workers (Optional[int]): Worker processes to use; None uses every core
+            and 1 parses in this process with `PyPDFLoader`.
+        pages_per_task (int): The maximum number of pages handed to a worker at once.
+
+    Returns:
+        List[Document]: One document per page, in file and page order.
+    """
+    return list(iter_pdf_pages(paths, max_workers, pages_per_task))
@@ -0,0 +1,313 @@
+"""
+This module caches query embeddings and retrieval results for the chat applications.
+
+Users ask the same handful of questions over and over, and each of them used to be
+embedded and searched again. `CachedRetriever` keeps two process-wide LRU caches with
+a time-to-live, shared by every Streamlit session in the process:
+- normalized query -> query embedding
+- (normalized query, k, filter) -> vector positions of the top-k chunks
+
+With `config.HYBRID_RETRIEVAL`, the top-k are the vector ranking fused with the BM25
+keyword ranking of `sparse_index`. A `MetadataFilter` restricts both rankings to the
+chunks of some sources, pages or topics (see `metadata_index`).
+
+Both caches are cleared, and the vector store is reloaded, as soon as the vector store
+files on disk change, so answers never come from an index that has been rebuilt.
+"""
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+from langchain.docstore.document import Document
+from langchain_community.vectorstores import FAISS
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+
+import config
+from metadata_index import MetadataFilter, MetadataIndex, filtered_search, load_metadata_index
+from sparse_index import SparseIndex, load_sparse_index, reciprocal_rank_fusion
+from sqlite_docstore import SQLiteDocstore
+
+# Files whose modification marks a rebuilt vector store.
+STORE_FILES = (
+    "index.faiss",
+    "ann.faiss",
+    "shards/catalog.json",
+    "chunks.sqlite",
+    "bm25/meta.json",
+    "metadata/meta.json",
+)
+
+
+class LRUCache:
+    """
+    A thread-safe least-recently-used cache whose entries expire after a TTL.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        """
+        Args:
+            max_entries (int): The maximum number of entries kept.
+            ttl_seconds (float): How long an entry stays valid after it is stored.
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Returns the cached value, or None if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any):
+        """Stores a value, evicting the least recently used entry if the cache is full."""
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Removes every entry."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        """Returns the hit/miss counters and the number of entries."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalizes a question so trivially different phrasings share a cache entry.
+
+    The embedding model is uncased, so lowercasing does not change the embedding.
+
+    Args:
+        query (str): The user's question.
+
+    Returns:
+        str: The lowercased question with collapsed whitespace and no trailing
+        punctuation.
+    """
+    return re.sub(r"\s+", " ", query).strip().lower().rstrip("?!. ")
+
+
+def store_signature(db_path: str = config.DB_FAISS_PATH) -> Tuple:
+    """
+    Returns a value that changes whenever the vector store files are rewritten.
+
+    Args:
+        db_path (str): The vector store directory.
+
+    Returns:
+        Tuple: The modification time and size of each store file.
+    """
+    signature = []
+    for name in STORE_FILES:
+        try:
+            stat = os.stat(os.path.join(db_path, name))
+            signature.append((name, stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            signature.append((name, None, None))
+    return tuple(signature)
+
+
+class RetrievalCache:
+    """
+    The process-wide query embedding and top-k caches, tied to one vector store.
+    """
+
+    def __init__(
+        self,
+        db_path: str = config.DB_FAISS_PATH,
+        max_entries: int = config.RETRIEVAL_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = config.RETRIEVAL_CACHE_TTL_SECONDS,
+    ):
+        self.db_path = db_path
+        self.embeddings = LRUCache(max_entries, ttl_seconds)
+        self.results = LRUCache(max_entries, ttl_seconds)
+        self.invalidations = 0
+        self._signature = store_signature(db_path)
+        self._lock = threading.Lock()
+
+    def check_store(self) -> bool:
+        """
+        Clears the caches if the vector store on disk changed since the last check.
+
+        Returns:
+            bool: True if the store changed.
+        """
+        signature = store_signature(self.db_path)
+        with self._lock:
+            if signature == self._signature:
+                return False
+            self._signature = signature
+            self.invalidations += 1
+        self.embeddings.clear()
+        self.results.clear()
+        return True
+
+    def stats(self) -> Dict:
+        """Returns the hit-rate metrics of both caches."""
+        return {
+            "embeddings": self.embeddings.stats(),
+            "results": self.results.stats(),
+            "invalidations": self.invalidations,
+        }
+
+
+_retrieval_cache: Optional[RetrievalCache] = None
+_retrieval_cache_lock = threading.Lock()
+
+
+def get_retrieval_cache() -> RetrievalCache:
+    """Returns the retrieval cache shared by every session in this process."""
+    global _retrieval_cache
+    with _retrieval_cache_lock:
+        if _retrieval_cache is None:
+            _retrieval_cache = RetrievalCache()
+        return _retrieval_cache
+
+
+def fetch_documents(db: FAISS, rows: List[int]) -> List[Document]:
+    """
+    Reads the chunks stored at the given vector positions.
+
+    Args:
+        db (FAISS): The vector store.
+        rows (List[int]): The vector positions, in rank order.
+
+    Returns:
+        List[Document]: The chunks, in rank order.
+    """
+    if isinstance(db.docstore, SQLiteDocstore):
+        return db.docstore.fetch(rows)
+    return [db.docstore.search(db.index_to_docstore_id[row]) for row in rows]
+
+
+class CachedRetriever(BaseRetriever):
+    """
+    A FAISS similarity retriever that serves repeated questions from the retrieval cache.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    vectorstore: FAISS
+    # Reloads the vector store after it was rebuilt on disk.
+    reload_vectorstore: Optional[Callable[[], FAISS]] = None
+    k: int = config.RETRIEVAL_K
+    # Fuse the vector ranking with the BM25 ranking, when a BM25 index was built.
+    hybrid: bool = config.HYBRID_RETRIEVAL
+    sparse_index: Optional[SparseIndex] = None
+    metadata_index: Optional[MetadataIndex] = None
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """
+        Returns the embedding of a normalized query, computing it on a cache miss.
+
+        Args:
+            query (str): The normalized query.
+
+        Returns:
+            np.ndarray: The float32 query embedding.
+        """
+        cache = get_retrieval_cache()
+        embedding = cache.embeddings.get(query)
+        if embedding is None:
+            embedding = np.asarray(self.vectorstore.embedding_function.embed_query(query), dtype=np.float32)
+            cache.embeddings.put(query, embedding)
+        return embedding
+
+    def search_rows(self, query: str, search_filter: Optional[MetadataFilter] = None) -> List[int]:
+        """
+        Returns the vector positions of the top-k chunks for a question.
+
+        Args:
+            query (str): The user's question.
+            search_filter (Optional[MetadataFilter]): Restricts the search to the
+                chunks of some sources, pages or topics.
+
+        Returns:
+            List[int]: The vector positions, in rank order.
+        """
+        cache = get_retrieval_cache()
+        changed = cache.check_store()
+        if changed and self.reload_vectorstore is not None:
+            self.vectorstore = self.reload_vectorstore()
+        if self.hybrid and (changed or self.sparse_index is None):
+            self.sparse_index = load_sparse_index(cache.db_path)
+        search_filter = search_filter or None
+        if search_filter is not None and (changed or self.metadata_index is None):
+            self.metadata_index = load_metadata_index(cache.db_path)
+            if self.metadata_index is None:
+                print("No metadata index found; searching every chunk. Run Setting_Up_Vector_Store.py to build it.")
+
+        normalized = normalize_query(query)
+        rows = cache.results.get((normalized, self.k, search_filter))
+        if rows is None:
+            embedding = self.embed_query(normalized)
+            allowed = None
+            if search_filter is not None and self.metadata_index is not None:
+                allowed = self.metadata_index.select_rows(search_filter)
+            if self.hybrid and self.sparse_index is not None:
+                n_candidates = max(self.k, config.HYBRID_CANDIDATES)
+                dense = self.dense_search(embedding, n_candidates, allowed)
+                _, sparse = self.sparse_index.search(normalized, n_candidates, allowed)
+                rows = reciprocal_rank_fusion([dense, sparse.tolist()], self.k)
+            else:
+                rows = self.dense_search(embedding, self.k, allowed)
+            cache.results.put((normalized, self.k, search_filter), rows)
+        return rows
+
+    def dense_search(self, embedding: np.ndarray, k: int, allowed: Optional[np.ndarray] = None) -> List[int]:
+        """
+        Returns the vector positions of the chunks nearest to a query embedding.
+
+        Args:
+            embedding (np.ndarray): The float32 query embedding.
+            k (int): The number of results.
+            allowed (Optional[np.ndarray]): The sorted vector positions to search;
+                all if None.
+
+        Returns:
+            List[int]: The vector positions, nearest first.
+        """
+        if allowed is not None:
+            return filtered_search(self.vectorstore.index, embedding, k, allowed)
+        _, indices = self.vectorstore.index.search(embedding.reshape(1, -1), k)
+        return [int(row) for row in indices[0] if row != -1]
+
+    def _get_relevant_documents(
+        self,
+        query: str,
+        *,
+        run_manager: CallbackManagerForRetrieverRun,
+        search_filter: Optional[MetadataFilter] = None,
+    ) -> List[Document]:
+        return fetch_documents(self.vectorstore, self.search_rows(query, search_filter))
@@ -0,0 +1,264 @@
+"""
+This module splits page text into chunks described by offsets instead of string copies.
+
+`RecursiveCharacterTextSplitter` splits a page into pieces, re-splits the long ones
+with the next separator, and joins the pieces back into overlapping chunks. Each step
+creates new strings: every piece, every joined chunk, and again every overlapping
+chunk. `SpanSplitter` runs the same algorithm on (start, end) offsets into the page
+buffer. With the `len` length function ("characters" in
+`config.TEXT_SPLITTER_LENGTH`) pieces are measured from their offsets, so the only
+strings it creates are the chunks finally handed to the embedder and docstore.
+
+With any other length function, such as the tokenizer used in "tokens" mode, every
+piece still has to be copied out of the page and tokenized to be measured, just as
+LangChain does, and that dominates the run time; only the joined chunks and their
+overlaps are saved.
+
+The chunk boundaries are identical to those of the LangChain splitter it is created
+from. Run this module as a script to benchmark the two against each other:
+
+    python span_splitter.py
+"""
+
+import argparse
+import re
+import time
+from collections import deque
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from langchain.docstore.document import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+import config
+
+
+class Span(NamedTuple):
+    """A chunk of a page: the page's position in the input and the chunk's offsets."""
+
+    page_id: int
+    start: int
+    end: int
+
+
+class SpanSplitter:
+    """
+    A recursive character splitter that works on offsets into the page text.
+    """
+
+    def __init__(
+        self,
+        chunk_size: int,
+        chunk_overlap: int,
+        separators: Optional[List[str]] = None,
+        length_function: Optional[Callable[[str], int]] = None,
+    ):
+        """
+        Args:
+            chunk_size (int): Maximum length of a chunk.
+            chunk_overlap (int): Maximum length shared by consecutive chunks.
+            separators (Optional[List[str]]): Literal separators, tried in order.
+            length_function (Optional[Callable[[str], int]]): Measures a piece of text;
+                None counts characters directly from the offsets.
+        """
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = separators or ["\n\n", "\n", " ", ""]
+        self.length_function = length_function
+        self._patterns = [re.compile(re.escape(separator)) if separator else None for separator in self.separators]
+
+    @classmethod
+    def from_text_splitter(cls, splitter: RecursiveCharacterTextSplitter) -> "SpanSplitter":
+        """
+        Creates a span splitter with the settings of a LangChain splitter.
+
+        Args:
+            splitter (RecursiveCharacterTextSplitter): A splitter with literal separators
+                kept at the start of each piece and whitespace stripping, the defaults
+                used by `create_text_splitter`.
+
+        Returns:
+            SpanSplitter: A splitter producing the same chunk boundaries.
+
+        Raises:
+            ValueError: If the splitter uses settings the span splitter does not support.
+        """
+        if (
+            splitter._is_separator_regex
+            or splitter._keep_separator not in (True, "start")
+            or not splitter._strip_whitespace
+        ):
+            raise ValueError("Only literal separators kept at the start with stripped chunks are supported.")
+        length_function = splitter._length_function
+        return cls(
+            splitter._chunk_size,
+            splitter._chunk_overlap,
+            list(splitter._separators),
+            None if length_function is len else length_function,
+        )
+
+    def split(self, text: str) -> List[Tuple[int, int]]:
+        """
+        Splits a text into chunks.
+
+        Args:
+            text (str): The page text.
+
+        Returns:
+            List[Tuple[int, int]]: The (start, end) offsets of the chunks, in order.
+        """
+        if self.length_function is None:
+            measure = lambda start, end: end - start  # noqa: E731
+            separator_length = 0
+        else:
+            measure = lambda start, end: self.length_function(text[start:end])  # noqa: E731
+            separator_length = self.length_function("")
+        chunks: List[Tuple[int, int]] = []
+        self._split(text, 0, len(text), 0, measure, separator_length, chunks)
+        return chunks
+
+    def iter_spans(self, pages: Iterable[str]) -> Iterator[Span]:
+        """
+        Splits a sequence of page texts.
+
+        Args:
+            pages (Iterable[str]): The page texts.
+
+        Yields:
+            Span: The chunks of every page, in order.
+        """
+        for page_id, text in enumerate(pages):
+            for start, end in self.split(text):
+                yield Span(page_id, start, end)
+
+    def _split(self, text, start, end, level, measure, separator_length, chunks):
+        """Splits text[start:end] with the first separator from `level` that occurs in it."""
+        level_used, next_level = len(self.separators) - 1, None
+        for i in range(level, len(self.separators)):
+            pattern = self._patterns[i]
+            if pattern is None:
+                level_used = i
+                break
+            if pattern.search(text, start, end):
+                level_used = i
+                next_level = i + 1 if i + 1 < len(self.separators) else None
+                break
+
+        pattern = self._patterns[level_used]
+        if pattern is None:
+            pieces = [(i, i + 1) for i in range(start, end)]
+        else:
+            # The separator stays at the start of the piece that follows it, so pieces
+            # are contiguous and any run of them is one slice of the page.
+            bounds = [start, *(match.start() for match in pattern.finditer(text, start, end)), end]
+            pieces = [(a, b) for a, b in zip(bounds, bounds[1:]) if b > a]
+
+        good: List[Tuple[int, int, int]] = []
+        for piece_start, piece_end in pieces:
+            length = measure(piece_start, piece_end)
+            if length < self.chunk_size:
+                good.append((piece_start, piece_end, length))
+                continue
+            if good:
+                self._merge(text, good, separator_length, chunks)
+                good = []
+            if next_level is None:
+                chunks.append((piece_start, piece_end))
+            else:
+                self._split(text, piece_start, piece_end, next_level, measure, separator_length, chunks)
+        if good:
+            self._merge(text, good, separator_length, chunks)
+
+    def _merge(self, text, pieces, separator_length, chunks):
+        """Joins consecutive pieces into chunks of at most `chunk_size`, with overlap."""
+        current = deque()
+        total = 0
+        for piece in pieces:
+            length = piece[2]
+            if total + length + (separator_length if current else 0) > self.chunk_size and current:
+                self._emit(text, current[0][0], current[-1][1], chunks)
+                while current and (
+                    total > self.chunk_overlap
+                    or (total + length + (separator_length if current else 0) > self.chunk_size and total > 0)
+                ):
+                    total -= current[0][2] + (separator_length if len(current) > 1 else 0)
+                    current.popleft()
+            current.append(piece)
+            total += length + (separator_length if len(current) > 1 else 0)
+        if current:
+            self._emit(text, current[0][0], current[-1][1], chunks)
+
+    @staticmethod
+    def _emit(text, start, end, chunks):
+        """Adds text[start:end] without surrounding whitespace, unless it is empty."""
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if end > start:
+            chunks.append((start, end))
+
+
+def split_pages(pages: Iterable[Document], splitter: SpanSplitter) -> Iterator[Document]:
+    """
+    Splits pages into chunk documents, creating each chunk's text only when it is yielded.
+
+    Args:
+        pages (Iterable[Document]): The pages to split.
+        splitter (SpanSplitter): The splitter.
+
+    Yields:
+        Document: The chunks, with a copy of their page's metadata.
+    """
+    for page in pages:
+        text = page.page_content
+        for start, end in splitter.split(text):
+            yield Document(page_content=text[start:end], metadata=dict(page.metadata))
+
+
+def main(argv: Optional[List[str]] = None):
+    """
+    Benchmarks the span splitter against the LangChain splitter on the data directory.
+
+    Args:
+        argv (Optional[List[str]]): Command line arguments, defaults to `sys.argv`.
+    """
+    from ingestion_pipeline import create_text_splitter, iter_pages
+    from knowledge_base_manifest import list_sources
+
+    parser = argparse.ArgumentParser(description="Benchmark the span splitter against LangChain's.")
+    parser.add_argument("--data", default=config.DATA_PATH, help="Directory of source documents.")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timed runs of each splitter.")
+    args = parser.parse_args(argv)
+
+    pages = list(iter_pages(list_sources(args.data)))
+    characters = sum(len(page.page_content) for page in pages)
+    text_splitter = create_text_splitter()
+    span_splitter = SpanSplitter.from_text_splitter(text_splitter)
+
+    runs = {
+        "LangChain": lambda: [chunk for page in pages for chunk in text_splitter.split_documents([page])],
+        "spans": lambda: list(span_splitter.iter_spans(page.page_content for page in pages)),
+        "spans + text": lambda: list(split_pages(pages, span_splitter)),
+    }
+    print(f"Splitting {len(pages)} pages, {characters / 2**20:.1f} MB of text ({config.TEXT_SPLITTER_LENGTH}):")
+    if span_splitter.length_function is not None:
+        print("  (Pieces are copied and measured with the length function; only characters are measured from offsets.)")
+    results = {}
+    for name, run in runs.items():
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            results[name] = run()
+            best = min(best, time.perf_counter() - start)
+        print(
+            f"  {name:<13} {best * 1000:8.1f} ms  {characters / 2**20 / best:6.1f} MB/s  "
+            f"{len(results[name])} chunks"
+        )
+
+    expected = [chunk.page_content for chunk in results["LangChain"]]
+    actual = [chunk.page_content for chunk in results["spans + text"]]
+    print("Chunk boundaries identical." if expected == actual else "Chunk boundaries DIFFER.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+This module builds and searches a BM25 keyword index over the knowledge base chunks.
+
+Dense embeddings from all-MiniLM-l6-v2 blur exact terms such as form numbers
+("Form 8606") and plan names ("401(k)"), which keyword search matches precisely. The
+setup script writes a BM25 index over the same chunks as the serving vector store, and
+`CachedRetriever` fuses its ranking with the FAISS ranking by reciprocal rank fusion.
+
+The index is stored as flat NumPy arrays in `vectorstore/db_faiss/bm25/`, so it is
+memory-mapped instead of loaded:
+- `vocab.npy`: the sorted vocabulary, searched with binary search.
+- `offsets.npy`: where the postings of each term start in the two arrays below.
+- `rows.npy`: the vector position of each chunk containing the term.
+- `weights.npy`: the precomputed BM25 weight of the term in that chunk, so a query
+  is a sum over a few array slices.
+"""
+
+import json
+import os
+import re
+import shutil
+from collections import Counter
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain.docstore.document import Document
+
+import config
+
+SPARSE_INDEX_DIR = "bm25"
+
+# Longer tokens are dropped so the fixed-width vocabulary array stays small.
+MAX_TOKEN_LENGTH = 32
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:\([a-z0-9]+\))?")
+
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have if in into is it its of on or "
+    "that the their then there these they this to was were will with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits text into lowercase keyword tokens.
+
+    Parentheses inside a token are removed, so "401(k)" and "401k" match.
+
+    Args:
+        text (str): The text to tokenize.
+
+    Returns:
+        List[str]: The tokens, without stopwords.
+    """
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        token = token.replace("(", "").replace(")", "")
+        if token not in STOPWORDS and len(token) <= MAX_TOKEN_LENGTH:
+            tokens.append(token)
+    return tokens
+
+
+def build_sparse_index(
+    documents: Iterable[Document],
+    path: str,
+    k1: float = config.BM25_K1,
+    b: float = config.BM25_B,
+):
+    """
+    Builds a BM25 index over chunks and writes it to a directory.
+
+    The directory is written next to its final location and then moved into place,
+    so running application processes never see a half-written index.
+
+    Args:
+        documents (Iterable[Document]): The chunks, in vector position order.
+        path (str): The directory to write.
+        k1 (float): BM25 term frequency saturation.
+        b (float): BM25 document length normalization.
+    """
+    term_ids = {}
+    posting_terms, posting_rows, posting_tfs = [], [], []
+    lengths = []
+    for row, document in enumerate(documents):
+        counts = Counter(tokenize(document.page_content))
+        lengths.append(sum(counts.values()))
+        for term, tf in counts.items():
+            posting_terms.append(term_ids.setdefault(term, len(term_ids)))
+            posting_rows.append(row)
+            posting_tfs.append(tf)
+
+    n_docs = len(lengths)
+    lengths = np.asarray(lengths, dtype=np.float32)
+    avg_length = float(lengths.mean()) if n_docs else 0.0
+    terms = np.asarray(posting_terms, dtype=np.int64)
+    rows = np.asarray(posting_rows, dtype=np.int32)
+    tfs = np.asarray(posting_tfs, dtype=np.float32)
+
+    # Renumber terms in sorted order and group the postings by term.
+    vocab = np.array(sorted(term_ids), dtype=f"<U{MAX_TOKEN_LENGTH}")
+    rank = np.empty(len(term_ids), dtype=np.int64)
+    rank[[term_ids[term] for term in vocab]] = np.arange(len(vocab))
+    terms = rank[terms]
+    order = np.lexsort((rows, terms))
+    terms, rows, tfs = terms[order], rows[order], tfs[order]
+
+    doc_freq = np.bincount(terms, minlength=len(vocab))
+    offsets = np.concatenate([[0], np.cumsum(doc_freq)]).astype(np.int64)
+    idf = np.log(1 + (n_docs - doc_freq + 0.5) / (doc_freq + 0.5)).astype(np.float32)
+    norm = k1 * (1 - b + b * lengths[rows] / avg_length) if n_docs else tfs
+    weights = (idf[terms] * tfs * (k1 + 1) / (tfs + norm)).astype(np.float32)
+
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    np.save(os.path.join(tmp_path, "vocab.npy"), vocab)
+    np.save(os.path.join(tmp_path, "offsets.npy"), offsets)
+    np.save(os.path.join(tmp_path, "rows.npy"), rows)
+    np.save(os.path.join(tmp_path, "weights.npy"), weights)
+    with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"n_docs": n_docs, "avg_length": avg_length, "k1": k1, "b": b}, f)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    print(f"BM25 index: {len(vocab)} terms, {len(rows)} postings over {n_docs} chunks.")
+
+
+class SparseIndex:
+    """
+    A memory-mapped BM25 index written by `build_sparse_index`.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): The index directory.
+        """
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.n_docs = self.meta["n_docs"]
+        self.vocab = np.load(os.path.join(path, "vocab.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self.rows = np.load(os.path.join(path, "rows.npy"), mmap_mode="r")
+        self.weights = np.load(os.path.join(path, "weights.npy"), mmap_mode="r")
+
+    def search(self, query: str, k: int, allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the chunks with the highest BM25 score for a query.
+
+        Args:
+            query (str): The query text.
+            k (int): The number of chunks to return.
+            allowed (Optional[np.ndarray]): The sorted vector positions that may be
+                returned; all if None.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The scores and vector positions of the
+            best chunks, best first. Chunks sharing no term with the query are omitted.
+        """
+        term_ids = []
+        for token in set(tokenize(query)):
+            i = int(np.searchsorted(self.vocab, token))
+            if i < len(self.vocab) and self.vocab[i] == token:
+                term_ids.append(i)
+        if not term_ids:
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+
+        rows = np.concatenate([self.rows[self.offsets[i]:self.offsets[i + 1]] for i in term_ids])
+        weights = np.concatenate([self.weights[self.offsets[i]:self.offsets[i + 1]] for i in term_ids])
+        candidates, inverse = np.unique(rows, return_inverse=True)
+        scores = np.bincount(inverse, weights=weights)
+        if allowed is not None:
+            keep = np.isin(candidates, allowed, assume_unique=True)
+            candidates, scores = candidates[keep], scores[keep]
+        if len(candidates) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(candidates))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return scores[top].astype(np.float32), candidates[top].astype(np.int64)
+
+
+def load_sparse_index(db_path: str = config.DB_FAISS_PATH) -> Optional[SparseIndex]:
+    """
+    Loads the BM25 index of a vector store, if one has been built.
+
+    Args:
+        db_path (str): The vector store directory.
+
+    Returns:
+        Optional[SparseIndex]: The index, or None if it does not exist.
+    """
+    path = os.path.join(db_path, SPARSE_INDEX_DIR)
+    if not os.path.exists(os.path.join(path, "meta.json")):
+        return None
+    return SparseIndex(path)
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int, rrf_k: int = config.RRF_K) -> List[int]:
+    """
+    Merges several rankings of vector positions into one.
+
+    Each item scores the sum of 1 / (rrf_k + rank) over the rankings it appears in,
+    which needs no calibration between BM25 scores and vector distances.
+
+    Args:
+        rankings (List[List[int]]): The rankings to merge, best first.
+        k (int): The number of items to return.
+        rrf_k (int): Damps the weight of the top ranks.
+
+    Returns:
+        List[int]: The best `k` items, best first.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking):
+            scores[row] = scores.get(row, 0.0) + 1.0 / (rrf_k + rank + 1)
+    return sorted(scores, key=lambda row: -scores[row])[:k]
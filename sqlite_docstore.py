@@ -0,0 +1,189 @@
+"""
+This module stores chunk text and metadata in an indexed SQLite file.
+
+LangChain's FAISS wrapper keeps every chunk in an in-memory dict that is pickled next
+to the index, so each process that loads the store unpickles the whole corpus, and
+loading a pickle can execute arbitrary code. The serving store instead keeps chunks
+in `chunks.sqlite`, one row per FAISS vector position, and reads only the rows of the
+top-k hits. Together with a memory-mapped FAISS index, cold start and per-process
+memory stay small no matter how large the corpus grows.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from collections.abc import Mapping
+from typing import Dict, Iterable, Iterator, List, Union
+
+from langchain.docstore.document import Document
+from langchain_community.docstore.base import Docstore
+
+SERVING_DOCSTORE_FILE = "chunks.sqlite"
+
+
+class RowMapping(Mapping):
+    """
+    Maps FAISS vector positions to docstore keys without holding a dict in memory.
+
+    The serving docstore is keyed by vector position, so the mapping is the identity.
+    """
+
+    def __init__(self, size: int):
+        self._size = size
+
+    def __getitem__(self, row: int) -> int:
+        row = int(row)
+        if not 0 <= row < self._size:
+            raise KeyError(row)
+        return row
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(self._size))
+
+    def __len__(self) -> int:
+        return self._size
+
+
+class SQLiteDocstore(Docstore):
+    """
+    A read-only LangChain docstore backed by `chunks.sqlite`, keyed by vector position.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): The SQLite file written by `write_sqlite_docstore`.
+        """
+        if not os.path.exists(path):
+            raise FileNotFoundError(
+                f"{path} not found. Run Setting_Up_Vector_Store.py to build the serving docstore."
+            )
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        # SQLite connections cannot be shared across threads, and Streamlit serves
+        # each session from its own thread.
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            uri = f"file:{os.path.abspath(self.path)}?mode=ro"
+            connection = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            self._local.connection = connection
+        return connection
+
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def search(self, search: Union[int, str]) -> Union[str, Document]:
+        """
+        Looks up a chunk by vector position.
+
+        Args:
+            search (Union[int, str]): The vector position of the chunk.
+
+        Returns:
+            Union[str, Document]: The chunk, or an error message if it does not exist.
+        """
+        documents = self.fetch([int(search)])
+        return documents[0] if documents else f"ID {search} not found."
+
+    def fetch(self, rows: Iterable[int]) -> List[Document]:
+        """
+        Reads several chunks in one query.
+
+        Args:
+            rows (Iterable[int]): The vector positions to read.
+
+        Returns:
+            List[Document]: The chunks that exist, in the order requested.
+        """
+        rows = [int(row) for row in rows]
+        if not rows:
+            return []
+        placeholders = ",".join("?" * len(rows))
+        found = {
+            row: Document(id=doc_id, page_content=text, metadata=json.loads(metadata))
+            for row, doc_id, text, metadata in self._connection().execute(
+                f"SELECT row, doc_id, page_content, metadata FROM chunks WHERE row IN ({placeholders})",
+                rows,
+            )
+        }
+        return [found[row] for row in rows if row in found]
+
+    def rows_for_ids(self, doc_ids: Iterable[str]) -> Dict[str, int]:
+        """
+        Looks up the vector positions of chunks by their IDs.
+
+        Args:
+            doc_ids (Iterable[str]): The chunk IDs.
+
+        Returns:
+            Dict[str, int]: The vector position of each ID that exists.
+        """
+        doc_ids = list(doc_ids)
+        if not doc_ids:
+            return {}
+        placeholders = ",".join("?" * len(doc_ids))
+        return dict(
+            self._connection().execute(
+                f"SELECT doc_id, row FROM chunks WHERE doc_id IN ({placeholders})", doc_ids
+            )
+        )
+
+
+def write_sqlite_docstore(
+    documents: Iterable[Document],
+    path: str,
+    batch_size: int = 1000,
+):
+    """
+    Writes chunks to a new SQLite docstore, one row per vector position.
+
+    The file is written next to its final location and then moved into place, so
+    running application processes never see a half-written docstore.
+
+    Args:
+        documents (Iterable[Document]): The chunks, in vector position order.
+        path (str): The SQLite file to write.
+        batch_size (int): Number of rows inserted per statement batch.
+    """
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    connection = sqlite3.connect(tmp_path)
+    try:
+        connection.execute(
+            "CREATE TABLE chunks ("
+            "row INTEGER PRIMARY KEY, doc_id TEXT NOT NULL, page_content TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        connection.execute("CREATE UNIQUE INDEX chunks_doc_id ON chunks (doc_id)")
+        batch = []
+        for row, document in enumerate(documents):
+            batch.append((row, document.id, document.page_content, json.dumps(document.metadata)))
+            if len(batch) >= batch_size:
+                connection.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?)", batch)
+                batch = []
+        if batch:
+            connection.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?)", batch)
+        connection.commit()
+    finally:
+        connection.close()
+    os.replace(tmp_path, path)
+
+
+def iter_faiss_documents(db) -> Iterator[Document]:
+    """
+    Yields the chunks of a LangChain FAISS store in vector position order.
+
+    Args:
+        db (FAISS): The vector store.
+
+    Yields:
+        Document: The chunk stored for each vector position, with its ID set.
+    """
+    for row in range(len(db.index_to_docstore_id)):
+        doc_id = db.index_to_docstore_id[row]
+        document = db.docstore.search(doc_id)
+        yield Document(id=doc_id, page_content=document.page_content, metadata=document.metadata)
@@ -0,0 +1,37 @@
+import csv
+import os
+
+import pyarrow as pa
+import pyarrow.csv as pacsv
+
+from batch_calculators import run_batch
+
+
+def test_csv_with_sparse_columns_filled_after_the_first_block(tmp_path):
+    # Only the last clients have a second debt, an extra payment or a strategy, so
+    # the first block pyarrow infers CSV types from has those columns all empty.
+    input_path = tmp_path / "debts.csv"
+    rows = 40000
+    with open(input_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow([
+            "client_id", "balance_1", "rate_1", "min_payment_1",
+            "balance_2", "rate_2", "min_payment_2", "extra_payment", "strategy",
+        ])
+        for i in range(rows):
+            second = ["3640.69", "0.1", "100", "50", "snowball"] if i >= rows - 10 else ["", "", "", "", ""]
+            writer.writerow([i, f"{5000 + i % 1000:.2f}", "0.1835", "200.00"] + second)
+    assert os.path.getsize(input_path) > pacsv.ReadOptions().block_size
+
+    output_path = tmp_path / "payoffs.csv"
+    report = run_batch("debt_payoff", str(input_path), str(output_path), batch_rows=8192, max_workers=1)
+
+    assert report.rows == rows
+    table = pacsv.read_csv(output_path)
+    assert table.schema.field("balance_2").type == pa.float64()
+    assert table.column("paid_off").to_pylist() == [True] * rows
+    last = table.slice(rows - 1).to_pylist()[0]
+    assert last["balance_2"] == 3640.69
+    assert last["strategy"] == "snowball"
+    first = table.slice(0, 1).to_pylist()[0]
+    assert last["total_paid"] > first["total_paid"] + 3640.69
@@ -0,0 +1,200 @@
+"""
+This module sizes text chunks in tokens of the embedding model instead of characters.
+
+The embedding model only reads the first `config.EMBEDDING_MAX_SEQ_LENGTH` word
+pieces of its input; the rest of a longer chunk is tokenized, truncated, and never
+represented in the chunk's vector, so it cannot be found by vector search. With
+`config.TEXT_SPLITTER_LENGTH = "tokens"`, chunk length is measured with the model's
+own tokenizer and chunks are sized to fit.
+
+Run this module as a script to see how many chunks of the documents in the data
+directory each splitter setting produces and how many of them would be truncated:
+
+    python token_chunking.py
+"""
+
+import argparse
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+import config
+
+SEPARATORS = ["\n\n", "\n", " ", ""]
+
+# Special tokens the tokenizer adds around every input ([CLS] and [SEP]).
+SPECIAL_TOKENS = 2
+
+
+@lru_cache(maxsize=None)
+def load_tokenizer(model_name: str = config.EMBEDDING_MODEL_NAME):
+    """
+    Loads the tokenizer of the embedding model.
+
+    Args:
+        model_name (str): The Hugging Face model name.
+
+    Returns:
+        PreTrainedTokenizerBase: The model's (fast) tokenizer.
+
+    Raises:
+        ImportError: If the `transformers` package is not installed.
+    """
+    try:
+        from transformers import AutoTokenizer
+    except ImportError as e:
+        raise ImportError(
+            "Token-based chunking needs the `transformers` package (installed with "
+            "sentence-transformers). Install it or set TEXT_SPLITTER_LENGTH = \"characters\"."
+        ) from e
+    return AutoTokenizer.from_pretrained(model_name)
+
+
+def splitter_settings() -> Dict:
+    """
+    Returns the active text splitting settings, for the manifest's build settings.
+    """
+    if config.TEXT_SPLITTER_LENGTH == "tokens":
+        return {"length": "tokens", **config.TOKEN_SPLITTER_PARAMS}
+    return dict(config.TEXT_SPLITTER_PARAMS)
+
+
+def create_character_splitter(params: Optional[Dict] = None) -> RecursiveCharacterTextSplitter:
+    """
+    Creates a splitter that measures chunks in characters.
+
+    Args:
+        params (Optional[Dict]): Chunk size and overlap; `config.TEXT_SPLITTER_PARAMS`
+            if not given.
+
+    Returns:
+        RecursiveCharacterTextSplitter: The text splitter.
+    """
+    return RecursiveCharacterTextSplitter(
+        **(params or config.TEXT_SPLITTER_PARAMS),
+        length_function=len,
+        separators=SEPARATORS,
+    )
+
+
+def create_token_splitter(params: Optional[Dict] = None, tokenizer=None) -> RecursiveCharacterTextSplitter:
+    """
+    Creates a splitter that measures chunks in word pieces of the embedding model.
+
+    Args:
+        params (Optional[Dict]): Chunk size and overlap in tokens, excluding special
+            tokens; `config.TOKEN_SPLITTER_PARAMS` if not given.
+        tokenizer (Optional[PreTrainedTokenizerBase]): The tokenizer; the embedding
+            model's if not given.
+
+    Returns:
+        RecursiveCharacterTextSplitter: The text splitter.
+    """
+    params = params or config.TOKEN_SPLITTER_PARAMS
+    if params["chunk_size"] + SPECIAL_TOKENS > config.EMBEDDING_MAX_SEQ_LENGTH:
+        print(
+            f"Warning: token chunks of {params['chunk_size']} tokens exceed the embedding "
+            f"model's limit of {config.EMBEDDING_MAX_SEQ_LENGTH - SPECIAL_TOKENS} and will be truncated."
+        )
+    return RecursiveCharacterTextSplitter.from_huggingface_tokenizer(
+        tokenizer or load_tokenizer(),
+        **params,
+        separators=SEPARATORS,
+    )
+
+
+@dataclass
+class TruncationReport:
+    """How many chunks exceed the embedding model's input length, and by how much."""
+
+    chunks: int = 0
+    tokens: int = 0
+    truncated: int = 0
+    tokens_lost: int = 0
+    characters: int = 0
+
+    def summary(self) -> str:
+        """Returns a one-line description of the report."""
+        if not self.chunks:
+            return "0 chunks"
+        return (
+            f"{self.chunks} chunks, {self.tokens / self.chunks:.0f} tokens and "
+            f"{self.characters / self.chunks:.0f} characters on average; {self.truncated} "
+            f"truncated ({self.truncated / self.chunks:.1%}), losing {self.tokens_lost} of "
+            f"{self.tokens} tokens ({self.tokens_lost / max(self.tokens, 1):.1%})"
+        )
+
+
+def measure_truncation(
+    texts: Iterable[str],
+    tokenizer=None,
+    max_seq_length: int = config.EMBEDDING_MAX_SEQ_LENGTH,
+    batch_size: int = 256,
+) -> TruncationReport:
+    """
+    Counts the chunks that the embedding model would truncate.
+
+    Args:
+        texts (Iterable[str]): The chunk texts.
+        tokenizer (Optional[PreTrainedTokenizerBase]): The tokenizer; the embedding
+            model's if not given.
+        max_seq_length (int): The model's input limit, including special tokens.
+        batch_size (int): Number of texts tokenized at a time.
+
+    Returns:
+        TruncationReport: The chunk and token counts.
+    """
+    tokenizer = tokenizer or load_tokenizer()
+    report = TruncationReport()
+    batch: List[str] = []
+
+    def measure():
+        for text, ids in zip(batch, tokenizer(batch, verbose=False)["input_ids"]):
+            report.chunks += 1
+            report.tokens += len(ids)
+            report.characters += len(text)
+            if len(ids) > max_seq_length:
+                report.truncated += 1
+                report.tokens_lost += len(ids) - max_seq_length
+        batch.clear()
+
+    for text in texts:
+        batch.append(text)
+        if len(batch) == batch_size:
+            measure()
+    if batch:
+        measure()
+    return report
+
+
+def main(argv: Optional[List[str]] = None):
+    """
+    Reports the truncation of the data directory's chunks under each splitter setting.
+
+    Args:
+        argv (Optional[List[str]]): Command line arguments, defaults to `sys.argv`.
+    """
+    from ingestion_pipeline import iter_chunks, iter_pages
+    from knowledge_base_manifest import list_sources
+
+    parser = argparse.ArgumentParser(description="Report chunks truncated by the embedding model.")
+    parser.add_argument("--data", default=config.DATA_PATH, help="Directory of source documents.")
+    args = parser.parse_args(argv)
+
+    pages = list(iter_pages(list_sources(args.data)))
+    tokenizer = load_tokenizer()
+    splitters = {
+        f"characters {config.TEXT_SPLITTER_PARAMS}": create_character_splitter(),
+        f"tokens {config.TOKEN_SPLITTER_PARAMS}": create_token_splitter(tokenizer=tokenizer),
+    }
+    print(f"Embedding model input limit: {config.EMBEDDING_MAX_SEQ_LENGTH} tokens.")
+    for name, splitter in splitters.items():
+        texts = (chunk.page_content for chunk in iter_chunks(pages, splitter))
+        print(f"{name}: {measure_truncation(texts, tokenizer).summary()}")
+    print(f"Active setting: {config.TEXT_SPLITTER_LENGTH}")
+
+
+if __name__ == "__main__":
+    main()
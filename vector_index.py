@@ -0,0 +1,370 @@
+"""
+This module builds the FAISS index used to answer queries and reports its tradeoffs.
+
+The setup script always maintains an exact flat L2 index next to the docstore, because
+it supports incremental deletes and serves as the ground truth for recall. From it, this
+module builds the serving index chosen by `config.FAISS_INDEX_FACTORY` (HNSW, IVF-Flat,
+IVF-PQ, scalar-quantized storage, ...), sizes its training sample automatically, and
+prints a report comparing recall@k, query latency and size against exact search.
+
+Factory strings may contain the placeholders `{nlist}`, `{pq_m}` and `{pq_nbits}`,
+which are filled in from the number and dimension of the vectors.
+"""
+
+import json
+import math
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+import config
+
+SERVING_INDEX_FILE = "ann.faiss"
+SERVING_INDEX_INFO_FILE = "ann.json"
+
+# Number of training vectors FAISS recommends per centroid, at least and at most.
+MIN_POINTS_PER_CENTROID = 39
+MAX_POINTS_PER_CENTROID = 256
+
+
+def auto_parameters(n: int, dim: int) -> Dict[str, int]:
+    """
+    Chooses the IVF and PQ parameters for a given corpus size.
+
+    Args:
+        n (int): The number of vectors.
+        dim (int): The dimension of the vectors.
+
+    Returns:
+        Dict[str, int]: Values for the `nlist`, `pq_m` and `pq_nbits` placeholders.
+    """
+    # About 4 * sqrt(n) inverted lists, but never fewer training points per list
+    # than FAISS needs for stable k-means.
+    nlist = max(1, min(int(4 * math.sqrt(n)), n // MIN_POINTS_PER_CENTROID))
+    # Sub-quantizers of 8 dimensions each; the number must divide the dimension.
+    pq_m = max(m for m in range(1, dim // 8 + 1) if dim % m == 0) if dim >= 8 else dim
+    pq_nbits = max(1, min(8, int(math.log2(max(2, n // MIN_POINTS_PER_CENTROID)))))
+    return {"nlist": nlist, "pq_m": pq_m, "pq_nbits": pq_nbits}
+
+
+def resolve_factory_string(factory: str, n: int, dim: int) -> str:
+    """
+    Fills the placeholders of a factory string.
+
+    Args:
+        factory (str): The factory string, e.g. "IVF{nlist},PQ{pq_m}x{pq_nbits}".
+        n (int): The number of vectors.
+        dim (int): The dimension of the vectors.
+
+    Returns:
+        str: A factory string that `faiss.index_factory` accepts.
+    """
+    return factory.format(**auto_parameters(n, dim))
+
+
+def training_sample_size(index: faiss.Index, n: int) -> int:
+    """
+    Returns how many vectors to train an index on.
+
+    Args:
+        index (faiss.Index): The untrained index.
+        n (int): The number of vectors available.
+
+    Returns:
+        int: The training sample size (0 if the index needs no training).
+    """
+    if index.is_trained:
+        return 0
+    centroids = 1
+    try:
+        centroids = max(centroids, faiss.extract_index_ivf(index).nlist)
+    except RuntimeError:
+        pass
+    centroids = max(centroids, 2 ** auto_parameters(n, index.d)["pq_nbits"])
+    return min(n, centroids * MAX_POINTS_PER_CENTROID)
+
+
+def set_search_parameters(index: faiss.Index, nprobe: int, ef_search: int):
+    """
+    Sets the query-time parameters of IVF and HNSW indexes.
+
+    Args:
+        index (faiss.Index): The index to configure.
+        nprobe (int): The number of inverted lists to visit (IVF).
+        ef_search (int): The size of the candidate list (HNSW).
+    """
+    try:
+        ivf = faiss.extract_index_ivf(index)
+        ivf.nprobe = min(nprobe, ivf.nlist)
+    except RuntimeError:
+        pass
+    index = faiss.downcast_index(index)
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = ef_search
+
+
+def build_index(vectors: np.ndarray, factory: str, seed: int = 0) -> faiss.Index:
+    """
+    Builds, trains and fills an index from a factory string.
+
+    Args:
+        vectors (np.ndarray): The float32 vectors, in docstore order.
+        factory (str): The factory string, possibly with placeholders.
+        seed (int): Seed for picking the training sample.
+
+    Returns:
+        faiss.Index: The filled index.
+    """
+    n, dim = vectors.shape
+    index = faiss.index_factory(dim, resolve_factory_string(factory, n, dim), faiss.METRIC_L2)
+    sample_size = training_sample_size(index, n)
+    if sample_size:
+        rng = np.random.default_rng(seed)
+        sample = vectors[np.sort(rng.choice(n, size=sample_size, replace=False))]
+        index.train(sample)
+    index.add(vectors)
+    set_search_parameters(index, config.FAISS_NPROBE, config.FAISS_EF_SEARCH)
+    return index
+
+
+def index_size_bytes(index: faiss.Index) -> int:
+    """Returns the serialized size of an index."""
+    return int(faiss.serialize_index(index).size)
+
+
+def make_queries(vectors: np.ndarray, n_queries: int, seed: int = 0) -> np.ndarray:
+    """
+    Creates evaluation queries as midpoints of random pairs of stored vectors.
+
+    Midpoints fall between chunks like real questions do, instead of matching a
+    stored vector exactly, which would make every index look perfect at k=1.
+
+    Args:
+        vectors (np.ndarray): The stored vectors.
+        n_queries (int): The number of queries to create.
+        seed (int): Seed for picking the pairs.
+
+    Returns:
+        np.ndarray: The query vectors.
+    """
+    rng = np.random.default_rng(seed)
+    pairs = rng.integers(0, len(vectors), size=(n_queries, 2))
+    return ((vectors[pairs[:, 0]] + vectors[pairs[:, 1]]) / 2).astype(np.float32)
+
+
+def evaluate_index(
+    index: faiss.Index,
+    queries: np.ndarray,
+    exact_distances: np.ndarray,
+    vectors: np.ndarray,
+    k: int,
+) -> Dict:
+    """
+    Measures recall@k against exact search, single-query latency and size.
+
+    A result counts as a true neighbour when it is at least as close as the k-th
+    exact neighbour, so duplicate chunks with equal distances are not penalized.
+
+    Args:
+        index (faiss.Index): The index to evaluate.
+        queries (np.ndarray): The query vectors.
+        exact_distances (np.ndarray): The exact top-k squared L2 distances per query.
+        vectors (np.ndarray): The stored vectors, to compute true distances of results.
+        k (int): The number of neighbours compared.
+
+    Returns:
+        Dict: recall, mean and p95 latency in milliseconds, and size in megabytes.
+    """
+    latencies = []
+    hits = 0
+    for query, distances in zip(queries, exact_distances):
+        start = time.perf_counter()
+        _, ids = index.search(query.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        ids = ids[0][ids[0] >= 0]
+        true_distances = ((vectors[ids] - query) ** 2).sum(axis=1)
+        hits += int((true_distances <= distances[-1] * (1 + 1e-5) + 1e-6).sum())
+
+    return {
+        "recall": hits / (len(queries) * k),
+        "latency_ms": float(np.mean(latencies)),
+        "p95_latency_ms": float(np.percentile(latencies, 95)),
+        "size_mb": index_size_bytes(index) / 2**20,
+    }
+
+
+def compare_indexes(
+    vectors: np.ndarray,
+    factories: List[str],
+    exact_index: Optional[faiss.Index] = None,
+    prebuilt: Optional[Dict[str, Tuple[faiss.Index, float]]] = None,
+    k: int = config.RETRIEVAL_K,
+    n_queries: int = config.INDEX_REPORT_QUERIES,
+) -> List[Dict]:
+    """
+    Builds each candidate index and reports its recall@k, latency and size.
+
+    Args:
+        vectors (np.ndarray): The stored vectors.
+        factories (List[str]): The factory strings to compare.
+        exact_index (Optional[faiss.Index]): An exact index over `vectors`, built if None.
+        prebuilt (Optional[Dict[str, Tuple[faiss.Index, float]]]): Indexes that were
+            already built, with their build time in seconds, keyed by factory.
+        k (int): The number of neighbours compared for recall.
+        n_queries (int): The number of evaluation queries.
+
+    Returns:
+        List[Dict]: One report row per factory, exact search first.
+    """
+    if exact_index is None:
+        exact_index = faiss.IndexFlatL2(vectors.shape[1])
+        exact_index.add(vectors)
+    queries = make_queries(vectors, n_queries)
+    exact_distances, _ = exact_index.search(queries, k)
+
+    row = evaluate_index(exact_index, queries, exact_distances, vectors, k)
+    row.update(factory="Flat", build_s=0.0)
+    rows = [row]
+    for factory in factories:
+        if factory == "Flat":
+            continue
+        if prebuilt and factory in prebuilt:
+            index, build_seconds = prebuilt[factory]
+        else:
+            start = time.perf_counter()
+            index = build_index(vectors, factory)
+            build_seconds = time.perf_counter() - start
+        row = evaluate_index(index, queries, exact_distances, vectors, k)
+        row.update(factory=resolve_factory_string(factory, *vectors.shape), build_s=build_seconds)
+        rows.append(row)
+    return rows
+
+
+def print_index_report(rows: List[Dict], k: int = config.RETRIEVAL_K):
+    """
+    Prints the comparison of index types as a table.
+
+    Args:
+        rows (List[Dict]): The report rows from `compare_indexes`.
+        k (int): The k used for recall.
+    """
+    print(f"{'Index':<28}{f'Recall@{k}':>10}{'Mean ms':>10}{'p95 ms':>10}{'Size MB':>10}{'Build s':>10}")
+    for row in rows:
+        print(
+            f"{row['factory']:<28}{row['recall']:>10.3f}{row['latency_ms']:>10.3f}"
+            f"{row['p95_latency_ms']:>10.3f}{row['size_mb']:>10.2f}{row['build_s']:>10.2f}"
+        )
+
+
+def read_vectors(index: faiss.Index) -> np.ndarray:
+    """Returns all vectors stored in an exact flat index, in docstore order."""
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def serving_index_info(db_path: str = config.DB_FAISS_PATH) -> Optional[Dict]:
+    """Returns the description of the saved serving index, if there is one."""
+    path = os.path.join(db_path, SERVING_INDEX_INFO_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def serving_index_is_current(ntotal: int, db_path: str = config.DB_FAISS_PATH) -> bool:
+    """
+    Checks whether the saved serving index matches the configuration and the store.
+
+    Args:
+        ntotal (int): The number of vectors in the exact index.
+        db_path (str): The vector store directory.
+
+    Returns:
+        bool: True if no serving index needs to be (re)built.
+    """
+    info = serving_index_info(db_path)
+    if config.FAISS_INDEX_FACTORY == "Flat":
+        return info is None
+    return bool(info) and info["factory"] == config.FAISS_INDEX_FACTORY and info["ntotal"] == ntotal
+
+
+def build_and_save_serving_index(
+    exact_index: faiss.Index,
+    factory: str = config.FAISS_INDEX_FACTORY,
+    db_path: str = config.DB_FAISS_PATH,
+):
+    """
+    Builds the configured serving index from the exact index, reports it, and saves it.
+
+    With the "Flat" factory the exact index itself is used for queries, and any
+    previously saved serving index is removed.
+
+    Args:
+        exact_index (faiss.Index): The exact flat index of the vector store.
+        factory (str): The factory string of the serving index.
+        db_path (str): The vector store directory.
+    """
+    index_path = os.path.join(db_path, SERVING_INDEX_FILE)
+    info_path = os.path.join(db_path, SERVING_INDEX_INFO_FILE)
+    if factory == "Flat":
+        for path in (index_path, info_path):
+            if os.path.exists(path):
+                os.remove(path)
+        return
+
+    vectors = read_vectors(exact_index)
+    resolved = resolve_factory_string(factory, *vectors.shape)
+    print(f"Building {resolved} index over {len(vectors)} vectors...")
+    start = time.perf_counter()
+    index = build_index(vectors, factory)
+    prebuilt = {factory: (index, time.perf_counter() - start)}
+    print_index_report(compare_indexes(vectors, [factory], exact_index, prebuilt))
+
+    faiss.write_index(index, index_path)
+    with open(info_path, "w", encoding="utf-8") as f:
+        json.dump({"factory": factory, "resolved": resolved, "ntotal": int(index.ntotal)}, f)
+
+
+def read_index_file(path: str, mmap: bool = config.FAISS_MMAP) -> faiss.Index:
+    """
+    Reads a FAISS index, memory-mapping its vector storage when possible.
+
+    A memory-mapped index is paged in lazily and its pages are shared between all
+    processes that open the same file, instead of being copied into each of them.
+
+    Args:
+        path (str): The index file.
+        mmap (bool): Whether to memory-map the index.
+
+    Returns:
+        faiss.Index: The index; read-only when memory-mapped.
+    """
+    if mmap:
+        # IO_FLAG_MMAP_IFC maps flat, scalar-quantized and IVF storage; older FAISS
+        # versions only have IO_FLAG_MMAP, which maps IVF inverted lists.
+        flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+        try:
+            return faiss.read_index(path, flag | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            pass
+    return faiss.read_index(path)
+
+
+def read_serving_index(db_path: str = config.DB_FAISS_PATH, mmap: bool = config.FAISS_MMAP) -> faiss.Index:
+    """
+    Reads the index used to answer queries.
+
+    Args:
+        db_path (str): The vector store directory.
+        mmap (bool): Whether to memory-map the index.
+
+    Returns:
+        faiss.Index: The configured serving index, or the exact index if none was built.
+    """
+    index_path = os.path.join(db_path, SERVING_INDEX_FILE)
+    if config.FAISS_INDEX_FACTORY != "Flat" and os.path.exists(index_path):
+        return read_index_file(index_path, mmap)
+    return read_index_file(os.path.join(db_path, "index.faiss"), mmap)
@@ -0,0 +1,233 @@
+"""
+This module serves queries from one FAISS index per source document.
+
+The setup script keeps a single exact index as the ground truth for incremental
+builds. A single serving index built from it has to be rebuilt whenever any book
+changes, and a query searches it on one core. With `config.VECTOR_SHARDS`, the
+serving side is split into one shard per book instead:
+
+    db_faiss/shards/catalog.json          the shards, in vector position order
+    db_faiss/shards/<book>-<digest>.faiss one index of the configured type per book
+
+A shard file is named after its book and a digest of its chunk IDs and vectors, which
+change whenever the book's content, the chunking or the embedding model changes. A
+rebuild therefore only builds shards for added or changed books, keeps the others as
+they are, and deletes the shards of removed books.
+
+The chat applications load every shard into a `faiss.IndexShards`. It searches the
+shards in parallel threads and merges their results into the global top-k, with
+vector positions that match the docstore and the BM25 index.
+"""
+
+import hashlib
+import json
+import os
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+import config
+from vector_index import build_index, index_size_bytes, read_index_file, resolve_factory_string, set_search_parameters
+
+SHARD_DIR = "shards"
+SHARD_CATALOG_FILE = "catalog.json"
+
+CATALOG_VERSION = 1
+
+# (source, first vector position, end vector position) of a run of one book's chunks.
+RowRange = Tuple[str, int, int]
+
+
+def source_row_ranges(db) -> List[RowRange]:
+    """
+    Groups the vector positions of a store into runs of chunks from the same source.
+
+    The ingestion pipeline adds a book's chunks together and deletions keep the
+    order, so each book is normally one run.
+
+    Args:
+        db (FAISS): The exact vector store.
+
+    Returns:
+        List[RowRange]: The runs, in vector position order.
+    """
+    ranges: List[RowRange] = []
+    for row in range(len(db.index_to_docstore_id)):
+        source = db.docstore.search(db.index_to_docstore_id[row]).metadata.get("source", "")
+        if ranges and ranges[-1][0] == source:
+            ranges[-1] = (source, ranges[-1][1], row + 1)
+        else:
+            ranges.append((source, row, row + 1))
+    return ranges
+
+
+def shard_name(db, source: str, start: int, vectors: np.ndarray) -> str:
+    """
+    Names the shard of a run of chunks after its source and the chunks in it.
+
+    Args:
+        db (FAISS): The exact vector store.
+        source (str): The source of the chunks.
+        start (int): The first vector position of the run.
+        vectors (np.ndarray): The vectors of the run.
+
+    Returns:
+        str: A file name stem that changes whenever the run's chunks or vectors change.
+    """
+    digest = hashlib.sha256(np.ascontiguousarray(vectors).tobytes())
+    for row in range(start, start + len(vectors)):
+        digest.update(db.index_to_docstore_id[row].encode("utf-8"))
+    stem = re.sub(r"[^A-Za-z0-9]+", "_", os.path.splitext(os.path.basename(source))[0]).strip("_")
+    return f"{stem[:40] or 'shard'}-{digest.hexdigest()[:12]}"
+
+
+def load_catalog(db_path: str = config.DB_FAISS_PATH) -> Optional[Dict]:
+    """
+    Loads the shard catalog of a vector store.
+
+    Args:
+        db_path (str): The vector store directory.
+
+    Returns:
+        Optional[Dict]: The catalog, or None if there is no usable one.
+    """
+    path = os.path.join(db_path, SHARD_DIR, SHARD_CATALOG_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        catalog = json.load(f)
+    return catalog if catalog.get("version") == CATALOG_VERSION else None
+
+
+def shards_are_current(ntotal: int, db_path: str = config.DB_FAISS_PATH) -> bool:
+    """
+    Checks whether the saved shards match the configuration and the store.
+
+    Args:
+        ntotal (int): The number of vectors in the exact index.
+        db_path (str): The vector store directory.
+
+    Returns:
+        bool: True if no shard needs to be (re)built.
+    """
+    catalog = load_catalog(db_path)
+    return bool(catalog) and catalog["factory"] == config.FAISS_INDEX_FACTORY and catalog["ntotal"] == ntotal
+
+
+def build_shards(db, factory: str = config.FAISS_INDEX_FACTORY, db_path: str = config.DB_FAISS_PATH) -> Dict:
+    """
+    Brings the shards of a vector store up to date with its exact index.
+
+    Shards whose chunks and index type are unchanged are kept; the others are built
+    from the exact index, and shard files that are no longer listed are deleted.
+
+    Args:
+        db (FAISS): The exact vector store.
+        factory (str): The factory string of the shard indexes.
+        db_path (str): The vector store directory.
+
+    Returns:
+        Dict: The new catalog.
+    """
+    shard_dir = os.path.join(db_path, SHARD_DIR)
+    os.makedirs(shard_dir, exist_ok=True)
+    previous = {shard["name"]: shard for shard in (load_catalog(db_path) or {}).get("shards", [])}
+
+    shards, built = [], 0
+    for source, start, end in source_row_ranges(db):
+        vectors = db.index.reconstruct_n(start, end - start)
+        name = shard_name(db, source, start, vectors)
+        path = os.path.join(shard_dir, f"{name}.faiss")
+        shard = previous.get(name)
+        if shard is None or shard["factory"] != factory or not os.path.exists(path):
+            started = time.perf_counter()
+            index = build_index(vectors, factory)
+            faiss.write_index(index, path)
+            shard = {
+                "name": name,
+                "source": source,
+                "factory": factory,
+                "resolved": resolve_factory_string(factory, *vectors.shape),
+                "build_s": time.perf_counter() - started,
+                "built_at": time.time(),
+                "size_mb": index_size_bytes(index) / 2**20,
+            }
+            built += 1
+        shards.append({**shard, "start": start, "ntotal": end - start})
+
+    catalog = {
+        "version": CATALOG_VERSION,
+        "factory": factory,
+        "dim": int(db.index.d),
+        "ntotal": int(db.index.ntotal),
+        "shards": shards,
+    }
+    catalog_path = os.path.join(shard_dir, SHARD_CATALOG_FILE)
+    tmp_path = f"{catalog_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(catalog, f, indent=2)
+    os.replace(tmp_path, catalog_path)
+
+    listed = {f"{shard['name']}.faiss" for shard in shards}
+    retired = [name for name in os.listdir(shard_dir) if name.endswith(".faiss") and name not in listed]
+    for name in retired:
+        os.remove(os.path.join(shard_dir, name))
+    print(f"Vector shards: {len(shards)} shards, {built} built, {len(shards) - built} reused, {len(retired)} retired.")
+    return catalog
+
+
+def read_sharded_index(db_path: str = config.DB_FAISS_PATH, mmap: bool = config.FAISS_MMAP) -> Optional[faiss.Index]:
+    """
+    Reads every shard into one index that searches them in parallel.
+
+    Args:
+        db_path (str): The vector store directory.
+        mmap (bool): Whether to memory-map the shards.
+
+    Returns:
+        Optional[faiss.Index]: A `faiss.IndexShards` whose results are vector
+        positions in the whole store, or None if the store has no current shards.
+    """
+    catalog = load_catalog(db_path)
+    if catalog is None or catalog["factory"] != config.FAISS_INDEX_FACTORY:
+        return None
+    index = faiss.IndexShards(catalog["dim"], True, True)
+    position = 0
+    for shard in catalog["shards"]:
+        if shard["start"] != position:
+            return None
+        sub_index = read_index_file(os.path.join(db_path, SHARD_DIR, f"{shard['name']}.faiss"), mmap)
+        set_search_parameters(sub_index, config.FAISS_NPROBE, config.FAISS_EF_SEARCH)
+        index.add_shard(sub_index)
+        position += shard["ntotal"]
+    return index if position == catalog["ntotal"] else None
+
+
+def shard_report(db_path: str = config.DB_FAISS_PATH, queries: int = 50, k: int = config.RETRIEVAL_K) -> List[Dict]:
+    """
+    Describes each shard and measures its single-query search latency.
+
+    Args:
+        db_path (str): The vector store directory.
+        queries (int): Number of timed queries per shard, taken from its own vectors.
+        k (int): Number of results per query.
+
+    Returns:
+        List[Dict]: One row per shard with its catalog entry and mean latency in ms.
+    """
+    catalog = load_catalog(db_path) or {"shards": []}
+    exact_index = read_index_file(os.path.join(db_path, "index.faiss")) if catalog["shards"] else None
+    rows = []
+    for shard in catalog["shards"]:
+        index = read_index_file(os.path.join(db_path, SHARD_DIR, f"{shard['name']}.faiss"))
+        set_search_parameters(index, config.FAISS_NPROBE, config.FAISS_EF_SEARCH)
+        sample = exact_index.reconstruct_n(shard["start"], min(queries, shard["ntotal"]))
+        started = time.perf_counter()
+        for query in sample:
+            index.search(query.reshape(1, -1), k)
+        latency = (time.perf_counter() - started) * 1000 / max(len(sample), 1)
+        rows.append({**shard, "latency_ms": latency})
+    return rows